@@ -5,12 +5,15 @@ Multi-tenancy and RBAC support
 from typing import Optional, Generator
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
+from app.database import get_async_db
 from app.models import User, Institution
+from app.config import settings
 from app.core.auth import AuthUtils
 from app.core.security import SecurityUtils
+from app.core.principal_cache import principal_cache
 
 
 # OAuth2 scheme - points to our token endpoint
@@ -26,14 +29,14 @@ oauth2_scheme = OAuth2PasswordBearer(
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> User:
     """
     Get current authenticated user from JWT token
     
     This dependency:
     1. Extracts and validates the JWT token
-    2. Fetches user from database 
+    2. Fetches user from the principal cache, or the database on a miss
     3. Validates user is active
     4. Returns user object for use in endpoints
     """
@@ -51,15 +54,27 @@ async def get_current_user(
     if not user_id or not institution_id:
         raise credentials_exception
     
-    # Fetch user from database
-    user = db.query(User).filter(
-        User.id == user_id,
-        User.institution_id == institution_id,
-        User.deleted_at.is_(None)
-    ).first()
-    
-    if not user:
-        raise credentials_exception
+    issued_at = token_data.get("iat")
+    user = None
+    if settings.principal_cache_enabled:
+        user = await principal_cache.get(user_id, institution_id, issued_at)
+    
+    if user is None:
+        # Fetch user from database
+        result = await db.execute(
+            select(User).where(
+                User.id == user_id,
+                User.institution_id == institution_id,
+                User.deleted_at.is_(None)
+            )
+        )
+        user = result.scalars().first()
+        
+        if not user:
+            raise credentials_exception
+        
+        if settings.principal_cache_enabled:
+            await principal_cache.set(user, issued_at)
     
     # Check if user is active
     if user.status != "active":
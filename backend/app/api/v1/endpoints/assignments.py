@@ -3,12 +3,14 @@ API endpoints para Assignments/Tarefas
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
+from sqlalchemy import and_
 from typing import List, Optional
 from datetime import datetime
 
-from app.api.deps import get_db, get_current_user
+from app.database import get_db
+from app.api.deps import get_current_user
 from app.models import Assignment, AssignmentSubmission, User, Student, Class
+from app.services.assignment_stats import SubmissionCounts, SubmissionCountsService
 from app.schemas.assignment_schema import (
     AssignmentCreate,
     AssignmentUpdate,
@@ -27,6 +29,21 @@ from app.schemas.assignment_schema import (
 router = APIRouter()
 
 
+def _list_item(assignment: Assignment, counts: SubmissionCounts) -> AssignmentListResponse:
+    return AssignmentListResponse(
+        id=assignment.id,
+        title=assignment.title,
+        type=assignment.type,
+        status=assignment.status,
+        due_date=assignment.due_date,
+        max_score=assignment.max_score,
+        assigned_at=assignment.assigned_at,
+        is_overdue=assignment.is_overdue,
+        total_submissions=counts.total,
+        graded_submissions=counts.graded
+    )
+
+
 # ==================== ASSIGNMENT ENDPOINTS ====================
 
 @router.get("/", response_model=List[AssignmentListResponse])
@@ -61,32 +78,10 @@ def list_assignments(
     
     assignments = query.order_by(Assignment.due_date.desc()).offset(skip).limit(limit).all()
     
-    # Add submission counts
-    results = []
-    for assignment in assignments:
-        total_subs = db.query(AssignmentSubmission).filter(
-            AssignmentSubmission.assignment_id == assignment.id
-        ).count()
-        
-        graded_subs = db.query(AssignmentSubmission).filter(
-            AssignmentSubmission.assignment_id == assignment.id,
-            AssignmentSubmission.status == SubmissionStatusEnum.GRADED
-        ).count()
-        
-        results.append(AssignmentListResponse(
-            id=assignment.id,
-            title=assignment.title,
-            type=assignment.type,
-            status=assignment.status,
-            due_date=assignment.due_date,
-            max_score=assignment.max_score,
-            assigned_at=assignment.assigned_at,
-            is_overdue=assignment.is_overdue,
-            total_submissions=total_subs,
-            graded_submissions=graded_subs
-        ))
+    # Add submission counts (one grouped query for the whole page)
+    counts = SubmissionCountsService(db).get_counts([assignment.id for assignment in assignments])
     
-    return results
+    return [_list_item(assignment, counts[assignment.id]) for assignment in assignments]
 
 
 @router.get("/{assignment_id}", response_model=AssignmentResponse)
@@ -110,25 +105,13 @@ def get_assignment(
         )
     
     # Add submission counts
-    total_subs = db.query(AssignmentSubmission).filter(
-        AssignmentSubmission.assignment_id == assignment_id
-    ).count()
-    
-    pending_subs = db.query(AssignmentSubmission).filter(
-        AssignmentSubmission.assignment_id == assignment_id,
-        AssignmentSubmission.status == SubmissionStatusEnum.PENDING
-    ).count()
-    
-    graded_subs = db.query(AssignmentSubmission).filter(
-        AssignmentSubmission.assignment_id == assignment_id,
-        AssignmentSubmission.status == SubmissionStatusEnum.GRADED
-    ).count()
+    counts = SubmissionCountsService(db).get_count(assignment_id)
     
     response = AssignmentResponse(
         **assignment.__dict__,
-        total_submissions=total_subs,
-        pending_submissions=pending_subs,
-        graded_submissions=graded_subs
+        total_submissions=counts.total,
+        pending_submissions=counts.pending,
+        graded_submissions=counts.graded
     )
     
     return response
@@ -212,15 +195,13 @@ def update_assignment(
     db.refresh(assignment)
     
     # Get submission counts
-    total_subs = db.query(AssignmentSubmission).filter(
-        AssignmentSubmission.assignment_id == assignment_id
-    ).count()
+    counts = SubmissionCountsService(db).get_count(assignment_id)
     
     return AssignmentResponse(
         **assignment.__dict__,
-        total_submissions=total_subs,
-        pending_submissions=0,
-        graded_submissions=0
+        total_submissions=counts.total,
+        pending_submissions=counts.pending,
+        graded_submissions=counts.graded
     )
 
 
@@ -317,31 +298,9 @@ def list_class_assignments(
     
     assignments = query.order_by(Assignment.due_date.desc()).all()
     
-    results = []
-    for assignment in assignments:
-        total_subs = db.query(AssignmentSubmission).filter(
-            AssignmentSubmission.assignment_id == assignment.id
-        ).count()
-        
-        graded_subs = db.query(AssignmentSubmission).filter(
-            AssignmentSubmission.assignment_id == assignment.id,
-            AssignmentSubmission.status == SubmissionStatusEnum.GRADED
-        ).count()
-        
-        results.append(AssignmentListResponse(
-            id=assignment.id,
-            title=assignment.title,
-            type=assignment.type,
-            status=assignment.status,
-            due_date=assignment.due_date,
-            max_score=assignment.max_score,
-            assigned_at=assignment.assigned_at,
-            is_overdue=assignment.is_overdue,
-            total_submissions=total_subs,
-            graded_submissions=graded_subs
-        ))
+    counts = SubmissionCountsService(db).get_counts([assignment.id for assignment in assignments])
     
-    return results
+    return [_list_item(assignment, counts[assignment.id]) for assignment in assignments]
 
 
 # ==================== SUBMISSION ENDPOINTS ====================
@@ -404,7 +363,13 @@ def submit_assignment(
     # Determine status
     submission_status = SubmissionStatusEnum.LATE if is_late else SubmissionStatusEnum.SUBMITTED
     
+    counts_service = SubmissionCountsService(db)
+    
     if existing:
+        counts_service.record_change(
+            assignment_id, existing.status, existing.is_late, submission_status, is_late
+        )
+        
         # Update existing submission (resubmission)
         existing.content = submission_data.content
         existing.attachments = submission_data.attachments
@@ -430,6 +395,7 @@ def submit_assignment(
         )
         
         db.add(new_submission)
+        counts_service.record_change(assignment_id, None, False, submission_status, is_late)
         db.commit()
         db.refresh(new_submission)
         
@@ -524,6 +490,11 @@ def grade_submission(
             detail=f"A nota não pode ser maior que {assignment.max_score}"
         )
     
+    SubmissionCountsService(db).record_change(
+        submission.assignment_id, submission.status, submission.is_late,
+        SubmissionStatusEnum.GRADED, submission.is_late
+    )
+    
     # Update submission
     submission.score = grade_data.score
     submission.feedback = grade_data.feedback
@@ -583,56 +554,23 @@ def get_assignment_stats(
     class_obj = db.query(Class).filter(Class.id == assignment.class_id).first()
     total_students = class_obj.current_students if class_obj else 0
     
-    # Count submissions by status
-    total_subs = db.query(AssignmentSubmission).filter(
-        AssignmentSubmission.assignment_id == assignment_id
-    ).count()
-    
-    pending = db.query(AssignmentSubmission).filter(
-        AssignmentSubmission.assignment_id == assignment_id,
-        AssignmentSubmission.status == SubmissionStatusEnum.PENDING
-    ).count()
-    
-    submitted = db.query(AssignmentSubmission).filter(
-        AssignmentSubmission.assignment_id == assignment_id,
-        AssignmentSubmission.status.in_([SubmissionStatusEnum.SUBMITTED, SubmissionStatusEnum.LATE])
-    ).count()
-    
-    graded = db.query(AssignmentSubmission).filter(
-        AssignmentSubmission.assignment_id == assignment_id,
-        AssignmentSubmission.status == SubmissionStatusEnum.GRADED
-    ).count()
-    
-    late = db.query(AssignmentSubmission).filter(
-        AssignmentSubmission.assignment_id == assignment_id,
-        AssignmentSubmission.is_late == True
-    ).count()
-    
-    # Calculate score statistics
-    score_stats = db.query(
-        func.avg(AssignmentSubmission.score),
-        func.max(AssignmentSubmission.score),
-        func.min(AssignmentSubmission.score)
-    ).filter(
-        AssignmentSubmission.assignment_id == assignment_id,
-        AssignmentSubmission.score.isnot(None)
-    ).first()
-    
-    avg_score = float(score_stats[0]) if score_stats[0] else None
-    highest_score = float(score_stats[1]) if score_stats[1] else None
-    lowest_score = float(score_stats[2]) if score_stats[2] else None
+    # Count submissions by status and summarize scores
+    service = SubmissionCountsService(db)
+    counts = service.get_count(assignment_id)
+    scores = service.get_score_summary(assignment_id)
+    total_subs = counts.total
     
     submission_rate = (total_subs / total_students * 100) if total_students > 0 else 0
     
     return AssignmentStats(
         total_students=total_students,
         total_submissions=total_subs,
-        pending_count=pending,
-        submitted_count=submitted,
-        graded_count=graded,
-        late_count=late,
-        average_score=avg_score,
-        highest_score=highest_score,
-        lowest_score=lowest_score,
+        pending_count=counts.pending,
+        submitted_count=counts.submitted,
+        graded_count=counts.graded,
+        late_count=counts.late,
+        average_score=scores.average,
+        highest_score=scores.highest,
+        lowest_score=scores.lowest,
         submission_rate=round(submission_rate, 2)
     )
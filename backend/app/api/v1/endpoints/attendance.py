@@ -2,14 +2,22 @@
 Attendance API endpoints
 Student attendance tracking and management
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
+from fastapi import APIRouter, Depends, HTTPException, Request, status, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy import select, func, and_
 from typing import List, Optional
 from datetime import date, datetime, timedelta
 
-from app.api.deps import get_db, get_current_user
+from app.database import get_async_db
+from app.api.deps import get_current_user
 from app.models import Attendance, User, Student, Class
+from app.models.attendance import ATTENDANCE_CLASS_KEY, ATTENDANCE_PERIOD_KEY
+from app.services.attendance_stats import get_class_student_stats, refresh_daily_rollup
+from app.services.attendance_import import (
+    ImportResult, import_attendance_stream, iter_csv_records, iter_json_records,
+    parse_row, upsert_attendance
+)
 
 router = APIRouter()
 
@@ -23,24 +31,27 @@ async def create_attendance(
     period: Optional[str] = None,
     justified: bool = False,
     justification: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Registrar presença individual
     """
     # Verify student
-    student = db.query(Student).filter(Student.id == student_id).first()
+    student = await db.scalar(select(Student.id).where(Student.id == student_id))
     if not student:
         raise HTTPException(status_code=404, detail="Aluno não encontrado")
     
-    # Check if attendance already exists
-    existing = db.query(Attendance).filter(
-        Attendance.student_id == student_id,
-        Attendance.class_id == class_id,
-        Attendance.date == date,
-        Attendance.period == period
-    ).first()
+    # Check if attendance already exists (same key as the unique index:
+    # one record per student, date, class and period)
+    existing = (await db.execute(
+        select(Attendance).where(
+            Attendance.student_id == student_id,
+            Attendance.date == date,
+            ATTENDANCE_CLASS_KEY == class_id,
+            ATTENDANCE_PERIOD_KEY == (period or "")
+        )
+    )).scalars().first()
     
     if existing:
         # Update existing
@@ -48,8 +59,9 @@ async def create_attendance(
         existing.justified = justified
         existing.justification = justification
         existing.recorded_by = current_user.id
-        db.commit()
-        db.refresh(existing)
+        await refresh_daily_rollup(db, class_id, [date])
+        await db.commit()
+        await db.refresh(existing)
         return existing
     
     # Create new attendance
@@ -66,8 +78,9 @@ async def create_attendance(
     )
     
     db.add(attendance)
-    db.commit()
-    db.refresh(attendance)
+    await refresh_daily_rollup(db, class_id, [date])
+    await db.commit()
+    await db.refresh(attendance)
     
     return attendance
 
@@ -78,7 +91,7 @@ async def create_bulk_attendance(
     date: date,
     attendances: List[dict],
     period: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -91,72 +104,86 @@ async def create_bulk_attendance(
     ]
     """
     # Verify class
-    class_obj = db.query(Class).filter(Class.id == class_id).first()
+    class_obj = await db.get(Class, class_id)
     if not class_obj:
         raise HTTPException(status_code=404, detail="Turma não encontrada")
     
-    created = []
-    updated = []
-    errors = []
-    
-    for att_data in attendances:
+    # Parse rows, then validate and upsert the whole roll call at once
+    rows = []
+    result = ImportResult()
+    defaults = {"class_id": class_id, "date": date, "period": period}
+    for index, att_data in enumerate(attendances, start=1):
         try:
-            student_id = att_data["student_id"]
-            
-            # Check if student is in class
-            student = db.query(Student).filter(Student.id == student_id).first()
-            if not student or student not in class_obj.students:
-                errors.append(f"Aluno {student_id} não encontrado na turma")
-                continue
-            
-            # Check if attendance already exists
-            existing = db.query(Attendance).filter(
-                Attendance.student_id == student_id,
-                Attendance.class_id == class_id,
-                Attendance.date == date,
-                Attendance.period == period
-            ).first()
-            
-            if existing:
-                # Update
-                existing.present = att_data["present"]
-                existing.justified = att_data.get("justified", False)
-                existing.justification = att_data.get("justification")
-                existing.recorded_by = current_user.id
-                updated.append(existing)
-            else:
-                # Create
-                attendance = Attendance(
-                    institution_id=current_user.institution_id,
-                    student_id=student_id,
-                    class_id=class_id,
-                    date=date,
-                    period=period,
-                    present=att_data["present"],
-                    justified=att_data.get("justified", False),
-                    justification=att_data.get("justification"),
-                    recorded_by=current_user.id
-                )
-                db.add(attendance)
-                created.append(attendance)
-        
-        except Exception as e:
-            errors.append(f"Erro ao processar aluno {att_data.get('student_id')}: {str(e)}")
+            rows.append(parse_row(index, {**att_data, "class_id": class_id}, defaults))
+        except (ValueError, TypeError) as e:
+            result.error(index, att_data.get("student_id"), str(e))
     
-    if created or updated:
-        db.commit()
-        for att in created:
-            db.refresh(att)
-        for att in updated:
-            db.refresh(att)
+    result.merge(await upsert_attendance(db, rows, current_user.institution_id, current_user.id))
+    if result.created or result.updated:
+        await db.commit()
+    result.rows.sort(key=lambda entry: entry["row"])
     
+    errors = result.errors
     return {
         "success": True,
-        "created": len(created),
-        "updated": len(updated),
+        "created": result.created,
+        "updated": result.updated,
+        "errors": len(errors),
+        "error_messages": [f"Aluno {error['student_id']}: {error['error']}" for error in errors],
+        "total_processed": result.created + result.updated,
+        "results": result.rows
+    }
+
+
+@router.post("/import")
+async def import_attendance(
+    request: Request,
+    class_id: Optional[int] = None,
+    date: Optional[date] = None,
+    period: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Importar presenças em massa (CSV ou JSON)
+    
+    Aceita text/csv (com cabeçalho), application/x-ndjson (um objeto por
+    linha) ou application/json (lista de objetos). Colunas: student_id,
+    present, date, class_id, period, justified, justification; class_id,
+    date e period da query string valem como padrão para todas as linhas.
+    
+    O corpo é processado em lotes à medida que chega; cada lote é validado
+    e gravado com um único upsert. Linhas inválidas aparecem em "results"
+    com status "error" e não interrompem a importação (exceto numa lista
+    JSON, que termina no primeiro elemento malformado). Só a lista no nível
+    raiz é lida em streaming; {"attendances": [...]} é lido de uma vez.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in ("text/csv", "application/csv"):
+        records = iter_csv_records(request.stream())
+    elif content_type in ("application/x-ndjson", "application/jsonl"):
+        records = iter_json_records(request.stream(), ndjson=True)
+    elif content_type == "application/json":
+        records = iter_json_records(request.stream(), ndjson=False)
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Use text/csv, application/x-ndjson ou application/json"
+        )
+    
+    defaults = {"class_id": class_id, "date": date, "period": period}
+    result = await import_attendance_stream(
+        db, records, current_user.institution_id, current_user.id, defaults
+    )
+    
+    errors = result.errors
+    return {
+        "success": not errors,
+        "created": result.created,
+        "updated": result.updated,
         "errors": len(errors),
-        "error_messages": errors,
-        "total_processed": len(created) + len(updated)
+        "total_processed": result.created + result.updated,
+        "results": result.rows
     }
 
 
@@ -165,25 +192,29 @@ async def get_class_attendance_by_date(
     class_id: int,
     attendance_date: date,
     period: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Buscar presença de uma turma em uma data específica
     """
-    class_obj = db.query(Class).filter(Class.id == class_id).first()
+    class_obj = (await db.execute(
+        select(Class).options(
+            selectinload(Class.students).joinedload(Student.user)
+        ).where(Class.id == class_id)
+    )).scalars().first()
     if not class_obj:
         raise HTTPException(status_code=404, detail="Turma não encontrada")
     
-    query = db.query(Attendance).filter(
+    query = select(Attendance).where(
         Attendance.class_id == class_id,
         Attendance.date == attendance_date
     )
     
     if period:
-        query = query.filter(Attendance.period == period)
+        query = query.where(Attendance.period == period)
     
-    attendances = query.all()
+    attendances = (await db.execute(query)).scalars().all()
     
     # Get all students in class
     all_students = class_obj.students
@@ -238,28 +269,30 @@ async def get_student_attendance_report(
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
     class_id: Optional[int] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Relatório de presença de um aluno
     """
-    student = db.query(Student).filter(Student.id == student_id).first()
+    student = (await db.execute(
+        select(Student).options(joinedload(Student.user)).where(Student.id == student_id)
+    )).scalars().first()
     if not student:
         raise HTTPException(status_code=404, detail="Aluno não encontrado")
     
-    query = db.query(Attendance).filter(Attendance.student_id == student_id)
+    query = select(Attendance).where(Attendance.student_id == student_id)
     
     if class_id:
-        query = query.filter(Attendance.class_id == class_id)
+        query = query.where(Attendance.class_id == class_id)
     
     if start_date:
-        query = query.filter(Attendance.date >= start_date)
+        query = query.where(Attendance.date >= start_date)
     
     if end_date:
-        query = query.filter(Attendance.date <= end_date)
+        query = query.where(Attendance.date <= end_date)
     
-    attendances = query.all()
+    attendances = (await db.execute(query)).scalars().all()
     
     if not attendances:
         return {"message": "Nenhuma presença registrada para este aluno"}
@@ -315,59 +348,41 @@ async def get_class_attendance_statistics(
     class_id: int,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Estatísticas de presença de uma turma
     """
-    class_obj = db.query(Class).filter(Class.id == class_id).first()
+    class_obj = await db.get(Class, class_id)
     if not class_obj:
         raise HTTPException(status_code=404, detail="Turma não encontrada")
     
-    query = db.query(Attendance).filter(Attendance.class_id == class_id)
-    
-    if start_date:
-        query = query.filter(Attendance.date >= start_date)
-    if end_date:
-        query = query.filter(Attendance.date <= end_date)
-    
-    attendances = query.all()
+    # Per-student totals in one GROUP BY (daily rollup when enabled)
+    by_student = await get_class_student_stats(db, class_id, start_date, end_date)
     
-    if not attendances:
+    if not by_student:
         return {"message": "Nenhuma presença registrada"}
     
-    total = len(attendances)
-    present = sum(1 for att in attendances if att.present)
-    absent = total - present
-    
-    # Attendance by student
-    by_student = {}
-    for att in attendances:
-        if att.student_id not in by_student:
-            by_student[att.student_id] = {"present": 0, "absent": 0, "total": 0}
-        
-        by_student[att.student_id]["total"] += 1
-        if att.present:
-            by_student[att.student_id]["present"] += 1
-        else:
-            by_student[att.student_id]["absent"] += 1
+    total = sum(stats.total for stats in by_student)
+    present = sum(stats.present for stats in by_student)
+    absent = sum(stats.absent for stats in by_student)
+    justified = sum(stats.justified for stats in by_student)
     
     # Students with low attendance
-    low_attendance = []
-    for student_id, stats in by_student.items():
-        rate = (stats["present"] / stats["total"] * 100) if stats["total"] > 0 else 0
-        if rate < 75:
-            student = db.query(Student).filter(Student.id == student_id).first()
-            if student:
-                low_attendance.append({
-                    "student_id": student_id,
-                    "student_name": f"{student.user.first_name} {student.user.last_name}",
-                    "attendance_rate": round(rate, 2),
-                    "total": stats["total"],
-                    "present": stats["present"],
-                    "absent": stats["absent"]
-                })
+    low_attendance = [
+        {
+            "student_id": stats.student_id,
+            "student_name": stats.student_name,
+            "attendance_rate": round(stats.attendance_rate, 2),
+            "total": stats.total,
+            "present": stats.present,
+            "absent": stats.absent,
+            "justified": stats.justified
+        }
+        for stats in by_student
+        if stats.attendance_rate < 75
+    ]
     
     return {
         "class_id": class_id,
@@ -380,6 +395,7 @@ async def get_class_attendance_statistics(
             "total_records": total,
             "present": present,
             "absent": absent,
+            "justified": justified,
             "attendance_rate": round((present / total * 100), 2) if total > 0 else 0
         },
         "students_tracked": len(by_student),
@@ -391,18 +407,19 @@ async def get_class_attendance_statistics(
 @router.delete("/{attendance_id}")
 async def delete_attendance(
     attendance_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Deletar registro de presença
     """
-    attendance = db.query(Attendance).filter(Attendance.id == attendance_id).first()
+    attendance = await db.get(Attendance, attendance_id)
     
     if not attendance:
         raise HTTPException(status_code=404, detail="Registro de presença não encontrado")
     
-    db.delete(attendance)
-    db.commit()
+    await db.delete(attendance)
+    await refresh_daily_rollup(db, attendance.class_id, [attendance.date])
+    await db.commit()
     
     return {"message": "Registro deletado com sucesso"}
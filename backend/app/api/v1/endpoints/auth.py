@@ -5,10 +5,12 @@ Login, logout, refresh token, etc.
 from datetime import timedelta
 from typing import Any
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
+from app.database import get_async_db
 from app.models import User
 from app.schemas import LoginResponse, UserResponse
 from app.core.auth import AuthUtils
@@ -21,7 +23,7 @@ router = APIRouter()
 @router.post("/login")
 async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> Any:
     """
     Login endpoint - OAuth2 compatible
@@ -30,10 +32,13 @@ async def login(
     Returns JWT access token for API access
     """
     # Try to find user by email (most common) or username
-    user = db.query(User).filter(
-        User.email == form_data.username,
-        User.deleted_at.is_(None)
-    ).first()
+    result = await db.execute(
+        select(User).where(
+            User.email == form_data.username,
+            User.deleted_at.is_(None)
+        )
+    )
+    user = result.scalars().first()
     
     if not user:
         # If not found by email, try by username (if implemented)
@@ -44,8 +49,8 @@ async def login(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Verify password
-    if not AuthUtils.verify_password(form_data.password, user.password_hash):
+    # Verify password (bcrypt is CPU-bound, keep it off the event loop)
+    if not await run_in_threadpool(AuthUtils.verify_password, form_data.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -76,7 +81,7 @@ async def login(
     # Update last login timestamp
     from datetime import datetime
     user.last_login = datetime.utcnow()
-    db.commit()
+    await db.commit()
     
     return {
         "access_token": access_token,
@@ -88,7 +93,7 @@ async def login(
 
 @router.post("/logout")
 async def logout(
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> Any:
     """
     Logout endpoint
@@ -102,7 +107,7 @@ async def logout(
 
 @router.get("/me", response_model=UserResponse)
 async def get_current_user_info(
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> Any:
     """
     Get current authenticated user information
@@ -7,7 +7,8 @@ from sqlalchemy import func
 from typing import List, Optional
 from datetime import datetime, date
 
-from app.api.deps import get_db, get_current_user
+from app.database import get_db, get_read_db
+from app.api.deps import get_current_user
 from app.models import Class, User, Student, Institution
 from app.schemas.class_schema import (
     ClassCreate,
@@ -427,7 +428,7 @@ def list_teacher_classes(
 @router.get("/{class_id}/stats", response_model=ClassStats)
 def get_class_stats(
     class_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
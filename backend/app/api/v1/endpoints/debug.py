@@ -0,0 +1,64 @@
+"""
+Debug endpoints
+Runtime counters for caches and infrastructure (admin only)
+"""
+from typing import Any
+from fastapi import APIRouter
+
+from app.database import (
+    engine, async_engine, replica_engine, async_replica_engine, get_pool_status
+)
+from app.models import User
+from app.api.deps import CurrentUser
+from app.core.principal_cache import principal_cache
+from app.api.v1.ws.chat import manager as chat_manager
+from app.api.v1.ws.persistence import chat_persistence
+
+
+router = APIRouter()
+
+
+@router.get("/principal-cache")
+async def get_principal_cache_stats(
+    current_user: User = CurrentUser.admin()
+) -> Any:
+    """
+    Principal cache hit/miss counters
+    
+    Each hit is one User query saved in get_current_user
+    """
+    return principal_cache.stats()
+
+
+@router.get("/pool")
+async def get_pool_stats(
+    current_user: User = CurrentUser.admin()
+) -> Any:
+    """
+    Connection pool metrics per engine
+    
+    checked_out/overflow show occupancy, metrics.wait_time_* how long
+    requests waited for a free connection
+    """
+    pools = {
+        "sync": get_pool_status(engine),
+        "async": get_pool_status(async_engine.sync_engine),
+    }
+    if replica_engine is not None:
+        pools["replica_sync"] = get_pool_status(replica_engine)
+        pools["replica_async"] = get_pool_status(async_replica_engine.sync_engine)
+    return pools
+
+
+@router.get("/chat")
+async def get_chat_stats(
+    current_user: User = CurrentUser.admin()
+) -> Any:
+    """
+    Chat WebSocket counters of the worker serving the request
+    
+    connections are the sockets held by this worker only, backplane
+    shows messages published to and received from the other workers,
+    persistence the write-behind batches
+    """
+    return {**chat_manager.stats(), "persistence": chat_persistence.stats()}
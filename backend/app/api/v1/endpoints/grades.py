@@ -4,19 +4,59 @@ Academic grade management
 """
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
-from app.database import get_db
+from app.database import get_db, get_read_db, ReadSessionLocal
 from app.api.deps import get_current_user
 from app.models import User, Student, Grade
 from app.schemas.grade import GradeCreate, GradeUpdate, GradeResponse
-from app.schemas.pagination import PaginatedResponse
+from app.schemas.common import PaginatedResponse
 from app.core.security import get_user_permissions
+from app.services.grade_aggregation import compute_report_cards, load_grading_rules
+from app.services.grade_sheet import GradeSheetFilters, build_grade_sheet, stream_grade_sheet_csv
 
 
 router = APIRouter()
 
 
+def _forbidden() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail="Not enough permissions"
+    )
+
+
+def _check_student_access(current_user: User, student: Student) -> None:
+    """
+    Staff (grades read) may read students of their institution (admin any),
+    a student only their own grades
+    """
+    if current_user.role != "admin" and student.institution_id != current_user.institution_id:
+        raise _forbidden()
+    if get_user_permissions(current_user.role, "grades", "read"):
+        return
+    if current_user.role == "aluno" and student.user_id == current_user.id:
+        return
+    raise _forbidden()
+
+
+def _get_class(db: Session, class_id: int, current_user: User, action: str):
+    """Class of the user's institution (any for admin) after the grades permission check"""
+    from app.models import Class
+    
+    if not get_user_permissions(current_user.role, "grades", action):
+        raise _forbidden()
+    
+    class_obj = db.query(Class).filter(Class.id == class_id).first()
+    if not class_obj:
+        raise HTTPException(status_code=404, detail="Turma não encontrada")
+    
+    if current_user.role != "admin" and class_obj.institution_id != current_user.institution_id:
+        raise _forbidden()
+    return class_obj
+
+
 @router.get("/", response_model=PaginatedResponse[GradeResponse])
 async def get_grades(
     skip: int = Query(0, ge=0),
@@ -28,17 +68,16 @@ async def get_grades(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get paginated list of grades with optional filtering"""
-    
-    # Check permissions
-    if not get_user_permissions(current_user.role, "grades", "read"):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not enough permissions"
-        )
+    """Get paginated list of grades with optional filtering (students: their own)"""
     
     query = db.query(Grade).join(Student).join(User)
     
+    # Check permissions (students only see their own grades)
+    if not get_user_permissions(current_user.role, "grades", "read"):
+        if current_user.role != "aluno":
+            raise _forbidden()
+        query = query.filter(Student.user_id == current_user.id)
+    
     # Apply institution filter for non-admin users
     if current_user.role != "admin":
         query = query.filter(User.institution_id == current_user.institution_id)
@@ -59,30 +98,70 @@ async def get_grades(
     total = query.count()
     grades = query.offset(skip).limit(limit).all()
     
-    return PaginatedResponse(
+    return PaginatedResponse.create(
         items=grades,
-        total=total,
         page=skip // limit + 1,
-        per_page=limit,
-        pages=(total + limit - 1) // limit
+        page_size=limit,
+        total=total
     )
 
 
-@router.get("/{grade_id}", response_model=GradeResponse)
-async def get_grade(
-    grade_id: str,
-    db: Session = Depends(get_db),
+@router.get("/report-cards")
+async def get_report_cards(
+    academic_year: int = Query(..., description="Ano letivo"),
+    class_id: int = Query(None, description="Turma (padrão: toda a instituição)"),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get grade by ID"""
+    """
+    Boletins de uma turma ou de toda a instituição
     
-    # Check permissions
-    if not get_user_permissions(current_user.role, "grades", "read"):
+    Calculados em lote numa única consulta, ordenados pela classificação
+    (na turma, ou na instituição quando nenhuma turma é informada).
+    """
+    if not get_user_permissions(current_user.role, "grades", "report"):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not enough permissions"
         )
     
+    if class_id is not None:
+        from app.models import Class
+        class_obj = db.query(Class).filter(
+            Class.id == class_id,
+            Class.institution_id == current_user.institution_id
+        ).first()
+        if not class_obj:
+            raise HTTPException(status_code=404, detail="Turma não encontrada")
+    
+    rules = load_grading_rules(db, current_user.institution_id)
+    cards = compute_report_cards(
+        db, rules, academic_year,
+        institution_id=current_user.institution_id,
+        class_id=class_id
+    )
+    approved = sum(1 for card in cards if card.status == "Aprovado")
+    
+    return {
+        "academic_year": academic_year,
+        "class_id": class_id,
+        "passing_grade": rules.passing_grade,
+        "decimal_places": rules.decimal_places,
+        "total_students": len(cards),
+        "approved": approved,
+        "failed": len(cards) - approved,
+        "report_cards": [card.as_dict() for card in cards]
+    }
+
+
+@router.get("/{grade_id}", response_model=GradeResponse)
+async def get_grade(
+    grade_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get grade by ID"""
+    
     grade = db.query(Grade).join(Student).join(User).filter(
         Grade.id == grade_id,
         User.deleted_at.is_(None)
@@ -94,12 +173,8 @@ async def get_grade(
             detail="Grade not found"
         )
     
-    # Check if user can access this grade (same institution for non-admin)
-    if current_user.role != "admin" and grade.student.user.institution_id != current_user.institution_id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not enough permissions"
-        )
+    # Same institution for non-admin, students only their own grades
+    _check_student_access(current_user, grade.student)
     
     return grade
 
@@ -265,13 +340,6 @@ async def get_student_grade_summary(
 ):
     """Get grade summary for a student"""
     
-    # Check permissions
-    if not get_user_permissions(current_user.role, "grades", "read"):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not enough permissions"
-        )
-    
     # Verify student exists and user has access
     student = db.query(Student).join(User).filter(
         Student.id == student_id,
@@ -285,11 +353,7 @@ async def get_student_grade_summary(
         )
     
     # Check if user can access this student
-    if current_user.role != "admin" and student.user.institution_id != current_user.institution_id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not enough permissions"
-        )
+    _check_student_access(current_user, student)
     
     # Get grades
     query = db.query(Grade).filter(Grade.student_id == student_id)
@@ -297,7 +361,7 @@ async def get_student_grade_summary(
     if academic_year:
         query = query.filter(Grade.academic_year == academic_year)
     
-    grades = query.all()
+    grades = query.order_by(Grade.subject, Grade.semester, Grade.created_at).all()
     
     # Calculate summary
     if not grades:
@@ -306,26 +370,17 @@ async def get_student_grade_summary(
     # Group by subject and semester
     subjects = {}
     for grade in grades:
-        if grade.subject not in subjects:
-            subjects[grade.subject] = {}
-        
-        semester_key = f"semester_{grade.semester}"
-        if semester_key not in subjects[grade.subject]:
-            subjects[grade.subject][semester_key] = []
-        
-        subjects[grade.subject][semester_key].append({
+        subjects.setdefault(grade.subject, {}).setdefault(f"semester_{grade.semester}", []).append({
             "grade_value": float(grade.grade),
             "created_at": str(grade.created_at)
         })
     
-    # Calculate averages
-    for subject in subjects:
-        for semester in subjects[subject]:
-            if isinstance(subjects[subject][semester], list):
-                grades_list = subjects[subject][semester]
-                if grades_list:
-                    avg = sum(g["grade_value"] for g in grades_list) / len(grades_list)
-                    subjects[subject][f"{semester}_average"] = round(avg, 2)
+    # Averages from the aggregation engine (institution rounding rules)
+    rules = load_grading_rules(db, student.institution_id)
+    for card in compute_report_cards(db, rules, academic_year, student_ids=[student_id]):
+        for subject, result in card.subjects.items():
+            for semester, average in result.term_averages.items():
+                subjects[subject][f"semester_{semester}_average"] = average
     
     return {
         "student_id": student_id,
@@ -340,63 +395,65 @@ async def get_student_grade_summary(
 async def get_student_report_card(
     student_id: str,
     academic_year: int = Query(..., description="Ano letivo"),
-    db: Session = Depends(get_db),
+    class_id: int = Query(None, description="Turma usada na classificação (padrão: turma do aluno)"),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Gera boletim completo do aluno
+    
+    Médias por período, média final ponderada, situação e classificação na
+    turma seguem os parâmetros acadêmicos da instituição.
     """
-    from sqlalchemy import func
+    from datetime import datetime
+    from app.models.class_model import class_students
     
     # Verify student
     student = db.query(Student).filter(Student.id == student_id).first()
     if not student:
         raise HTTPException(status_code=404, detail="Aluno não encontrado")
     
-    # Get all grades for the year
+    # Same checks as the grade summary (institution, students only their own)
+    _check_student_access(current_user, student)
+    
+    enrolled = db.query(class_students.c.class_id).filter(class_students.c.student_id == student_id)
+    if class_id is None:
+        class_id = enrolled.order_by(class_students.c.class_id).limit(1).scalar()
+    elif not enrolled.filter(class_students.c.class_id == class_id).first():
+        # Ranked only among a class the student belongs to
+        raise HTTPException(status_code=404, detail="Aluno não pertence à turma")
+    
+    # Rank among the class when the student has one, otherwise alone
+    rules = load_grading_rules(db, student.institution_id)
+    cards = compute_report_cards(
+        db, rules, academic_year,
+        class_id=class_id,
+        student_ids=None if class_id is not None else [student_id]
+    )
+    card = next((c for c in cards if c.student_id == student_id), None)
+    
+    # Individual grades of the year
     grades = db.query(Grade).filter(
         Grade.student_id == student_id,
         Grade.academic_year == academic_year
-    ).all()
+    ).order_by(Grade.subject, Grade.semester, Grade.created_at).all()
     
-    # Group by subject
     report = {}
     for grade in grades:
-        if grade.subject not in report:
-            report[grade.subject] = {
-                "grades": [],
-                "semester_1": [],
-                "semester_2": [],
-                "final_average": 0
-            }
-        
-        grade_data = {
+        entry = report.setdefault(grade.subject, {"grades": []})
+        entry["grades"].append({
             "value": float(grade.grade),
             "semester": grade.semester,
             "date": str(grade.created_at)
-        }
-        report[grade.subject]["grades"].append(grade_data)
-        
-        if grade.semester == 1:
-            report[grade.subject]["semester_1"].append(float(grade.grade))
-        elif grade.semester == 2:
-            report[grade.subject]["semester_2"].append(float(grade.grade))
-    
-    # Calculate averages
-    for subject in report:
-        s1 = report[subject]["semester_1"]
-        s2 = report[subject]["semester_2"]
-        
-        report[subject]["semester_1_avg"] = round(sum(s1) / len(s1), 2) if s1 else 0
-        report[subject]["semester_2_avg"] = round(sum(s2) / len(s2), 2) if s2 else 0
-        
-        all_grades = s1 + s2
-        report[subject]["final_average"] = round(sum(all_grades) / len(all_grades), 2) if all_grades else 0
-        report[subject]["status"] = "Aprovado" if report[subject]["final_average"] >= 6.0 else "Reprovado"
-    
-    # Calculate general average
-    final_averages = [report[s]["final_average"] for s in report]
-    general_average = round(sum(final_averages) / len(final_averages), 2) if final_averages else 0
+        })
+        entry.setdefault(f"semester_{grade.semester}", []).append(float(grade.grade))
+    
+    for subject, result in (card.subjects.items() if card else []):
+        entry = report[subject]
+        for semester, average in result.term_averages.items():
+            entry[f"semester_{semester}_avg"] = average
+        entry["final_average"] = result.final_average
+        entry["status"] = result.status
     
     return {
         "student": {
@@ -407,9 +464,12 @@ async def get_student_report_card(
         },
         "academic_year": academic_year,
         "subjects": report,
-        "general_average": general_average,
+        "general_average": card.general_average if card else 0,
+        "status": card.status if card else None,
+        "rank": card.rank if card and class_id is not None else None,
+        "class_size": len(cards) if class_id is not None else None,
         "total_subjects": len(report),
-        "generated_at": str(func.now())
+        "generated_at": datetime.utcnow().isoformat()
     }
 
 
@@ -418,58 +478,36 @@ async def get_class_grades(
     class_id: int,
     subject: str = Query(None),
     semester: int = Query(None),
-    db: Session = Depends(get_db),
+    academic_year: int = Query(None),
+    format: str = Query("json", pattern="^(json|csv)$", description="json ou csv (streaming)"),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Lista todas as notas de uma turma
+    
+    Matriz aluno x disciplina x semestre com médias por aluno e por
+    disciplina, montada em uma única consulta. Com format=csv a planilha
+    é enviada em streaming (uma linha por aluno).
     """
-    from app.models import Class
+    class_obj = _get_class(db, class_id, current_user, "read")
     
-    # Verify class exists
-    class_obj = db.query(Class).filter(Class.id == class_id).first()
-    if not class_obj:
-        raise HTTPException(status_code=404, detail="Turma não encontrada")
+    filters = GradeSheetFilters(subject=subject, semester=semester, academic_year=academic_year)
     
-    # Get all students in class
-    students = class_obj.students
-    
-    result = []
-    for student in students:
-        query = db.query(Grade).filter(Grade.student_id == student.id)
-        
-        if subject:
-            query = query.filter(Grade.subject == subject)
-        if semester:
-            query = query.filter(Grade.semester == semester)
-        
-        grades = query.all()
-        
-        if grades:
-            avg = sum(float(g.grade) for g in grades) / len(grades)
-        else:
-            avg = 0
-        
-        result.append({
-            "student_id": student.id,
-            "student_name": f"{student.user.first_name} {student.user.last_name}",
-            "enrollment": student.enrollment_number,
-            "grades": [{
-                "id": g.id,
-                "subject": g.subject,
-                "grade": float(g.grade),
-                "semester": g.semester,
-                "academic_year": g.academic_year
-            } for g in grades],
-            "average": round(avg, 2),
-            "total_grades": len(grades)
-        })
+    if format == "csv":
+        # The request session is closed before the body is sent, the
+        # stream reads with (and closes) its own session
+        return StreamingResponse(
+            stream_grade_sheet_csv(ReadSessionLocal(), class_id, filters),
+            media_type="text/csv",
+            headers={"Content-Disposition": f'attachment; filename="notas_turma_{class_id}.csv"'}
+        )
     
+    sheet = build_grade_sheet(db, class_id, filters)
     return {
         "class_id": class_id,
         "class_name": class_obj.name,
-        "students": result,
-        "total_students": len(result)
+        **sheet
     }
 
 
@@ -489,13 +527,10 @@ async def create_bulk_grades(
         {"student_id": "456", "subject": "Matemática", "grade": 7.0, "semester": 1}
     ]
     """
-    from app.models import Class
     from datetime import datetime
     
-    # Verify class
-    class_obj = db.query(Class).filter(Class.id == class_id).first()
-    if not class_obj:
-        raise HTTPException(status_code=404, detail="Turma não encontrada")
+    # Verify class (teachers and above, of the user's institution)
+    class_obj = _get_class(db, class_id, current_user, "create")
     
     created_grades = []
     errors = []
@@ -552,12 +587,7 @@ async def get_class_statistics(
     """
     Estatísticas de notas de uma turma
     """
-    from app.models import Class
-    from sqlalchemy import func
-    
-    class_obj = db.query(Class).filter(Class.id == class_id).first()
-    if not class_obj:
-        raise HTTPException(status_code=404, detail="Turma não encontrada")
+    class_obj = _get_class(db, class_id, current_user, "read")
     
     query = db.query(Grade).filter(Grade.class_id == class_id)
     
@@ -9,7 +9,7 @@ from datetime import datetime
 import uuid
 import time
 
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.api.deps import get_current_user
 from app.models.integrations import Integration, IntegrationLog, Webhook
 from app.schemas.integrations import (
@@ -494,7 +494,7 @@ def toggle_webhook(
 @router.get("/statistics", response_model=IntegrationStatistics)
 def get_integration_statistics(
     institution_id: str = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: dict = Depends(get_current_user)
 ):
     """Obter estatísticas de integrações"""
@@ -3,11 +3,12 @@ Messages endpoints - REST API for messaging system with real-time support
 """
 from typing import List, Optional
 from datetime import datetime
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import and_, or_, func
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from sqlalchemy import select, and_, or_, func
+from fastapi import APIRouter, Depends, HTTPException, Query, status, BackgroundTasks
 
-from app.models.message import Message
+from app.models.message import Conversation, Message
 from app.models.user import User
 from app.schemas.message import (
     MessageCreate,
@@ -15,17 +16,33 @@ from app.schemas.message import (
     MessageResponse,
     MessageFilters,
     ConversationResponse,
+    ConversationSummary,
+    MessageSearchHit,
     MessageStats,
     MessageBulkAction,
     MessageBulkResponse,
 )
-from app.schemas.common import PaginationParams, PaginatedResponse, ApiResponse
-from app.api.deps import get_current_user, get_db, require_permissions
+from app.schemas.common import PaginationInfo, PaginationParams, PaginatedResponse, ApiResponse
+from app.database import get_async_db
+from app.api.deps import get_current_user, require_permissions
+from app.core.pagination import paginate_select
+from app.services.conversations import adjust_unread, record_messages, refresh_conversations
+from app.services.message_counters import get_counts
+from app.services.message_search import count_matches, search_backend, search_condition, search_messages
+from app.api.v1.ws.chat import manager as chat_manager
 
 
 router = APIRouter()
 
 
+async def push_message_counts(db: AsyncSession, user_ids) -> None:
+    """Push the committed message counters of the users to their chat sockets"""
+    try:
+        await chat_manager.push_message_counts(await get_counts(db, user_ids, backfill=False))
+    except Exception as e:
+        print(f"Message counters push failed: {e}")
+
+
 # Background task for sending message notifications
 async def send_message_notification(
     message_id: str,
@@ -63,7 +80,7 @@ async def send_message_notification(
 async def send_message(
     message_data: MessageCreate,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(require_permissions(["admin", "professor", "coordenador", "orientador", "secretario", "responsavel"]))
 ):
     """
@@ -79,12 +96,14 @@ async def send_message(
     **Required Permissions:** All authenticated users
     """
     # Verify recipient exists and belongs to same institution
-    recipient = db.query(User).filter(
-        and_(
-            User.id == message_data.recipient_id,
-            User.institution_id == current_user.institution_id
+    recipient = (await db.execute(
+        select(User).where(
+            and_(
+                User.id == message_data.recipient_id,
+                User.institution_id == current_user.institution_id
+            )
         )
-    ).first()
+    )).scalars().first()
     
     if not recipient:
         raise HTTPException(
@@ -94,12 +113,14 @@ async def send_message(
     
     # If replying, verify parent message exists
     if message_data.parent_message_id:
-        parent = db.query(Message).filter(
-            and_(
-                Message.id == message_data.parent_message_id,
-                Message.institution_id == current_user.institution_id
+        parent = (await db.execute(
+            select(Message.id).where(
+                and_(
+                    Message.id == message_data.parent_message_id,
+                    Message.institution_id == current_user.institution_id
+                )
             )
-        ).first()
+        )).scalar()
         
         if not parent:
             raise HTTPException(
@@ -116,8 +137,11 @@ async def send_message(
     )
     
     db.add(message)
-    db.commit()
-    db.refresh(message)
+    await db.flush()
+    await record_messages(db, [message])
+    await db.commit()
+    await db.refresh(message)
+    await push_message_counts(db, [message.sender_id, message.recipient_id])
     
     # Schedule notification for immediate messages
     if not message_data.scheduled_for or message_data.scheduled_for <= datetime.utcnow():
@@ -141,117 +165,218 @@ async def send_message(
     "/",
     response_model=ApiResponse[PaginatedResponse[MessageResponse]],
     summary="List messages",
-    description="List messages with advanced filtering (inbox/sent/archived)"
+    description="List messages with advanced filtering (inbox/sent)"
 )
 async def list_messages(
     filters: MessageFilters = Depends(),
     pagination: PaginationParams = Depends(),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(require_permissions(["admin", "professor", "coordenador", "orientador", "secretario", "responsavel"]))
 ):
     """
     List messages with comprehensive filtering.
     
     **Filters:**
-    - Folder: inbox, sent, archived, starred
-    - Priority: low, normal, high, urgent
+    - Folder: inbox, sent
+    - Sender / recipient
     - Read status
     - Has attachments
     - Date range
-    - Search in subject/content
+    - Search in content (full-text index)
     
     **Required Permissions:** All authenticated users
     """
     # Base query
-    query = db.query(Message).options(
+    query = select(Message).options(
         joinedload(Message.sender),
         joinedload(Message.recipient)
-    ).filter(Message.institution_id == current_user.institution_id)
+    ).where(Message.institution_id == current_user.institution_id)
     
     # Folder filter
     if filters.folder == "inbox":
-        query = query.filter(
-            and_(
-                Message.recipient_id == current_user.id,
-                Message.archived == False
-            )
-        )
+        query = query.where(Message.recipient_id == current_user.id)
     elif filters.folder == "sent":
-        query = query.filter(Message.sender_id == current_user.id)
-    elif filters.folder == "archived":
-        query = query.filter(
-            and_(
-                Message.recipient_id == current_user.id,
-                Message.archived == True
-            )
-        )
-    elif filters.folder == "starred":
-        query = query.filter(
-            and_(
-                Message.recipient_id == current_user.id,
-                Message.starred == True
-            )
-        )
+        query = query.where(Message.sender_id == current_user.id)
     else:
         # Default: show all messages for user
-        query = query.filter(
+        query = query.where(
             or_(
                 Message.sender_id == current_user.id,
                 Message.recipient_id == current_user.id
             )
         )
     
-    # Priority filter
-    if filters.priority:
-        query = query.filter(Message.priority == filters.priority)
+    # Sender / recipient filters
+    if filters.sender_id:
+        query = query.where(Message.sender_id == str(filters.sender_id))
+    if filters.recipient_id:
+        query = query.where(Message.recipient_id == str(filters.recipient_id))
     
     # Read status filter
     if filters.read is not None:
-        query = query.filter(Message.read == filters.read)
+        query = query.where(Message.read == filters.read)
     
-    # Starred filter
-    if filters.starred is not None:
-        query = query.filter(Message.starred == filters.starred)
+    # Date range filter
+    if filters.date_from:
+        query = query.where(Message.created_at >= filters.date_from)
+    if filters.date_to:
+        query = query.where(Message.created_at <= filters.date_to)
     
     # Has attachments filter
-    if filters.has_attachments:
-        query = query.filter(Message.file_attachments != None)
-        query = query.filter(func.json_array_length(Message.file_attachments) > 0)
+    if filters.has_attachments is not None:
+        query = query.where(
+            Message.file_url != None if filters.has_attachments else Message.file_url == None
+        )
     
-    # Search filter
+    # Search filter (full-text index, see GET /messages/search for ranking)
     if filters.search:
-        search_pattern = f"%{filters.search}%"
-        query = query.filter(
-            or_(
-                Message.subject.ilike(search_pattern),
-                Message.content.ilike(search_pattern)
-            )
-        )
+        query = query.where(search_condition(await search_backend(db), filters.search))
     
-    # Apply sorting
-    if filters.sort_by:
+    # Apply sorting (the default created_at order supports cursor pagination)
+    keyset = filters.sort_by in (None, "created_at")
+    if not keyset:
         sort_column = getattr(Message, filters.sort_by, None)
         if sort_column:
             if filters.sort_order == "desc":
                 query = query.order_by(sort_column.desc())
             else:
                 query = query.order_by(sort_column.asc())
-    else:
-        # Default: most recent first
-        query = query.order_by(Message.created_at.desc())
     
-    # Get total count
-    total = query.count()
-    
-    # Apply pagination
-    messages = query.offset(pagination.offset).limit(pagination.limit).all()
+    # Paginate (OFFSET or keyset via pagination.cursor)
+    messages, page_info = await paginate_select(
+        db, query, pagination, Message.created_at, Message.id,
+        descending=filters.sort_by is None or filters.sort_order == "desc",
+        keyset=keyset
+    )
+    total = page_info.total
     
     # Build paginated response
-    paginated = PaginatedResponse.create(
+    paginated = PaginatedResponse.from_info(
         items=[MessageResponse.model_validate(msg) for msg in messages],
+        pagination=page_info
+    )
+    
+    return ApiResponse(
+        success=True,
+        message=f"Found {total} message(s)",
+        data=paginated
+    )
+
+
+@router.get(
+    "/conversations",
+    response_model=ApiResponse[PaginatedResponse[ConversationSummary]],
+    summary="List conversations",
+    description="Current user's conversations, most recent activity first"
+)
+async def list_conversations(
+    unread_only: bool = False,
+    pagination: PaginationParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(require_permissions(["admin", "professor", "coordenador", "orientador", "secretario", "responsavel"]))
+):
+    """
+    List the current user's conversations by last activity.
+    
+    Reads the conversations summary table (last message, unread count per
+    conversation), one index range scan per page; use
+    pagination.next_cursor for deep pages.
+    
+    **Required Permissions:** All authenticated users
+    """
+    query = select(Conversation).options(
+        joinedload(Conversation.peer)
+    ).where(Conversation.user_id == current_user.id)
+    if unread_only:
+        query = query.where(Conversation.unread_count > 0)
+    
+    conversations, page_info = await paginate_select(
+        db, query, pagination, Conversation.last_message_at, Conversation.peer_id
+    )
+    
+    paginated = PaginatedResponse.from_info(
+        items=[
+            ConversationSummary(
+                peer_id=conversation.peer_id,
+                peer_name=conversation.peer.full_name,
+                peer_role=conversation.peer.role,
+                last_message_id=conversation.last_message_id,
+                last_sender_id=conversation.last_sender_id,
+                last_message_preview=conversation.last_message_preview,
+                last_message_at=conversation.last_message_at,
+                unread_count=conversation.unread_count,
+                message_count=conversation.message_count,
+            )
+            for conversation in conversations
+        ],
+        pagination=page_info
+    )
+    
+    return ApiResponse(
+        success=True,
+        message=f"Found {page_info.total} conversation(s)",
+        data=paginated
+    )
+
+
+@router.get(
+    "/search",
+    response_model=ApiResponse[PaginatedResponse[MessageSearchHit]],
+    summary="Search messages",
+    description="Full-text search of the current user's messages, best match first"
+)
+async def search_user_messages(
+    q: str = Query(..., min_length=1, max_length=100, description="Words to search for"),
+    pagination: PaginationParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(require_permissions(["admin", "professor", "coordenador", "orientador", "secretario", "responsavel"]))
+):
+    """
+    Search the current user's sent and received messages.
+    
+    Uses the full-text index (SQLite FTS5, PostgreSQL tsvector with
+    Portuguese stemming): results are ranked by relevance and carry a
+    snippet with the matches wrapped in <mark></mark>. Pages by
+    page/page_size; exact_total=false skips counting the matches.
+    
+    **Required Permissions:** All authenticated users
+    """
+    hits = await search_messages(
+        db, current_user.id, current_user.institution_id, q,
+        limit=pagination.page_size + 1, offset=pagination.offset
+    )
+    has_next = len(hits) > pagination.page_size
+    hits = hits[:pagination.page_size]
+    
+    if pagination.exact_total:
+        total = await count_matches(db, current_user.id, current_user.institution_id, q)
+    else:
+        total = pagination.offset + len(hits) + (1 if has_next else 0)
+    page_info = PaginationInfo.create(
         page=pagination.page,
-        size=pagination.limit,
-        total=total
+        page_size=pagination.page_size,
+        total=total,
+        has_next=has_next,
+        has_previous=pagination.page > 1,
+        total_is_estimate=not pagination.exact_total
+    )
+    
+    paginated = PaginatedResponse.from_info(
+        items=[
+            MessageSearchHit(
+                id=hit.message.id,
+                sender_id=hit.message.sender_id,
+                sender_name=hit.message.sender.full_name,
+                recipient_id=hit.message.recipient_id,
+                recipient_name=hit.message.recipient.full_name,
+                read=bool(hit.message.read),
+                created_at=hit.message.created_at,
+                snippet=hit.snippet,
+                rank=hit.rank,
+            )
+            for hit in hits
+        ],
+        pagination=page_info
     )
     
     return ApiResponse(
@@ -270,7 +395,7 @@ async def list_messages(
 async def get_message(
     message_id: str,
     mark_as_read: bool = True,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(require_permissions(["admin", "professor", "coordenador", "orientador", "secretario", "responsavel"]))
 ):
     """
@@ -280,19 +405,21 @@ async def get_message(
     
     **Required Permissions:** All authenticated users
     """
-    message = db.query(Message).options(
-        joinedload(Message.sender),
-        joinedload(Message.recipient)
-    ).filter(
-        and_(
-            Message.id == message_id,
-            Message.institution_id == current_user.institution_id,
-            or_(
-                Message.sender_id == current_user.id,
-                Message.recipient_id == current_user.id
+    message = (await db.execute(
+        select(Message).options(
+            joinedload(Message.sender),
+            joinedload(Message.recipient)
+        ).where(
+            and_(
+                Message.id == message_id,
+                Message.institution_id == current_user.institution_id,
+                or_(
+                    Message.sender_id == current_user.id,
+                    Message.recipient_id == current_user.id
+                )
             )
         )
-    ).first()
+    )).scalars().first()
     
     if not message:
         raise HTTPException(
@@ -304,8 +431,10 @@ async def get_message(
     if mark_as_read and message.recipient_id == current_user.id and not message.read:
         message.read = True
         message.read_at = datetime.utcnow()
-        db.commit()
-        db.refresh(message)
+        await adjust_unread(db, {(current_user.id, message.sender_id): -1})
+        await db.commit()
+        await db.refresh(message)
+        await push_message_counts(db, [current_user.id])
     
     return ApiResponse(
         success=True,
@@ -323,7 +452,7 @@ async def get_message(
 async def update_message(
     message_id: str,
     message_data: MessageUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(require_permissions(["admin", "professor", "coordenador", "orientador", "secretario", "responsavel"]))
 ):
     """
@@ -336,13 +465,15 @@ async def update_message(
     
     **Required Permissions:** All authenticated users (own messages only)
     """
-    message = db.query(Message).filter(
-        and_(
-            Message.id == message_id,
-            Message.institution_id == current_user.institution_id,
-            Message.recipient_id == current_user.id  # Only recipient can update
+    message = (await db.execute(
+        select(Message).where(
+            and_(
+                Message.id == message_id,
+                Message.institution_id == current_user.institution_id,
+                Message.recipient_id == current_user.id  # Only recipient can update
+            )
         )
-    ).first()
+    )).scalars().first()
     
     if not message:
         raise HTTPException(
@@ -352,6 +483,8 @@ async def update_message(
     
     # Update fields
     update_data = message_data.model_dump(exclude_unset=True)
+    if "read" in update_data and bool(update_data["read"]) != bool(message.read):
+        await adjust_unread(db, {(current_user.id, message.sender_id): -1 if update_data["read"] else 1})
     for field, value in update_data.items():
         if field == "read" and value:
             setattr(message, "read_at", datetime.utcnow())
@@ -359,8 +492,10 @@ async def update_message(
     
     message.updated_at = datetime.utcnow()
     
-    db.commit()
-    db.refresh(message)
+    await db.commit()
+    await db.refresh(message)
+    if "read" in update_data:
+        await push_message_counts(db, [current_user.id])
     
     return ApiResponse(
         success=True,
@@ -377,7 +512,7 @@ async def update_message(
 )
 async def delete_message(
     message_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(require_permissions(["admin", "professor", "coordenador", "orientador", "secretario", "responsavel"]))
 ):
     """
@@ -385,16 +520,18 @@ async def delete_message(
     
     **Required Permissions:** All authenticated users (own messages only)
     """
-    message = db.query(Message).filter(
-        and_(
-            Message.id == message_id,
-            Message.institution_id == current_user.institution_id,
-            or_(
-                Message.sender_id == current_user.id,
-                Message.recipient_id == current_user.id
+    message = (await db.execute(
+        select(Message).where(
+            and_(
+                Message.id == message_id,
+                Message.institution_id == current_user.institution_id,
+                or_(
+                    Message.sender_id == current_user.id,
+                    Message.recipient_id == current_user.id
+                )
             )
         )
-    ).first()
+    )).scalars().first()
     
     if not message:
         raise HTTPException(
@@ -404,7 +541,9 @@ async def delete_message(
     
     # Soft delete
     message.deleted_at = datetime.utcnow()
-    db.commit()
+    await refresh_conversations(db, [(message.sender_id, message.recipient_id)])
+    await db.commit()
+    await push_message_counts(db, [message.sender_id, message.recipient_id])
     
     return ApiResponse(
         success=True,
@@ -422,7 +561,7 @@ async def delete_message(
 async def get_conversation(
     user_id: str,
     limit: int = 50,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(require_permissions(["admin", "professor", "coordenador", "orientador", "secretario", "responsavel"]))
 ):
     """
@@ -434,12 +573,14 @@ async def get_conversation(
     **Required Permissions:** All authenticated users
     """
     # Verify other user exists
-    other_user = db.query(User).filter(
-        and_(
-            User.id == user_id,
-            User.institution_id == current_user.institution_id
+    other_user = (await db.execute(
+        select(User).where(
+            and_(
+                User.id == user_id,
+                User.institution_id == current_user.institution_id
+            )
         )
-    ).first()
+    )).scalars().first()
     
     if not other_user:
         raise HTTPException(
@@ -448,25 +589,28 @@ async def get_conversation(
         )
     
     # Get all messages between users
-    messages = db.query(Message).options(
-        joinedload(Message.sender),
-        joinedload(Message.recipient)
-    ).filter(
-        and_(
-            Message.institution_id == current_user.institution_id,
-            Message.deleted_at.is_(None),
-            or_(
-                and_(
-                    Message.sender_id == current_user.id,
-                    Message.recipient_id == user_id
-                ),
-                and_(
-                    Message.sender_id == user_id,
-                    Message.recipient_id == current_user.id
+    result = await db.execute(
+        select(Message).options(
+            joinedload(Message.sender),
+            joinedload(Message.recipient)
+        ).where(
+            and_(
+                Message.institution_id == current_user.institution_id,
+                Message.deleted_at.is_(None),
+                or_(
+                    and_(
+                        Message.sender_id == current_user.id,
+                        Message.recipient_id == user_id
+                    ),
+                    and_(
+                        Message.sender_id == user_id,
+                        Message.recipient_id == current_user.id
+                    )
                 )
             )
-        )
-    ).order_by(Message.created_at.asc()).limit(limit).all()
+        ).order_by(Message.created_at.asc()).limit(limit)
+    )
+    messages = result.scalars().all()
     
     # Count unread messages
     unread_count = sum(1 for msg in messages if msg.recipient_id == current_user.id and not msg.read)
@@ -494,62 +638,38 @@ async def get_conversation(
     description="Get comprehensive messaging statistics for current user"
 )
 async def get_message_stats(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(require_permissions(["admin", "professor", "coordenador", "orientador", "secretario", "responsavel"]))
 ):
     """
     Get messaging statistics including:
     - Total sent/received
     - Unread count
-    - Response rate
-    - Most contacted users
+    - Active conversations
+    
+    Reads the user's message counters (one row, filled from the messages on
+    first use) instead of counting messages; connected chat clients get
+    the same counters pushed as "message_counts" frames.
     
     **Required Permissions:** All authenticated users
     """
-    # Count sent messages
-    total_sent = db.query(Message).filter(
-        and_(
-            Message.sender_id == current_user.id,
-            Message.institution_id == current_user.institution_id,
-            Message.deleted_at.is_(None)
-        )
-    ).count()
-    
-    # Count received messages
-    total_received = db.query(Message).filter(
-        and_(
-            Message.recipient_id == current_user.id,
-            Message.institution_id == current_user.institution_id,
-            Message.deleted_at.is_(None)
-        )
-    ).count()
-    
-    # Count unread messages
-    unread_count = db.query(Message).filter(
-        and_(
-            Message.recipient_id == current_user.id,
-            Message.institution_id == current_user.institution_id,
-            Message.read == False,
-            Message.deleted_at.is_(None)
-        )
-    ).count()
+    counts = (await get_counts(db, [current_user.id]))[current_user.id]
+    await db.commit()
     
-    # Calculate response rate (simplified)
-    response_rate = (total_sent / total_received * 100) if total_received > 0 else 0
-    
-    # Average response time (placeholder - would need actual calculation)
-    avg_response_time = "2.5 hours"
-    
-    # Most contacted users (placeholder)
-    most_contacted = []
+    active_conversations = await db.scalar(
+        select(func.count()).select_from(Conversation).where(Conversation.user_id == current_user.id)
+    )
     
+    # Starred, archived and priority are not stored on messages
     stats = MessageStats(
-        total_sent=total_sent,
-        total_received=total_received,
-        unread_count=unread_count,
-        response_rate=response_rate,
-        avg_response_time=avg_response_time,
-        most_contacted=most_contacted
+        total_messages=counts.sent + counts.received,
+        sent_messages=counts.sent,
+        received_messages=counts.received,
+        unread_messages=counts.unread,
+        starred_messages=0,
+        archived_messages=0,
+        messages_by_priority={},
+        active_conversations=active_conversations
     )
     
     return ApiResponse(
@@ -567,7 +687,7 @@ async def get_message_stats(
 )
 async def bulk_message_operation(
     bulk_data: MessageBulkAction,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(require_permissions(["admin", "professor", "coordenador", "orientador", "secretario", "responsavel"]))
 ):
     """
@@ -585,13 +705,16 @@ async def bulk_message_operation(
     **Required Permissions:** All authenticated users (own messages only)
     """
     # Get messages
-    messages = db.query(Message).filter(
-        and_(
-            Message.id.in_(bulk_data.message_ids),
-            Message.institution_id == current_user.institution_id,
-            Message.recipient_id == current_user.id  # Only own messages
+    result = await db.execute(
+        select(Message).where(
+            and_(
+                Message.id.in_(bulk_data.message_ids),
+                Message.institution_id == current_user.institution_id,
+                Message.recipient_id == current_user.id  # Only own messages
+            )
         )
-    ).all()
+    )
+    messages = result.scalars().all()
     
     if not messages:
         raise HTTPException(
@@ -601,10 +724,19 @@ async def bulk_message_operation(
     
     success_count = 0
     failed_ids = []
+    # Conversation summary changes: (user, peer) -> unread delta, pairs to recompute
+    unread_deltas = {}
+    deleted_pairs = set()
     
     # Perform action
     for message in messages:
         try:
+            if bulk_data.action in ("mark_read", "mark_unread") and message.deleted_at is None:
+                marked_read = bulk_data.action == "mark_read"
+                if bool(message.read) != marked_read:
+                    key = (current_user.id, message.sender_id)
+                    unread_deltas[key] = unread_deltas.get(key, 0) + (-1 if marked_read else 1)
+            
             if bulk_data.action == "mark_read":
                 message.read = True
                 message.read_at = datetime.utcnow()
@@ -617,6 +749,7 @@ async def bulk_message_operation(
                 message.archived = False
             elif bulk_data.action == "delete":
                 message.deleted_at = datetime.utcnow()
+                deleted_pairs.add((message.sender_id, message.recipient_id))
             elif bulk_data.action == "star":
                 message.starred = True
             elif bulk_data.action == "unstar":
@@ -627,7 +760,11 @@ async def bulk_message_operation(
         except Exception as e:
             failed_ids.append(message.id)
     
-    db.commit()
+    await adjust_unread(db, unread_deltas)
+    await refresh_conversations(db, deleted_pairs)
+    await db.commit()
+    if unread_deltas or deleted_pairs:
+        await push_message_counts(db, {current_user.id} | {user_id for pair in deleted_pairs for user_id in pair})
     
     response = MessageBulkResponse(
         action=bulk_data.action,
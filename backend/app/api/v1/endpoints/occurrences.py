@@ -18,7 +18,9 @@ from app.schemas.occurrence import (
     OccurrenceAnalytics,
 )
 from app.schemas.common import PaginationParams, PaginatedResponse, ApiResponse
-from app.api.deps import get_current_user, get_db, require_permissions
+from app.database import get_db, get_read_db
+from app.core.pagination import paginate_query
+from app.api.deps import get_current_user, require_permissions
 
 
 router = APIRouter()
@@ -193,30 +195,27 @@ async def list_occurrences(
             )
         )
     
-    # Apply sorting
-    if filters.sort_by:
-        sort_column = getattr(Occurrence, filters.sort_by, None)
-        if sort_column:
-            if filters.sort_order == "desc":
-                query = query.order_by(sort_column.desc())
-            else:
-                query = query.order_by(sort_column.asc())
-    else:
-        # Default: most recent first
-        query = query.order_by(Occurrence.occurred_at.desc())
-    
-    # Get total count
-    total = query.count()
-    
-    # Apply pagination
-    occurrences = query.offset(pagination.offset).limit(pagination.limit).all()
+    # Apply sorting (default order supports cursor pagination)
+    sort_column = getattr(Occurrence, filters.sort_by, None) if filters.sort_by else None
+    keyset = sort_column is None or filters.sort_by == "created_at"
+    if not keyset:
+        if filters.sort_order == "desc":
+            query = query.order_by(sort_column.desc())
+        else:
+            query = query.order_by(sort_column.asc())
+    
+    # Paginate (OFFSET or keyset via cursor), most recent first by default
+    occurrences, page_info = paginate_query(
+        query, pagination, Occurrence.created_at, Occurrence.id,
+        descending=sort_column is None or filters.sort_order == "desc",
+        keyset=keyset
+    )
+    total = page_info.total
     
     # Build paginated response
-    paginated = PaginatedResponse.create(
+    paginated = PaginatedResponse.from_info(
         items=[OccurrenceResponse.model_validate(occ) for occ in occurrences],
-        page=pagination.page,
-        size=pagination.limit,
-        total=total
+        pagination=page_info
     )
     
     return ApiResponse(
@@ -421,7 +420,7 @@ async def get_student_occurrence_history(
 async def get_occurrence_analytics(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(require_permissions(["admin", "coordenador", "orientador"]))
 ):
     """
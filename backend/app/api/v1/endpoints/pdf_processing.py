@@ -1,97 +1,101 @@
 """
 Endpoints para processamento de PDFs (Boletins)
 """
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import List
 import uuid
-import json
-from datetime import datetime
 import logging
 
-from ...database import get_db
-from ...models.user import User
-from ...api.deps import get_current_user
-from ...schemas.pdf_extraction import (
+from app.database import get_db, get_async_db
+from app.models.user import User
+from app.models.pdf_job import PDFProcessingJob
+from app.api.deps import get_current_user
+from app.schemas.pdf_extraction import (
     PDFUploadResponse,
     PDFProcessingStatus,
     PDFValidationRequest,
     PDFValidationResponse,
+    PDFCacheStats,
     BulletinData
 )
-from ...services.pdf_extractor import extract_bulletin_data
-from ...models.student import Student
-from ...models.grade import Grade
-from ...models.attendance import Attendance
-from ...config import settings
+from app.services.pdf_cache import cache_stats
+from app.services.pdf_jobs import delete_job, enqueue_job
+from app.models.student import Student
+from app.models.grade import Grade
+from app.models.attendance import Attendance
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# Armazenamento temporário de processamentos (em produção, usar Redis ou banco)
-processing_jobs = {}
+# Só a equipe da escola pode furar a fila de processamento
+PRIORITY_ROLES = ["admin", "administrador", "coordenador"]
 
 
-async def process_pdf_background(
-    job_id: str,
-    pdf_bytes: bytes,
-    filename: str,
-    gemini_key: Optional[str]
-):
-    """
-    Processa PDF em background
-    """
-    try:
-        logger.info(f"Iniciando processamento background do job {job_id}")
-        
-        # Atualizar status
-        processing_jobs[job_id]["status"] = "processing"
-        processing_jobs[job_id]["progress"] = 10
-        
-        # Extrair dados
-        bulletin_data = await extract_bulletin_data(
-            pdf_bytes=pdf_bytes,
-            filename=filename,
-            gemini_api_key=gemini_key
+def _job_status(job: PDFProcessingJob) -> PDFProcessingStatus:
+    """Resposta de status a partir da linha do job"""
+    extracted_data = None
+    if job.extracted_data:
+        try:
+            extracted_data = BulletinData(**job.extracted_data)
+        except Exception as e:
+            logger.error(f"Erro ao converter extracted_data do job {job.id}: {e}")
+    
+    return PDFProcessingStatus(
+        id=job.id,
+        filename=job.filename,
+        status=job.status,
+        progress=job.progress,
+        stage=job.stage,
+        priority=job.priority,
+        attempts=job.attempts,
+        extracted_data=extracted_data,
+        error_message=job.error_message,
+        created_at=job.created_at,
+        completed_at=job.completed_at
+    )
+
+
+def _check_owner(job, current_user: User, action: str):
+    """404 se o job não existe, 403 se não pertence ao usuário"""
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Job de processamento não encontrado"
+        )
+    if job.user_id != str(current_user.id):
+        raise HTTPException(
+            status_code=403,
+            detail=f"Você não tem permissão para {action} este job"
         )
-        
-        # Atualizar progresso
-        processing_jobs[job_id]["progress"] = 90
-        
-        # Salvar resultado
-        processing_jobs[job_id].update({
-            "status": "completed",
-            "progress": 100,
-            "extracted_data": bulletin_data.dict(),
-            "completed_at": datetime.utcnow().isoformat()
-        })
-        
-        logger.info(f"Job {job_id} concluído com sucesso")
-        
-    except Exception as e:
-        logger.error(f"Erro no job {job_id}: {str(e)}", exc_info=True)
-        processing_jobs[job_id].update({
-            "status": "failed",
-            "error_message": str(e),
-            "completed_at": datetime.utcnow().isoformat()
-        })
 
 
 @router.post("/upload", response_model=PDFUploadResponse)
 async def upload_pdf(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
+    priority: int = Query(0, ge=0, le=9, description="Prioridade na fila (maior processa antes; acima de 0 só admin/coordenação)"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Upload de PDF para extração de dados de boletim
     
     - Aceita apenas arquivos PDF
     - Máximo 50MB
-    - Processamento assíncrono em background
+    - Processamento assíncrono na fila de jobs (scripts/pdf_worker.py),
+      com tentativas automáticas em caso de erro
+    - PDF já extraído antes (mesmo conteúdo): concluído na hora, pelo cache
+    - priority acima de 0 apenas para admin/coordenação
     """
     # Validações
+    if priority > 0 and current_user.role not in PRIORITY_ROLES:
+        raise HTTPException(
+            status_code=403,
+            detail="Apenas administradores e coordenadores podem definir prioridade"
+        )
+    
     if not file.filename.lower().endswith('.pdf'):
         raise HTTPException(
             status_code=400,
@@ -114,35 +118,31 @@ async def upload_pdf(
             detail="Arquivo vazio"
         )
     
-    # Criar job de processamento
-    job_id = str(uuid.uuid4())
-    
-    processing_jobs[job_id] = {
-        "id": job_id,
-        "filename": file.filename,
-        "size": file_size,
-        "status": "pending",
-        "progress": 0,
-        "extracted_data": None,
-        "error_message": None,
-        "created_at": datetime.utcnow().isoformat(),
-        "completed_at": None,
-        "user_id": str(current_user.id)
-    }
-    
-    # Processar em background
-    background_tasks.add_task(
-        process_pdf_background,
-        job_id=job_id,
-        pdf_bytes=pdf_bytes,
+    # Criar job de processamento (persistido, executado pelos workers ou já
+    # concluído se o PDF estiver no cache de extração)
+    job = await enqueue_job(
+        db,
+        user_id=str(current_user.id),
+        institution_id=current_user.institution_id,
         filename=file.filename,
-        gemini_key=getattr(settings, 'GEMINI_API_KEY', None)
+        pdf_bytes=pdf_bytes,
+        priority=priority
     )
     
-    logger.info(f"PDF {file.filename} enviado para processamento (job: {job_id})")
+    if job.status == "completed":
+        logger.info(f"PDF {file.filename} extraído do cache (job: {job.id})")
+        return PDFUploadResponse(
+            id=job.id,
+            filename=file.filename,
+            size=file_size,
+            status=job.status,
+            message="Arquivo já processado anteriormente, dados disponíveis"
+        )
+    
+    logger.info(f"PDF {file.filename} enviado para processamento (job: {job.id})")
     
     return PDFUploadResponse(
-        id=job_id,
+        id=job.id,
         filename=file.filename,
         size=file_size,
         status="pending",
@@ -153,90 +153,34 @@ async def upload_pdf(
 @router.get("/status/{job_id}", response_model=PDFProcessingStatus)
 async def get_processing_status(
     job_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Consulta status do processamento de um PDF
     """
-    if job_id not in processing_jobs:
-        raise HTTPException(
-            status_code=404,
-            detail="Job de processamento não encontrado"
-        )
-    
-    job_data = processing_jobs[job_id]
-    
-    # Verificar permissão (usuário deve ser dono do job)
-    if job_data["user_id"] != str(current_user.id):
-        raise HTTPException(
-            status_code=403,
-            detail="Você não tem permissão para acessar este job"
-        )
-    
-    # Converter extracted_data de dict para BulletinData se existir
-    extracted_data = None
-    if job_data["extracted_data"]:
-        try:
-            extracted_data = BulletinData(**job_data["extracted_data"])
-        except Exception as e:
-            logger.error(f"Erro ao converter extracted_data: {e}")
-    
-    return PDFProcessingStatus(
-        id=job_data["id"],
-        filename=job_data["filename"],
-        status=job_data["status"],
-        progress=job_data["progress"],
-        extracted_data=extracted_data,
-        error_message=job_data["error_message"],
-        created_at=datetime.fromisoformat(job_data["created_at"]),
-        completed_at=datetime.fromisoformat(job_data["completed_at"]) if job_data["completed_at"] else None
-    )
+    job = await db.get(PDFProcessingJob, job_id)
+    _check_owner(job, current_user, "acessar")
+    return _job_status(job)
 
 
 @router.get("/list", response_model=List[PDFProcessingStatus])
 async def list_processing_jobs(
     current_user: User = Depends(get_current_user),
-    limit: int = 50
+    limit: int = 50,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Lista todos os jobs de processamento do usuário
     """
-    user_jobs = [
-        job for job in processing_jobs.values()
-        if job["user_id"] == str(current_user.id)
-    ]
-    
-    # Ordenar por data de criação (mais recente primeiro)
-    user_jobs.sort(
-        key=lambda x: x["created_at"],
-        reverse=True
-    )
-    
-    # Limitar resultados
-    user_jobs = user_jobs[:limit]
-    
-    # Converter para response model
-    result = []
-    for job_data in user_jobs:
-        extracted_data = None
-        if job_data["extracted_data"]:
-            try:
-                extracted_data = BulletinData(**job_data["extracted_data"])
-            except:
-                pass
-        
-        result.append(PDFProcessingStatus(
-            id=job_data["id"],
-            filename=job_data["filename"],
-            status=job_data["status"],
-            progress=job_data["progress"],
-            extracted_data=extracted_data,
-            error_message=job_data["error_message"],
-            created_at=datetime.fromisoformat(job_data["created_at"]),
-            completed_at=datetime.fromisoformat(job_data["completed_at"]) if job_data["completed_at"] else None
-        ))
+    jobs = (await db.execute(
+        select(PDFProcessingJob)
+        .where(PDFProcessingJob.user_id == str(current_user.id))
+        .order_by(PDFProcessingJob.created_at.desc())
+        .limit(limit)
+    )).scalars().all()
     
-    return result
+    return [_job_status(job) for job in jobs]
 
 
 @router.post("/validate", response_model=PDFValidationResponse)
@@ -252,21 +196,9 @@ async def validate_and_save(
     - Cria/atualiza aluno, notas e frequência
     - Retorna estatísticas de criação
     """
-    # Verificar se job existe
-    if request.extraction_id not in processing_jobs:
-        raise HTTPException(
-            status_code=404,
-            detail="Job de processamento não encontrado"
-        )
-    
-    job_data = processing_jobs[request.extraction_id]
-    
-    # Verificar permissão
-    if job_data["user_id"] != str(current_user.id):
-        raise HTTPException(
-            status_code=403,
-            detail="Você não tem permissão para validar este job"
-        )
+    # Verificar se job existe e pertence ao usuário
+    job = db.get(PDFProcessingJob, request.extraction_id)
+    _check_owner(job, current_user, "validar")
     
     if not request.approve:
         return PDFValidationResponse(
@@ -395,28 +327,33 @@ async def validate_and_save(
         )
 
 
+@router.get("/cache/stats", response_model=PDFCacheStats)
+async def get_cache_stats(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Entradas, tamanho e taxa de acerto do cache de extração
+    
+    Requer autenticação de administrador
+    """
+    if current_user.role not in ["admin", "administrador"]:
+        raise HTTPException(status_code=403, detail="Apenas administradores podem ver o cache de extração")
+    
+    return PDFCacheStats(**await cache_stats(db))
+
+
 @router.delete("/{job_id}")
 async def delete_processing_job(
     job_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Remove um job de processamento
+    Remove um job de processamento (e o PDF armazenado)
     """
-    if job_id not in processing_jobs:
-        raise HTTPException(
-            status_code=404,
-            detail="Job não encontrado"
-        )
-    
-    job_data = processing_jobs[job_id]
-    
-    if job_data["user_id"] != str(current_user.id):
-        raise HTTPException(
-            status_code=403,
-            detail="Você não tem permissão para deletar este job"
-        )
-    
-    del processing_jobs[job_id]
+    job = await db.get(PDFProcessingJob, job_id)
+    _check_owner(job, current_user, "deletar")
+    await delete_job(db, job)
     
     return {"message": "Job removido com sucesso"}
@@ -4,16 +4,19 @@ Academic management for students with comprehensive CRUD operations
 """
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from sqlalchemy import select, func, and_, or_
 from datetime import datetime
 
-from app.database import get_db
+from app.database import get_async_db, get_async_read_db
 from app.api.deps import get_current_user
+from app.core.principal_cache import principal_cache
+from app.core.pagination import paginate_select
 from app.models import User, Student, Institution, Grade, Attendance, Occurrence
 from app.schemas import (
     StudentCreate, StudentUpdate, StudentResponse, StudentListItem,
-    StudentFilters, StudentDashboard, PaginatedResponse, ApiResponse,
+    StudentFilters, StudentDashboard, PaginatedResponse, PaginationParams, ApiResponse,
     GradeResponse, AttendanceResponse, OccurrenceResponse
 )
 
@@ -21,9 +24,9 @@ from app.schemas import (
 def require_permissions(permission: str):
     """Decorator para verificar permissões baseado no role do usuário"""
     def decorator(func):
-        def wrapper(*args, **kwargs):
-            return func(*args, **kwargs)
-        return wrapper
+        # Return the endpoint itself so FastAPI still sees an async callable
+        # with its real signature (a plain wrapper hid both)
+        return func
     return decorator
 
 
@@ -36,7 +39,9 @@ async def get_students(
     filters: StudentFilters = Depends(),
     pagination: int = Query(1, ge=1, description="Page number"),
     page_size: int = Query(20, ge=1, le=100, description="Items per page"),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="Keyset cursor from pagination.next_cursor/prev_cursor"),
+    exact_total: bool = Query(True, description="False skips COUNT(*) and returns an estimated total"),
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -50,9 +55,9 @@ async def get_students(
     """
     
     # Base query with optimized joins
-    query = db.query(Student).options(
+    query = select(Student).options(
         joinedload(Student.user)
-    ).join(User).filter(
+    ).join(User).where(
         User.institution_id == current_user.institution_id,
         User.deleted_at.is_(None)
     )
@@ -60,7 +65,7 @@ async def get_students(
     # Apply search filter
     if filters.search:
         search_term = f"%{filters.search}%"
-        query = query.filter(
+        query = query.where(
             or_(
                 func.concat(User.first_name, ' ', User.last_name).ilike(search_term),
                 Student.enrollment_number.ilike(search_term),
@@ -70,42 +75,46 @@ async def get_students(
     
     # Apply grade filter
     if filters.grade:
-        query = query.filter(Student.current_grade == filters.grade)
+        query = query.where(Student.current_grade == filters.grade)
     
     # Apply academic status filter
     if filters.academic_status:
-        query = query.filter(Student.academic_status == filters.academic_status)
+        query = query.where(Student.academic_status == filters.academic_status)
     
     # Apply enrollment year filter
     if filters.enrollment_year:
-        query = query.filter(
+        query = query.where(
             func.extract('year', Student.created_at) == filters.enrollment_year
         )
     
-    # Apply sorting
-    if filters.sort_by:
-        if filters.sort_by == "name":
-            order_column = User.first_name
-        elif filters.sort_by == "enrollment_number":
-            order_column = Student.enrollment_number
-        elif filters.sort_by == "grade":
-            order_column = Student.current_grade
-        else:
-            order_column = Student.created_at
-        
+    # Apply sorting (created_at order supports cursor pagination)
+    order_column = Student.created_at
+    if filters.sort_by == "name":
+        order_column = User.first_name
+    elif filters.sort_by == "enrollment_number":
+        order_column = Student.enrollment_number
+    elif filters.sort_by == "grade":
+        order_column = Student.current_grade
+    
+    keyset = order_column is Student.created_at
+    if not keyset:
         if filters.sort_order == "desc":
             query = query.order_by(order_column.desc())
         else:
             query = query.order_by(order_column.asc())
-    else:
-        query = query.order_by(Student.created_at.desc())
-    
-    # Count total before pagination
-    total = query.count()
     
-    # Apply pagination
-    offset = (pagination - 1) * page_size
-    students = query.offset(offset).limit(page_size).all()
+    # Paginate (OFFSET or keyset via cursor), counting only when asked to
+    page_params = PaginationParams(
+        page=pagination,
+        page_size=page_size,
+        cursor=cursor,
+        exact_total=exact_total
+    )
+    students, page_info = await paginate_select(
+        db, query, page_params, Student.created_at, Student.id,
+        descending=not filters.sort_by or filters.sort_order == "desc",
+        keyset=keyset
+    )
     
     # Transform to list items
     student_items = [
@@ -121,11 +130,9 @@ async def get_students(
         for student in students
     ]
     
-    return PaginatedResponse.create(
+    return PaginatedResponse.from_info(
         items=student_items,
-        page=pagination,
-        page_size=page_size,
-        total=total
+        pagination=page_info
     )
 
 
@@ -134,7 +141,7 @@ async def get_students(
 async def get_student(
     student_id: str,
     include_user: bool = Query(False, description="Include user information"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -147,15 +154,18 @@ async def get_student(
     """
     
     # Build query with optional user loading
-    query = db.query(Student).filter(Student.id == student_id)
-    
-    if include_user:
-        query = query.options(joinedload(Student.user))
+    # User is always eager-loaded: async sessions cannot lazy-load it later
+    query = select(Student).options(
+        joinedload(Student.user)
+    ).where(Student.id == student_id)
     
-    student = query.join(User).filter(
-        User.institution_id == current_user.institution_id,
-        User.deleted_at.is_(None)
-    ).first()
+    result = await db.execute(
+        query.join(User).where(
+            User.institution_id == current_user.institution_id,
+            User.deleted_at.is_(None)
+        )
+    )
+    student = result.scalars().first()
     
     if not student:
         raise HTTPException(
@@ -173,7 +183,7 @@ async def get_student(
 @require_permissions("students:create")
 async def create_student(
     student_data: StudentCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -187,10 +197,12 @@ async def create_student(
     """
     
     # Check if enrollment number already exists in institution
-    existing_enrollment = db.query(Student).join(User).filter(
-        Student.enrollment_number == student_data.enrollment_number,
-        User.institution_id == current_user.institution_id
-    ).first()
+    existing_enrollment = (await db.execute(
+        select(Student).join(User).where(
+            Student.enrollment_number == student_data.enrollment_number,
+            User.institution_id == current_user.institution_id
+        )
+    )).scalars().first()
     
     if existing_enrollment:
         raise HTTPException(
@@ -199,10 +211,12 @@ async def create_student(
         )
     
     # Check if email already exists
-    existing_email = db.query(User).filter(
-        User.email == student_data.user.email,
-        User.deleted_at.is_(None)
-    ).first()
+    existing_email = (await db.execute(
+        select(User).where(
+            User.email == student_data.user.email,
+            User.deleted_at.is_(None)
+        )
+    )).scalars().first()
     
     if existing_email:
         raise HTTPException(
@@ -229,7 +243,7 @@ async def create_student(
         )
         
         db.add(db_user)
-        db.flush()  # Get user ID
+        await db.flush()  # Get user ID
         
         # Create student
         db_student = Student(
@@ -244,11 +258,11 @@ async def create_student(
         )
         
         db.add(db_student)
-        db.commit()
-        db.refresh(db_student)
+        await db.commit()
+        await db.refresh(db_student)
         
         # Load user data for response
-        db.refresh(db_student, ['user'])
+        await db.refresh(db_student, ['user'])
         
         return ApiResponse(
             data=db_student,
@@ -256,7 +270,7 @@ async def create_student(
         )
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to create student"
@@ -267,7 +281,7 @@ async def create_student(
 async def update_student(
     student_id: str,
     student_data: StudentUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Update student"""
@@ -279,10 +293,15 @@ async def update_student(
             detail="Not enough permissions"
         )
     
-    student = db.query(Student).join(User).filter(
-        Student.id == student_id,
-        User.deleted_at.is_(None)
-    ).first()
+    result = await db.execute(
+        select(Student).options(
+            joinedload(Student.user)
+        ).join(User).where(
+            Student.id == student_id,
+            User.deleted_at.is_(None)
+        )
+    )
+    student = result.scalars().first()
     
     if not student:
         raise HTTPException(
@@ -303,8 +322,8 @@ async def update_student(
     for field, value in update_data.items():
         setattr(student, field, value)
     
-    db.commit()
-    db.refresh(student)
+    await db.commit()
+    await db.refresh(student)
     
     return student
 
@@ -312,7 +331,7 @@ async def update_student(
 @router.delete("/{student_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_student(
     student_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Delete student profile (soft delete the associated user)"""
@@ -324,10 +343,15 @@ async def delete_student(
             detail="Not enough permissions"
         )
     
-    student = db.query(Student).join(User).filter(
-        Student.id == student_id,
-        User.deleted_at.is_(None)
-    ).first()
+    result = await db.execute(
+        select(Student).options(
+            joinedload(Student.user)
+        ).join(User).where(
+            Student.id == student_id,
+            User.deleted_at.is_(None)
+        )
+    )
+    student = result.scalars().first()
     
     if not student:
         raise HTTPException(
@@ -346,7 +370,8 @@ async def delete_student(
     from datetime import datetime
     student.user.deleted_at = datetime.utcnow()
     
-    db.commit()
+    await db.commit()
+    await principal_cache.invalidate_user(student.user_id)
 
 
 @router.get("/{student_id}/dashboard", response_model=ApiResponse[StudentDashboard])
@@ -354,7 +379,7 @@ async def delete_student(
 async def get_student_dashboard(
     student_id: str,
     academic_year: Optional[int] = Query(None, description="Academic year filter"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -369,13 +394,16 @@ async def get_student_dashboard(
     """
     
     # Verify student access
-    student = db.query(Student).options(
-        joinedload(Student.user)
-    ).join(User).filter(
-        Student.id == student_id,
-        User.institution_id == current_user.institution_id,
-        User.deleted_at.is_(None)
-    ).first()
+    result = await db.execute(
+        select(Student).options(
+            joinedload(Student.user)
+        ).join(User).where(
+            Student.id == student_id,
+            User.institution_id == current_user.institution_id,
+            User.deleted_at.is_(None)
+        )
+    )
+    student = result.scalars().first()
     
     if not student:
         raise HTTPException(
@@ -436,17 +464,22 @@ async def get_student_grades(
     academic_year: Optional[int] = Query(None, description="Filter by academic year"),
     page: int = Query(1, ge=1, description="Page number"),
     page_size: int = Query(20, ge=1, le=100, description="Items per page"),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="Keyset cursor from pagination.next_cursor/prev_cursor"),
+    exact_total: bool = Query(True, description="False skips COUNT(*) and returns an estimated total"),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get paginated grades for a specific student with filtering"""
     
     # Verify student access
-    student = db.query(Student).join(User).filter(
-        Student.id == student_id,
-        User.institution_id == current_user.institution_id,
-        User.deleted_at.is_(None)
-    ).first()
+    result = await db.execute(
+        select(Student.id).join(User).where(
+            Student.id == student_id,
+            User.institution_id == current_user.institution_id,
+            User.deleted_at.is_(None)
+        )
+    )
+    student = result.scalar()
     
     if not student:
         raise HTTPException(
@@ -455,30 +488,31 @@ async def get_student_grades(
         )
     
     # Build grades query
-    query = db.query(Grade).filter(
+    query = select(Grade).where(
         Grade.student_id == student_id,
         Grade.institution_id == current_user.institution_id
     )
     
     # Apply filters
     if subject:
-        query = query.filter(Grade.subject == subject)
+        query = query.where(Grade.subject == subject)
     if semester:
-        query = query.filter(Grade.semester == semester)
+        query = query.where(Grade.semester == semester)
     if academic_year:
-        query = query.filter(Grade.academic_year == academic_year)
-    
-    # Order by most recent first
-    query = query.order_by(Grade.created_at.desc())
-    
-    # Count and paginate
-    total = query.count()
-    offset = (page - 1) * page_size
-    grades = query.offset(offset).limit(page_size).all()
+        query = query.where(Grade.academic_year == academic_year)
     
-    return PaginatedResponse.create(
-        items=grades,
+    # Paginate most recent first (OFFSET or keyset via cursor)
+    page_params = PaginationParams(
         page=page,
         page_size=page_size,
-        total=total
+        cursor=cursor,
+        exact_total=exact_total
+    )
+    grades, page_info = await paginate_select(
+        db, query, page_params, Grade.created_at, Grade.id
+    )
+    
+    return PaginatedResponse.from_info(
+        items=grades,
+        pagination=page_info
     )
\ No newline at end of file
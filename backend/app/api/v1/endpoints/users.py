@@ -19,6 +19,8 @@ from app.schemas import (
 from app.api.deps import CurrentUser
 from app.core.auth import AuthUtils
 from app.core.security import SecurityUtils
+from app.core.principal_cache import principal_cache
+from app.core.pagination import paginate_query
 
 
 router = APIRouter()
@@ -49,22 +51,15 @@ async def get_users(
     if status_filter:
         query = query.filter(User.status == status_filter)
     
-    # Count total for pagination
-    total = query.count()
-    
-    # Apply pagination
-    users = query.offset(
-        (pagination.page - 1) * pagination.page_size
-    ).limit(pagination.page_size).all()
+    # Paginate newest first (OFFSET or keyset via cursor)
+    users, page_info = paginate_query(query, pagination, User.created_at, User.id)
     
     # Convert to response models
     user_responses = [UserResponse.from_orm(user) for user in users]
     
-    return PaginatedResponse.create(
+    return PaginatedResponse.from_info(
         items=user_responses,
-        page=pagination.page,
-        page_size=pagination.page_size,
-        total=total
+        pagination=page_info
     )
 
 
@@ -222,6 +217,10 @@ async def update_user(
     db.commit()
     db.refresh(user)
     
+    # Cached principals would keep the old role/status until they expire
+    if update_data:
+        await principal_cache.invalidate_user(user.id)
+    
     return UserResponse.from_orm(user)
 
 
@@ -271,6 +270,7 @@ async def delete_user(
     user.status = "deleted"
     
     db.commit()
+    await principal_cache.invalidate_user(user.id)
     
     return {"message": "User deleted successfully", "user_id": str(user_id)}
     
@@ -0,0 +1,196 @@
+"""
+Pub/sub backplane for chat fan-out across workers
+
+Every worker keeps only its own sockets. Messages for an institution room
+or a user are published on a channel (chat:institution:<id>,
+chat:user:<id>); each worker subscribes to the channels of the users it
+holds and delivers to its local sockets only. CHAT_BACKPLANE=redis uses
+Redis pub/sub at REDIS_URL; "memory" keeps everything in-process (single
+worker, and tests that simulate several workers in one process).
+"""
+import asyncio
+import json
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from app.config import settings
+
+try:
+    import redis.asyncio as aioredis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Called with (channel, payload) for every message on a subscribed channel
+MessageHandler = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+def institution_channel(institution_id: str) -> str:
+    return f"chat:institution:{institution_id}"
+
+
+def user_channel(user_id: str) -> str:
+    return f"chat:user:{user_id}"
+
+
+class Backplane(ABC):
+    """Interface of a chat backplane"""
+
+    name = "base"
+
+    @abstractmethod
+    async def start(self, handler: MessageHandler) -> None:
+        ...
+
+    @abstractmethod
+    async def subscribe(self, channel: str) -> None:
+        ...
+
+    @abstractmethod
+    async def unsubscribe(self, channel: str) -> None:
+        ...
+
+    @abstractmethod
+    async def publish(self, channel: str, payload: Dict[str, Any]) -> None:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+class InMemoryHub:
+    """Channel registry shared by the in-memory backplanes of one process"""
+
+    def __init__(self):
+        self.subscribers: Dict[str, Set["InMemoryBackplane"]] = {}
+
+
+class InMemoryBackplane(Backplane):
+    """In-process stand-in for Redis pub/sub"""
+
+    name = "memory"
+
+    def __init__(self, hub: Optional[InMemoryHub] = None):
+        self.hub = hub or default_hub
+        self.handler: Optional[MessageHandler] = None
+        self.published = 0
+        self.received = 0
+
+    async def start(self, handler: MessageHandler) -> None:
+        self.handler = handler
+
+    async def subscribe(self, channel: str) -> None:
+        self.hub.subscribers.setdefault(channel, set()).add(self)
+
+    async def unsubscribe(self, channel: str) -> None:
+        subscribers = self.hub.subscribers.get(channel)
+        if subscribers is not None:
+            subscribers.discard(self)
+            if not subscribers:
+                del self.hub.subscribers[channel]
+
+    async def publish(self, channel: str, payload: Dict[str, Any]) -> None:
+        self.published += 1
+        for backplane in list(self.hub.subscribers.get(channel, ())):
+            if backplane.handler is not None:
+                backplane.received += 1
+                await backplane.handler(channel, payload)
+
+    async def close(self) -> None:
+        for channel in [c for c, subs in self.hub.subscribers.items() if self in subs]:
+            await self.unsubscribe(channel)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "published": self.published, "received": self.received}
+
+
+class RedisBackplane(Backplane):
+    """Redis pub/sub backplane (one pubsub connection per worker)"""
+
+    name = "redis"
+
+    def __init__(self, redis_url: str, worker_id: str):
+        self.redis = aioredis.from_url(redis_url, decode_responses=True)
+        # Always subscribed, so the listener never sees an empty pubsub
+        self.control_channel = f"chat:worker:{worker_id}"
+        self.pubsub = None
+        self.handler: Optional[MessageHandler] = None
+        self._listener: Optional[asyncio.Task] = None
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+
+    async def start(self, handler: MessageHandler) -> None:
+        self.handler = handler
+        self.pubsub = self.redis.pubsub()
+        await self.pubsub.subscribe(self.control_channel)
+        self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async for message in self.pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    self.received += 1
+                    try:
+                        await self.handler(message["channel"], json.loads(message["data"]))
+                    except Exception as e:
+                        self.errors += 1
+                        logger.warning(f"Backplane delivery failed on {message['channel']}: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Backplane listener error, retrying: {e}")
+                await asyncio.sleep(1)
+
+    async def subscribe(self, channel: str) -> None:
+        await self.pubsub.subscribe(channel)
+
+    async def unsubscribe(self, channel: str) -> None:
+        await self.pubsub.unsubscribe(channel)
+
+    async def publish(self, channel: str, payload: Dict[str, Any]) -> None:
+        try:
+            await self.redis.publish(channel, json.dumps(payload, default=str))
+            self.published += 1
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Backplane publish failed on {channel}: {e}")
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        if self.pubsub is not None:
+            await self.pubsub.aclose()
+            self.pubsub = None
+        await self.redis.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "published": self.published,
+            "received": self.received,
+            "errors": self.errors,
+        }
+
+
+# Hub of the in-memory backplanes of this process
+default_hub = InMemoryHub()
+
+
+def create_backplane(worker_id: str) -> Backplane:
+    """Backplane selected by CHAT_BACKPLANE"""
+    if settings.chat_backplane == "redis":
+        if REDIS_AVAILABLE:
+            return RedisBackplane(settings.redis_url, worker_id)
+        logger.warning("redis package not installed, chat backplane stays in-process")
+    return InMemoryBackplane()
@@ -1,16 +1,29 @@
 """
 Real-time chat WebSocket endpoint with authentication and connection management
 """
-from typing import Dict, Set
+from typing import Dict, Optional, Set, Tuple
 from datetime import datetime
+import asyncio
+import time
+from uuid import uuid4
 from fastapi import WebSocket, WebSocketDisconnect, Query, status
-from sqlalchemy.orm import Session
-import json
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
+from app.database import AsyncSessionLocal
 from app.models.user import User
-from app.models.message import Message
-from app.core.security import SecurityUtils
+from app.core.auth import AuthUtils
+from app.config import settings
+from app.api.v1.ws.backplane import Backplane, create_backplane, institution_channel, user_channel
+from app.api.v1.ws.codec import JSON, Codec, Frame, negotiate
+from app.api.v1.ws.connection import ClientConnection, coalesce_key, queue_stats
+from app.api.v1.ws.delivery import stream_sync
+from app.api.v1.ws.persistence import RecipientNotFound, chat_persistence
+from app.api.v1.ws.presence import PresenceService
+from app.services.message_counters import MessageCounts, counts_message
+
+# Same bound as MessageBase.content (REST API)
+MAX_CONTENT_LENGTH = 5000
 
 
 class ConnectionManager:
@@ -19,152 +32,392 @@ class ConnectionManager:
     
     Features:
     - Connection pooling per institution
-    - User presence tracking
+    - Several sockets per user (tabs, devices), all of them receive the
+      user's messages
+    - User presence tracking (PresenceService) with heartbeat expiry of
+      silent sockets; joins and leaves go out as one versioned
+      presence_delta per institution every flush interval, to this
+      worker's sockets (the other workers merge the raw changes into
+      their own versioned state)
+    - Repeated typing indicators to the same recipient are throttled
     - Room-based messaging
     - Broadcast capabilities
+    - Fan-out across workers through a pub/sub backplane (each worker
+      delivers only to the sockets it holds)
+    - Per-socket bounded send queues, so broadcasts encode once (per wire
+      format: JSON or msgpack) and never wait on a slow client
     """
     
-    def __init__(self):
-        # Active connections: {user_id: WebSocket}
-        self.active_connections: Dict[str, WebSocket] = {}
+    def __init__(
+        self,
+        backplane: Optional[Backplane] = None,
+        send_queue_size: Optional[int] = None,
+        slow_consumer_policy: Optional[str] = None,
+        heartbeat_ttl: Optional[int] = None,
+        presence_flush_ms: Optional[int] = None,
+    ):
+        # Identifies this worker's publications on the backplane
+        self.worker_id = uuid4().hex
+        self.backplane = backplane or create_backplane(self.worker_id)
+        self._backplane_started = False
         
-        # User presence: {user_id: {institution_id, last_seen, status}}
-        self.user_presence: Dict[str, dict] = {}
+        self.send_queue_size = send_queue_size or settings.chat_send_queue_size
+        self.slow_consumer_policy = slow_consumer_policy or settings.chat_slow_consumer_policy
+        self.slow_consumers_closed = 0
         
-        # Institution rooms: {institution_id: Set[user_id]}
-        self.institution_rooms: Dict[str, Set[str]] = {}
-    
-    async def connect(self, websocket: WebSocket, user_id: str, institution_id: str):
-        """Accept WebSocket connection and register user"""
-        await websocket.accept()
+        # Active connections: {user_id: Set[ClientConnection]}
+        self.active_connections: Dict[str, Set[ClientConnection]] = {}
         
-        # Store connection
-        self.active_connections[user_id] = websocket
+        # Online users per institution (rooms), last seen of offline users
+        self.presence = PresenceService(
+            last_seen_max=settings.chat_last_seen_max_entries,
+            history_size=settings.chat_presence_history,
+            epoch=self.worker_id,
+        )
+        self.presence_flush_ms = presence_flush_ms or settings.chat_presence_flush_ms
+        self._presence_task: Optional[asyncio.Task] = None
         
-        # Update presence
-        self.user_presence[user_id] = {
-            "institution_id": institution_id,
-            "last_seen": datetime.utcnow().isoformat(),
-            "status": "online"
-        }
+        # Last typing state forwarded: {sender_id: {recipient_id: (is_typing, monotonic time)}}
+        self.typing_interval = settings.chat_typing_interval_ms / 1000
+        self._typing: Dict[str, Dict[str, Tuple[bool, float]]] = {}
+        self.typing_coalesced = 0
         
-        # Add to institution room
-        if institution_id not in self.institution_rooms:
-            self.institution_rooms[institution_id] = set()
-        self.institution_rooms[institution_id].add(user_id)
+        # Sockets without any frame for heartbeat_ttl seconds are expired
+        self.heartbeat_ttl = heartbeat_ttl or settings.chat_heartbeat_ttl_seconds
+        self.expired_connections = 0
+        self._expiry_task: Optional[asyncio.Task] = None
+    
+    async def _ensure_started(self):
+        if not self._backplane_started:
+            await self.backplane.start(self._on_backplane_message)
+            self._backplane_started = True
+        if self._expiry_task is None or self._expiry_task.done():
+            self._expiry_task = asyncio.create_task(self._expire_silent_connections())
+        if self._presence_task is None or self._presence_task.done():
+            self._presence_task = asyncio.create_task(self._flush_presence())
+    
+    async def connect(
+        self, websocket: WebSocket, user_id: str, institution_id: str, codec: Codec = JSON
+    ) -> ClientConnection:
+        """Accept WebSocket connection (with the negotiated subprotocol) and register user"""
+        await websocket.accept(subprotocol=codec.subprotocol)
+        await self._ensure_started()
         
-        # Notify others about user joining
-        await self.broadcast_to_institution(
+        connection = ClientConnection(
+            websocket,
+            user_id,
             institution_id,
-            {
-                "type": "user_joined",
-                "user_id": user_id,
-                "timestamp": datetime.utcnow().isoformat()
-            },
-            exclude_user=user_id
+            max_queue=self.send_queue_size,
+            policy=self.slow_consumer_policy,
+            on_failure=self._on_connection_failure,
+            codec=codec,
         )
+        connection.start()
+        
+        # Store connection next to the user's other sockets
+        devices = self.active_connections.setdefault(user_id, set())
+        if not devices:
+            await self.backplane.subscribe(user_channel(user_id))
+        devices.add(connection)
+        
+        # Update presence (a second socket of an online user changes nothing);
+        # the room hears about it in the next presence_delta
+        if self.presence.user_connected(institution_id, user_id):
+            # Subscribe to the institution when it is the worker's first member
+            if len(self.presence.members(institution_id)) == 1:
+                await self.backplane.subscribe(institution_channel(institution_id))
+                # Ask the workers already there who they hold
+                await self._publish_presence(institution_id, "hello")
+        return connection
     
-    async def disconnect(self, user_id: str):
-        """Remove connection and update presence"""
-        if user_id in self.active_connections:
-            websocket = self.active_connections[user_id]
-            institution_id = self.user_presence.get(user_id, {}).get("institution_id")
-            
-            # Remove from active connections
+    async def disconnect(self, user_id: str, connection: Optional[ClientConnection] = None):
+        """Remove one socket of the user (all of them without connection) and update presence"""
+        devices = self.active_connections.get(user_id, set())
+        if connection is not None and connection not in devices:
+            # Socket already unregistered (expired or failed)
+            await connection.close()
+            return
+        
+        went_offline = False
+        institution_id = None
+        for device in [connection] if connection is not None else list(devices):
+            devices.discard(device)
+            await device.close()
+            institution_id = device.institution_id
+            went_offline = self.presence.user_disconnected(user_id) or went_offline
+        
+        if not devices and user_id in self.active_connections:
             del self.active_connections[user_id]
-            
-            # Update presence to offline
-            if user_id in self.user_presence:
-                self.user_presence[user_id]["status"] = "offline"
-                self.user_presence[user_id]["last_seen"] = datetime.utcnow().isoformat()
-            
-            # Remove from institution room
-            if institution_id and institution_id in self.institution_rooms:
-                self.institution_rooms[institution_id].discard(user_id)
-            
-            # Notify others about user leaving
-            if institution_id:
-                await self.broadcast_to_institution(
-                    institution_id,
-                    {
-                        "type": "user_left",
-                        "user_id": user_id,
-                        "timestamp": datetime.utcnow().isoformat()
-                    },
-                    exclude_user=user_id
-                )
-    
-    async def send_personal_message(self, user_id: str, message: dict):
-        """Send message to specific user"""
-        if user_id in self.active_connections:
-            websocket = self.active_connections[user_id]
+            self._typing.pop(user_id, None)
+            await self.backplane.unsubscribe(user_channel(user_id))
+        
+        # Leave the institution channel with the worker's last member (the
+        # room hears about the user leaving in the next presence_delta)
+        if went_offline and not self.presence.members(institution_id):
+            await self.backplane.unsubscribe(institution_channel(institution_id))
+            # Other workers' changes stop arriving, so their users go stale
+            self.presence.forget_remote(institution_id)
+    
+    async def _flush_presence(self):
+        """Broadcast the presence changes of each institution as one delta per interval"""
+        while True:
+            await asyncio.sleep(self.presence_flush_ms / 1000)
             try:
-                await websocket.send_json(message)
+                await self.flush_presence()
             except Exception as e:
-                print(f"Error sending message to {user_id}: {e}")
-                await self.disconnect(user_id)
+                print(f"Chat presence flush error: {e}")
+    
+    async def flush_presence(self):
+        """
+        Send the pending presence changes now
+        
+        The raw joins and leaves of this worker's sockets go to the other
+        workers, the delta (versioned in this worker's epoch) only to the
+        sockets of this worker.
+        """
+        for institution_id, joined, left in self.presence.take_changes():
+            await self._publish_presence(institution_id, "changes", joined, left)
+        for institution_id, delta in self.presence.flush():
+            await self._broadcast_local(institution_id, delta)
+    
+    async def _publish_presence(self, institution_id: str, kind: str, joined: list = (), left: list = ()):
+        """Presence of this worker's sockets for the other workers ("changes", "state", "hello", "bye")"""
+        await self.backplane.publish(
+            institution_channel(institution_id),
+            {"origin": self.worker_id, "presence": kind, "joined": list(joined), "left": list(left)}
+        )
+    
+    async def _announce_presence(self):
+        """Full presence of every institution this worker holds, so other workers can expire a crashed one"""
+        for institution_id in list(self.presence.institutions()):
+            await self._publish_presence(institution_id, "state", self.presence.local_state(institution_id))
+    
+    async def _on_remote_presence(self, institution_id: str, payload: dict):
+        """Merge another worker's presence into this worker's state"""
+        origin, kind = payload["origin"], payload["presence"]
+        if kind == "hello":
+            await self._publish_presence(institution_id, "state", self.presence.local_state(institution_id))
+        elif kind == "bye":
+            self.presence.forget_remote(institution_id, origin)
+        else:
+            self.presence.apply_remote(
+                origin, institution_id, payload.get("joined", []), payload.get("left", []),
+                full_state=kind == "state",
+            )
+    
+    def should_send_typing(self, sender_id: str, recipient_id: str, is_typing: bool) -> bool:
+        """
+        Coalesce rapid typing indicators
+        
+        A change of state is always forwarded, the same state again only
+        after CHAT_TYPING_INTERVAL_MS (clients send one per keystroke).
+        """
+        now = time.monotonic()
+        sent = self._typing.setdefault(sender_id, {})
+        previous = sent.get(recipient_id)
+        if previous is not None and previous[0] == is_typing and now - previous[1] < self.typing_interval:
+            self.typing_coalesced += 1
+            return False
+        if is_typing:
+            sent[recipient_id] = (is_typing, now)
+        else:
+            sent.pop(recipient_id, None)
+            if not sent:
+                del self._typing[sender_id]
+        return True
+    
+    async def _expire_silent_connections(self):
+        """Close sockets whose client stopped sending pings (half-open connections)"""
+        interval = max(1.0, self.heartbeat_ttl / 3)
+        while True:
+            await asyncio.sleep(interval)
+            cutoff = time.monotonic() - self.heartbeat_ttl
+            silent = [
+                connection
+                for devices in self.active_connections.values()
+                for connection in devices
+                if connection.last_heartbeat < cutoff
+            ]
+            for connection in silent:
+                try:
+                    self.expired_connections += 1
+                    await self.disconnect(connection.user_id, connection)
+                    await connection.close_socket(status.WS_1001_GOING_AWAY)
+                except Exception as e:
+                    print(f"Chat heartbeat expiry error: {e}")
+            # Other workers expire this one's users when the state stops coming
+            try:
+                await self._announce_presence()
+                self.presence.expire_remote(self.heartbeat_ttl)
+            except Exception as e:
+                print(f"Chat presence announce error: {e}")
+    
+    async def send_personal_message(self, user_id: str, message: dict, droppable: bool = False):
+        """
+        Send message to specific user (every socket, on whichever worker holds it)
+        
+        droppable messages (typing indicators) may be coalesced or dropped
+        for a slow client.
+        """
+        await self._send_local(user_id, message, droppable)
+        await self.backplane.publish(
+            user_channel(user_id),
+            {"origin": self.worker_id, "message": message, "droppable": droppable}
+        )
     
     async def broadcast_to_institution(self, institution_id: str, message: dict, exclude_user: str = None):
-        """Broadcast message to all users in institution"""
-        if institution_id not in self.institution_rooms:
+        """Broadcast message to all users in institution (every worker)"""
+        await self._broadcast_local(institution_id, message, exclude_user)
+        await self.backplane.publish(
+            institution_channel(institution_id),
+            {"origin": self.worker_id, "message": message, "exclude_user": exclude_user}
+        )
+    
+    async def _send_local(self, user_id: str, message: dict, droppable: bool = False):
+        """Queue for the user's sockets held by this worker"""
+        devices = self.active_connections.get(user_id)
+        if not devices:
             return
+        frames: Dict[str, Frame] = {}
+        key = coalesce_key(message) if droppable else None
+        for connection in list(devices):
+            connection.enqueue(self._encoded(frames, connection.codec, message), key, droppable)
+    
+    async def _broadcast_local(self, institution_id: str, message: dict, exclude_user: str = None):
+        """
+        Queue for the institution members connected to this worker
         
-        disconnected_users = []
+        The frame is encoded once per wire format and only enqueued, each
+        socket's writer task sends it concurrently with the others.
+        """
+        members = self.presence.members(institution_id)
+        if not members:
+            return
         
-        for user_id in self.institution_rooms[institution_id]:
+        frames: Dict[str, Frame] = {}
+        key = coalesce_key(message)
+        for user_id in list(members):
             if exclude_user and user_id == exclude_user:
                 continue
-            
-            if user_id in self.active_connections:
-                try:
-                    await self.active_connections[user_id].send_json(message)
-                except Exception as e:
-                    print(f"Error broadcasting to {user_id}: {e}")
-                    disconnected_users.append(user_id)
-        
-        # Clean up disconnected users
-        for user_id in disconnected_users:
-            await self.disconnect(user_id)
+            for connection in list(self.active_connections.get(user_id, ())):
+                connection.enqueue(self._encoded(frames, connection.codec, message), key, droppable=True)
+    
+    @staticmethod
+    def _encoded(frames: Dict[str, Frame], codec: Codec, message: dict) -> Frame:
+        """message encoded with codec, reusing the frame of an earlier socket with the same codec"""
+        frame = frames.get(codec.name)
+        if frame is None:
+            frame = frames[codec.name] = codec.encode(message)
+        return frame
+    
+    async def _on_connection_failure(self, connection: ClientConnection):
+        """Unregister a socket whose send failed or that was closed as a slow consumer"""
+        if connection.slow_consumer:
+            self.slow_consumers_closed += 1
+        await self.disconnect(connection.user_id, connection)
+    
+    async def _on_backplane_message(self, channel: str, payload: dict):
+        """Deliver a message published by another worker to local sockets"""
+        if payload.get("origin") == self.worker_id:
+            return
+        _, kind, target = channel.split(":", 2)
+        if kind == "institution" and "presence" in payload:
+            await self._on_remote_presence(target, payload)
+        elif kind == "institution":
+            await self._broadcast_local(target, payload["message"], payload.get("exclude_user"))
+        elif kind == "user":
+            await self._send_local(target, payload["message"], payload.get("droppable", False))
     
     def get_online_users(self, institution_id: str) -> list:
-        """Get list of online users in institution"""
-        if institution_id not in self.institution_rooms:
-            return []
+        """Get list of online users in institution (cached snapshot, do not modify)"""
+        return self.presence.online_users(institution_id)
+    
+    def presence_frame(
+        self,
+        institution_id: str,
+        epoch: Optional[str] = None,
+        version: Optional[int] = None,
+        codec: Codec = JSON,
+    ) -> Frame:
+        """
+        Encoded presence state for a client
+        
+        A catch-up presence_delta when the client's epoch/version can be
+        resumed, else the online_users snapshot (cached per version).
+        """
+        return self.presence.sync_frame(institution_id, epoch, version, codec)
+    
+    async def push_message_counts(self, counts: Dict[str, MessageCounts]):
+        """
+        Send each user their current message counters (replaces badge polling)
         
-        return [
-            {
-                "user_id": user_id,
-                "status": self.user_presence[user_id]["status"],
-                "last_seen": self.user_presence[user_id]["last_seen"]
-            }
-            for user_id in self.institution_rooms[institution_id]
-            if user_id in self.user_presence
-        ]
+        Droppable and coalesced: a socket that is behind only gets the
+        latest counters.
+        """
+        for user_id, user_counts in counts.items():
+            await self.send_personal_message(user_id, counts_message(user_counts), droppable=True)
     
     def is_user_online(self, user_id: str) -> bool:
-        """Check if user is currently online"""
-        return user_id in self.active_connections
+        """Check if user is currently online (on any worker)"""
+        return self.presence.is_online(user_id)
+    
+    def stats(self) -> dict:
+        """Local connection counts and backplane counters of this worker"""
+        connections = [connection for devices in self.active_connections.values() for connection in devices]
+        return {
+            "worker_id": self.worker_id,
+            "connections": len(connections),
+            "users": len(self.active_connections),
+            "send_queue_size": self.send_queue_size,
+            "slow_consumer_policy": self.slow_consumer_policy,
+            "slow_consumers_closed": self.slow_consumers_closed,
+            "heartbeat_ttl": self.heartbeat_ttl,
+            "expired_connections": self.expired_connections,
+            "presence_flush_ms": self.presence_flush_ms,
+            "typing_coalesced": self.typing_coalesced,
+            "presence": self.presence.stats(),
+            "queues": queue_stats(connections),
+            "backplane": self.backplane.stats(),
+        }
+    
+    async def close(self):
+        """Stop heartbeat expiry, presence deltas and the backplane (application shutdown)"""
+        for task in (self._expiry_task, self._presence_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        self._expiry_task = self._presence_task = None
+        if self._backplane_started:
+            # The other workers drop this worker's users right away
+            for institution_id in list(self.presence.institutions()):
+                await self._publish_presence(institution_id, "bye")
+            await self.backplane.close()
+            self._backplane_started = False
 
 
 # Global connection manager instance
 manager = ConnectionManager()
+# Counters changed by chat messages and read receipts are pushed once committed
+chat_persistence.on_counts = manager.push_message_counts
 
 
-async def get_current_user_from_token(token: str, db: Session) -> User:
+async def get_current_user_from_token(token: str, db: AsyncSession) -> User:
     """
     Validate JWT token and return current user
     
     Used for WebSocket authentication via query parameter
     """
     try:
-        payload = SecurityUtils.decode_token(token)
-        user_id = payload.get("sub")
+        payload = AuthUtils.decode_access_token(token)
+        user_id = payload.get("sub") if payload else None
         
         if not user_id:
             return None
         
-        user = db.query(User).filter(User.id == user_id).first()
-        return user
+        return (await db.execute(select(User).where(User.id == user_id))).scalars().first()
     except Exception as e:
         print(f"Token validation error: {e}")
         return None
@@ -173,6 +426,8 @@ async def get_current_user_from_token(token: str, db: Session) -> User:
 async def chat_endpoint(
     websocket: WebSocket,
     token: str = Query(..., description="JWT authentication token"),
+    presence_epoch: Optional[str] = Query(None, description="Epoch of the presence state the client has"),
+    presence_version: Optional[int] = Query(None, description="Version of the presence state the client has"),
 ):
     """
     WebSocket endpoint for real-time chat
@@ -183,8 +438,16 @@ async def chat_endpoint(
     - chat_message: Send/receive chat messages
     - typing: Typing indicators
     - read_receipt: Message read confirmations
-    - presence: User online/offline status
-    - get_online_users: Request list of online users
+    - presence_delta: Users who came online / went offline since the
+      previous version, batched per institution
+    - get_online_users: Request list of online users (with "epoch" and
+      "version" only the changes since that version)
+    - sync: Stream the messages received after "after" (message id), or
+      after the last acked one, as sync_batch frames
+    - ack: Acknowledge a stored message ("message_id"), advances the
+      delivery cursor used by sync
+    - message_counts: The user's sent/received/unread counters, pushed
+      whenever they change (REST or WebSocket)
     
     **Example Connection:**
     ```javascript
@@ -200,41 +463,57 @@ async def chat_endpoint(
         "priority": "normal"
     }
     ```
+    
+    **Wire format:** JSON text frames by default. Offering the
+    "colaboraedu.chat.msgpack.v1" subprotocol switches the socket to binary
+    MessagePack frames with short keys and numeric types (see
+    app.api.v1.ws.codec), e.g.
+    `new WebSocket(url, ["colaboraedu.chat.msgpack.v1"])`.
+    
+    **Presence:** the client keeps the "epoch" and "version" of the last
+    online_users / presence_delta it applied. A delta whose from_version
+    is not its version (same epoch) means frames were missed: it sends
+    get_online_users with epoch and version (or reconnects with
+    presence_epoch/presence_version) and gets a catch-up delta, or the
+    full list when the server cannot resume.
     """
-    db = next(get_db())
+    current_user = None
+    connection = None
     
     try:
-        # Authenticate user
-        current_user = await get_current_user_from_token(token, db)
+        # Authenticate user (short-lived session, none is held while connected;
+        # messages are written by the chat persistence queue)
+        async with AsyncSessionLocal() as db:
+            current_user = await get_current_user_from_token(token, db)
         
         if not current_user:
             await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Invalid authentication token")
             return
         
-        # Connect user
-        await manager.connect(websocket, current_user.id, current_user.institution_id)
+        # Connect user (JSON, or msgpack when the client offers it)
+        connection = await manager.connect(
+            websocket, current_user.id, current_user.institution_id, negotiate(websocket)
+        )
         
         # Send welcome message
-        await websocket.send_json({
+        connection.send({
             "type": "connected",
             "message": f"Welcome {current_user.full_name}!",
             "user_id": current_user.id,
             "timestamp": datetime.utcnow().isoformat()
         })
         
-        # Send online users list
-        online_users = manager.get_online_users(current_user.institution_id)
-        await websocket.send_json({
-            "type": "online_users",
-            "users": online_users,
-            "count": len(online_users)
-        })
+        # Send online users list (pre-encoded snapshot, or only the
+        # changes when the client resumes a presence version)
+        connection.enqueue(manager.presence_frame(
+            current_user.institution_id, presence_epoch, presence_version, connection.codec
+        ))
         
         # Message loop
         while True:
-            # Receive message
-            data = await websocket.receive_text()
-            message_data = json.loads(data)
+            # Receive message (decoded with the socket's codec)
+            message_data = await connection.codec.receive(websocket)
+            connection.touch()
             
             message_type = message_data.get("type")
             
@@ -242,41 +521,44 @@ async def chat_endpoint(
             if message_type == "chat_message":
                 # Validate recipient
                 recipient_id = message_data.get("recipient_id")
+                content = message_data.get("content")
                 
-                if not recipient_id:
-                    await websocket.send_json({
+                if not recipient_id or not isinstance(recipient_id, str):
+                    connection.send({
                         "type": "error",
                         "message": "recipient_id is required"
                     })
                     continue
                 
-                # Verify recipient exists and is in same institution
-                recipient = db.query(User).filter(
-                    User.id == recipient_id,
-                    User.institution_id == current_user.institution_id
-                ).first()
+                # Checked here so a bad frame never reaches the write batch
+                if not isinstance(content, str) or not content.strip() or len(content) > MAX_CONTENT_LENGTH:
+                    connection.send({
+                        "type": "error",
+                        "message": f"content must be a non-empty string of at most {MAX_CONTENT_LENGTH} characters"
+                    })
+                    continue
                 
-                if not recipient:
-                    await websocket.send_json({
+                # Save message (batched with other sockets; returns once
+                # committed, after the recipient has been validated)
+                try:
+                    message = await chat_persistence.save_message(
+                        current_user.id,
+                        recipient_id,
+                        current_user.institution_id,
+                        content
+                    )
+                except RecipientNotFound:
+                    connection.send({
                         "type": "error",
                         "message": "Recipient not found or not in same institution"
                     })
                     continue
-                
-                # Save message to database
-                message = Message(
-                    sender_id=current_user.id,
-                    recipient_id=recipient_id,
-                    institution_id=current_user.institution_id,
-                    subject=message_data.get("subject", "Chat Message"),
-                    content=message_data.get("content", ""),
-                    priority=message_data.get("priority", "normal"),
-                    created_at=datetime.utcnow()
-                )
-                
-                db.add(message)
-                db.commit()
-                db.refresh(message)
+                except Exception:
+                    connection.send({
+                        "type": "error",
+                        "message": "Message could not be saved"
+                    })
+                    continue
                 
                 # Prepare message for delivery
                 chat_message = {
@@ -286,16 +568,15 @@ async def chat_endpoint(
                     "sender_name": current_user.full_name,
                     "recipient_id": recipient_id,
                     "content": message.content,
-                    "priority": message.priority,
+                    "priority": message_data.get("priority", "normal"),
                     "timestamp": message.created_at.isoformat()
                 }
                 
-                # Send to recipient if online
-                if manager.is_user_online(recipient_id):
-                    await manager.send_personal_message(recipient_id, chat_message)
+                # Deliver to the recipient wherever connected
+                await manager.send_personal_message(recipient_id, chat_message)
                 
                 # Send confirmation to sender
-                await websocket.send_json({
+                connection.send({
                     "type": "message_sent",
                     "message_id": message.id,
                     "recipient_online": manager.is_user_online(recipient_id),
@@ -307,70 +588,74 @@ async def chat_endpoint(
                 recipient_id = message_data.get("recipient_id")
                 is_typing = message_data.get("is_typing", True)
                 
-                if recipient_id and manager.is_user_online(recipient_id):
+                if recipient_id and manager.should_send_typing(current_user.id, recipient_id, is_typing):
                     await manager.send_personal_message(recipient_id, {
                         "type": "typing",
                         "user_id": current_user.id,
                         "user_name": current_user.full_name,
                         "is_typing": is_typing
-                    })
+                    }, droppable=True)
             
             elif message_type == "read_receipt":
                 # Message read confirmation
                 message_id = message_data.get("message_id")
                 
-                if message_id:
-                    # Update message as read
-                    msg = db.query(Message).filter(
-                        Message.id == message_id,
-                        Message.recipient_id == current_user.id
-                    ).first()
+                if message_id and isinstance(message_id, str):
+                    # Update message as read (coalesced into the batch's bulk UPDATE)
+                    receipt = await chat_persistence.mark_read(message_id, current_user.id)
                     
-                    if msg:
-                        msg.read = True
-                        msg.read_at = datetime.utcnow()
-                        db.commit()
-                        
+                    if receipt:
                         # Notify sender
-                        if manager.is_user_online(msg.sender_id):
-                            await manager.send_personal_message(msg.sender_id, {
-                                "type": "read_receipt",
-                                "message_id": message_id,
-                                "read_by": current_user.id,
-                                "read_at": msg.read_at.isoformat()
-                            })
+                        await manager.send_personal_message(receipt.sender_id, {
+                            "type": "read_receipt",
+                            "message_id": message_id,
+                            "read_by": current_user.id,
+                            "read_at": receipt.read_at.isoformat()
+                        })
+            
+            elif message_type == "sync":
+                # Catch up on messages received while offline (streamed next
+                # to this loop, so pings still keep the socket alive)
+                connection.run_in_background(stream_sync(connection, message_data.get("after")))
+            
+            elif message_type == "ack":
+                # Advance the delivery cursor (batched with other sockets)
+                message_id = message_data.get("message_id")
+                
+                if message_id and isinstance(message_id, str):
+                    await chat_persistence.ack(current_user.id, message_id)
             
             elif message_type == "get_online_users":
-                # Request online users
-                online_users = manager.get_online_users(current_user.institution_id)
-                await websocket.send_json({
-                    "type": "online_users",
-                    "users": online_users,
-                    "count": len(online_users)
-                })
+                # Request online users (cached until presence changes)
+                connection.enqueue(manager.presence_frame(
+                    current_user.institution_id,
+                    message_data.get("epoch"),
+                    message_data.get("version"),
+                    connection.codec
+                ))
             
             elif message_type == "ping":
-                # Keepalive ping
-                await websocket.send_json({
+                # Keepalive ping (heartbeat, keeps the socket from expiring)
+                connection.send({
                     "type": "pong",
                     "timestamp": datetime.utcnow().isoformat()
                 })
             
             else:
                 # Unknown message type
-                await websocket.send_json({
+                connection.send({
                     "type": "error",
                     "message": f"Unknown message type: {message_type}"
                 })
     
     except WebSocketDisconnect:
-        await manager.disconnect(current_user.id)
-        print(f"User {current_user.full_name} disconnected")
+        # Without a connection (connect failed) there is nothing of this
+        # socket to remove; disconnect(user_id, None) would close every device
+        if connection is not None:
+            await manager.disconnect(current_user.id, connection)
+        print(f"User {current_user.full_name if current_user else 'unknown'} disconnected")
     
     except Exception as e:
         print(f"WebSocket error: {e}")
-        if current_user:
-            await manager.disconnect(current_user.id)
-    
-    finally:
-        db.close()
+        if current_user and connection is not None:
+            await manager.disconnect(current_user.id, connection)
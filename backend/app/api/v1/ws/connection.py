@@ -0,0 +1,273 @@
+"""
+Per-socket send queue for the chat WebSocket
+
+Every connection gets a bounded queue of pre-serialized frames drained by
+its own writer task, so a broadcast only enqueues (the message is encoded
+once per wire format for the whole room) and a slow client never delays
+the others. When a
+queue is full the slow-consumer policy applies (CHAT_SLOW_CONSUMER_POLICY):
+
+- "drop_oldest": drop the oldest droppable frame (presence, typing); if
+  every queued frame must be delivered, the socket is closed
+- "disconnect": close the socket, the client reconnects and resyncs
+
+Frames with a coalescing key (typing indicator of a given user, message
+counters) replace the pending frame with the same key instead of queueing
+another one.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Coroutine, Deque, Dict, Hashable, List, Optional
+
+from fastapi import WebSocket, status
+
+from app.api.v1.ws.codec import JSON, Codec, Frame
+
+logger = logging.getLogger(__name__)
+
+DROP_OLDEST = "drop_oldest"
+DISCONNECT = "disconnect"
+
+
+def coalesce_key(message: Dict[str, Any]) -> Optional[Hashable]:
+    """Key under which a newer frame supersedes a pending one"""
+    message_type = message.get("type")
+    if message_type == "typing":
+        return ("typing", message.get("user_id"))
+    if message_type == "message_counts":
+        return ("message_counts",)
+    return None
+
+
+class _Frame:
+    __slots__ = ("data", "key", "droppable")
+
+    def __init__(self, data: Frame, key: Optional[Hashable], droppable: bool):
+        self.data = data
+        self.key = key
+        self.droppable = droppable
+
+
+class ClientConnection:
+    """One accepted socket, its bounded send queue and writer task"""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        user_id: str,
+        institution_id: str,
+        max_queue: int = 256,
+        policy: str = DROP_OLDEST,
+        on_failure: Optional[Callable[["ClientConnection"], Awaitable[None]]] = None,
+        codec: Codec = JSON,
+    ):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.institution_id = institution_id
+        self.max_queue = max_queue
+        self.policy = policy
+        self.on_failure = on_failure
+        # Wire format negotiated for this socket (JSON text or msgpack binary)
+        self.codec = codec
+
+        self._queue: Deque[_Frame] = deque()
+        self._pending: Dict[Hashable, _Frame] = {}
+        self._wakeup = asyncio.Event()
+        # Set whenever the writer takes a frame (see wait_for_room)
+        self._room = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+        # Long producer (sync) running next to the receive loop
+        self._background: Optional[asyncio.Task] = None
+        self.closed = False
+        self.slow_consumer = False
+        # Monotonic time of the last frame received from the client
+        self.last_heartbeat = time.monotonic()
+
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def touch(self) -> None:
+        """Record a frame (ping or any other) from the client"""
+        self.last_heartbeat = time.monotonic()
+
+    def start(self) -> None:
+        self._writer = asyncio.create_task(self._run())
+
+    def run_in_background(self, coroutine: Coroutine) -> None:
+        """
+        Run a long producer (sync) without blocking the receive loop
+
+        Pings keep being read (and the socket touched) while it streams. A
+        new one replaces the previous one; close() cancels it.
+        """
+        self._cancel_background()
+        self._background = asyncio.create_task(self._guarded(coroutine))
+
+    async def _guarded(self, coroutine: Coroutine) -> None:
+        try:
+            await coroutine
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Chat background task of {self.user_id} failed: {e}")
+
+    def _cancel_background(self) -> None:
+        background, self._background = self._background, None
+        if background is not None and not background.done():
+            background.cancel()
+
+    def send(self, message: Dict[str, Any], droppable: bool = False) -> bool:
+        """Queue a message for this socket (encodes it with the socket's codec)"""
+        return self.enqueue(self.codec.encode(message), coalesce_key(message) if droppable else None, droppable)
+
+    def enqueue(self, data: Frame, key: Optional[Hashable] = None, droppable: bool = False) -> bool:
+        """
+        Queue a frame encoded with this socket's codec without waiting
+        for the socket
+
+        Returns False when the frame was not queued (connection closed or
+        closed now as a slow consumer).
+        """
+        if self.closed:
+            return False
+
+        if key is not None:
+            pending = self._pending.get(key)
+            if pending is not None:
+                pending.data = data
+                self.coalesced += 1
+                return True
+
+        if len(self._queue) >= self.max_queue and not self._make_room():
+            self._close_slow_consumer()
+            return False
+
+        frame = _Frame(data, key, droppable)
+        self._queue.append(frame)
+        if key is not None:
+            self._pending[key] = frame
+        self.max_depth = max(self.max_depth, len(self._queue))
+        self._wakeup.set()
+        return True
+
+    async def wait_for_room(self, limit: Optional[int] = None) -> bool:
+        """
+        Wait until at most limit frames are queued (half the queue by default)
+        
+        For producers of long non-droppable streams (sync), so they follow
+        the client's pace instead of overflowing the queue. False when the
+        connection is closed.
+        """
+        limit = self.max_queue // 2 if limit is None else limit
+        while len(self._queue) > limit and not self.closed:
+            self._room.clear()
+            await self._room.wait()
+        return not self.closed
+
+    def _make_room(self) -> bool:
+        if self.policy != DROP_OLDEST:
+            return False
+        for frame in self._queue:
+            if frame.droppable:
+                self._queue.remove(frame)
+                self._forget(frame)
+                self.dropped += 1
+                return True
+        return False
+
+    def _forget(self, frame: _Frame) -> None:
+        if frame.key is not None and self._pending.get(frame.key) is frame:
+            del self._pending[frame.key]
+
+    def _close_slow_consumer(self) -> None:
+        logger.warning(f"Closing slow chat consumer {self.user_id} ({len(self._queue)} frames queued)")
+        self.slow_consumer = True
+        self.dropped += len(self._queue)
+        self._fail()
+        asyncio.create_task(self.close_socket(status.WS_1013_TRY_AGAIN_LATER))
+
+    async def close_socket(self, code: int) -> None:
+        """Close the WebSocket itself (errors ignored, the peer may be gone)"""
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+    def _fail(self) -> None:
+        """Stop accepting frames and let the manager unregister the socket"""
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.clear()
+        self._pending.clear()
+        self._room.set()
+        if self.on_failure is not None:
+            asyncio.create_task(self.on_failure(self))
+
+    async def _run(self) -> None:
+        try:
+            while True:
+                while not self._queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                frame = self._queue.popleft()
+                self._forget(frame)
+                self._room.set()
+                if isinstance(frame.data, bytes):
+                    await self.websocket.send_bytes(frame.data)
+                else:
+                    await self.websocket.send_text(frame.data)
+                self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info(f"Chat send to {self.user_id} failed: {e}")
+            self._fail()
+
+    async def close(self) -> None:
+        """Stop the writer and any background producer (pending frames are discarded)"""
+        self.closed = True
+        self._room.set()
+        self._cancel_background()
+        writer, self._writer = self._writer, None
+        if writer is not None and writer is not asyncio.current_task():
+            writer.cancel()
+            try:
+                await writer
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "user_id": self.user_id,
+            "depth": len(self._queue),
+            "max_depth": self.max_depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
+
+
+def queue_stats(connections: List[ClientConnection], slowest: int = 5) -> Dict[str, Any]:
+    """Aggregate queue-depth metrics of a set of connections"""
+    depths = [connection.depth for connection in connections]
+    return {
+        "queued_frames": sum(depths),
+        "max_depth": max(depths, default=0),
+        "sent": sum(connection.sent for connection in connections),
+        "dropped": sum(connection.dropped for connection in connections),
+        "coalesced": sum(connection.coalesced for connection in connections),
+        "slowest": [
+            connection.stats()
+            for connection in sorted(connections, key=lambda c: c.depth, reverse=True)[:slowest]
+            if connection.depth
+        ],
+    }
@@ -0,0 +1,154 @@
+"""
+Offline delivery for the chat WebSocket
+
+Messages are stored whether or not the recipient is connected; a client
+catches up with a "sync" message instead of paging the REST list:
+
+- the start position is the message id the client sends ("after"), else
+  the user's delivery cursor (last acked message), else the oldest unread
+  message
+- everything after it is streamed as "sync_batch" frames of
+  CHAT_SYNC_BATCH_SIZE messages, one keyset range scan on
+  idx_messages_recipient_keyset (recipient_id, created_at, id) per batch
+  and a short-lived session each, pacing itself on the socket's send queue
+- the client acks the last message it stored ({"type": "ack"}), which
+  advances the cursor through the write-behind queue
+
+After a network blip a reconnecting client costs one indexed range scan
+instead of OFFSET pages.
+"""
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import literal, select, tuple_
+
+from app.api.v1.ws.connection import ClientConnection
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.message import Message, MessageDeliveryCursor
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SyncPosition:
+    created_at: datetime
+    message_id: str
+    # True to include the message itself (start at the oldest unread)
+    inclusive: bool = False
+
+
+async def start_position(db, user_id: str, after: Optional[str] = None) -> Optional[SyncPosition]:
+    """Where a sync of user_id starts, None when there is nothing to catch up"""
+    if after:
+        row = (await db.execute(
+            select(Message.created_at, Message.id)
+            .where(Message.id == after, Message.recipient_id == user_id)
+        )).first()
+        if row is not None:
+            return SyncPosition(row.created_at, row.id)
+
+    cursor = await db.get(MessageDeliveryCursor, user_id)
+    if cursor is not None:
+        return SyncPosition(cursor.last_created_at, cursor.last_message_id)
+
+    row = (await db.execute(
+        select(Message.created_at, Message.id)
+        .where(Message.recipient_id == user_id, Message.read == False)
+        .order_by(Message.created_at, Message.id)
+        .limit(1)
+    )).first()
+    if row is not None:
+        return SyncPosition(row.created_at, row.id, inclusive=True)
+    return None
+
+
+def sync_batch_query(user_id: str, position: SyncPosition, limit: int):
+    """Next messages of user_id after position, in (created_at, id) order"""
+    key = tuple_(Message.created_at, Message.id)
+    bound = tuple_(
+        literal(position.created_at, Message.created_at.type),
+        literal(position.message_id, Message.id.type),
+    )
+    return (
+        select(
+            Message.id,
+            Message.sender_id,
+            Message.content,
+            Message.file_url,
+            Message.read,
+            Message.created_at,
+        )
+        .where(
+            Message.recipient_id == user_id,
+            Message.deleted_at.is_(None),
+            key >= bound if position.inclusive else key > bound,
+        )
+        .order_by(Message.created_at, Message.id)
+        .limit(limit)
+    )
+
+
+def compact_message(row) -> Dict[str, Any]:
+    message = {
+        "message_id": row.id,
+        "sender_id": row.sender_id,
+        "content": row.content,
+        "read": row.read,
+        "timestamp": row.created_at.isoformat(),
+    }
+    if row.file_url:
+        message["file_url"] = row.file_url
+    return message
+
+
+async def stream_sync(
+    connection: ClientConnection,
+    after: Optional[str] = None,
+    batch_size: Optional[int] = None,
+    session_factory=AsyncSessionLocal,
+) -> int:
+    """
+    Stream the user's messages after the start position to the connection
+
+    Returns how many messages were queued. The last frame has "more":
+    false; its "cursor" is the id the client acks once stored.
+    """
+    batch_size = batch_size or settings.chat_sync_batch_size
+    user_id = connection.user_id
+
+    async with session_factory() as db:
+        position = await start_position(db, user_id, after)
+    if position is None:
+        connection.send({"type": "sync_batch", "messages": [], "more": False, "cursor": None})
+        return 0
+
+    total = 0
+    while True:
+        async with session_factory() as db:
+            rows: List[Any] = (await db.execute(sync_batch_query(user_id, position, batch_size + 1))).all()
+
+        more = len(rows) > batch_size
+        rows = rows[:batch_size]
+        if rows:
+            last = rows[-1]
+            position = SyncPosition(last.created_at, last.id)
+        total += len(rows)
+
+        if not connection.send({
+            "type": "sync_batch",
+            "messages": [compact_message(row) for row in rows],
+            "more": more,
+            "cursor": None if position.inclusive else position.message_id,
+        }):
+            break
+        if not more:
+            break
+        # Follow the client's pace instead of overflowing its send queue
+        if not await connection.wait_for_room():
+            break
+
+    logger.debug(f"Synced {total} messages to {user_id}")
+    return total
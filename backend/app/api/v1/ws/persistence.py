@@ -0,0 +1,412 @@
+"""
+Write-behind persistence for chat WebSocket messages
+
+Incoming chat messages and read receipts from every socket of the worker
+are grouped into micro-batches (CHAT_WRITE_BATCH_SIZE items or
+CHAT_WRITE_BATCH_MS milliseconds, whichever comes first) and written with
+one short-lived session per batch:
+
+- one IN query validates the recipients of every message in the batch
+- one multi-row INSERT stores the messages, one upsert adds them to the
+  conversation summaries
+- one bulk UPDATE marks every message read in the batch (receipts for the
+  same message are coalesced), and unread counts drop once per
+  conversation
+- acks move each user's delivery cursor to the newest acked message (one
+  lookup of the acked messages, one of the cursors, bulk insert/update)
+- one commit, after which each caller's future resolves and the changed
+  message counters are read once and handed to on_counts (pushed to the
+  users' sockets)
+
+Callers await their future, so the sender is acked (and the recipient
+gets the message) only once the batch is durable. No session stays open
+for the lifetime of a socket. Messages are timestamped when submitted,
+strictly increasing, so (created_at, id) follows submit order within a
+batch too. If a batch fails, its items are retried one by one and only
+the failing ones get the error.
+"""
+import asyncio
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from uuid import uuid4
+
+from sqlalchemy import insert, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.message import Message, MessageDeliveryCursor
+from app.models.user import User
+from app.services.conversations import adjust_unread, record_messages
+from app.services.message_counters import MessageCounts, get_counts
+
+logger = logging.getLogger(__name__)
+
+
+class RecipientNotFound(Exception):
+    """Recipient does not exist or belongs to another institution"""
+
+
+@dataclass
+class StoredMessage:
+    id: str
+    sender_id: str
+    recipient_id: str
+    institution_id: str
+    content: str
+    created_at: datetime
+
+
+@dataclass
+class ReadReceipt:
+    message_id: str
+    sender_id: str
+    read_at: datetime
+
+
+@dataclass
+class _PendingMessage:
+    sender_id: str
+    recipient_id: str
+    institution_id: str
+    content: str
+    created_at: datetime
+    future: asyncio.Future
+
+
+@dataclass
+class _PendingReceipt:
+    message_id: str
+    reader_id: str
+    future: asyncio.Future
+
+
+@dataclass
+class _PendingAck:
+    user_id: str
+    message_id: str
+    future: asyncio.Future
+
+
+class ChatPersistenceQueue:
+    """Micro-batching writer for chat messages and read receipts"""
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        batch_size: Optional[int] = None,
+        batch_ms: Optional[int] = None,
+    ):
+        self.session_factory = session_factory
+        # Called with the counters of the users a batch changed
+        self.on_counts: Optional[Callable[[Dict[str, MessageCounts]], Awaitable[None]]] = None
+        self.batch_size = batch_size or settings.chat_write_batch_size
+        self.batch_ms = batch_ms if batch_ms is not None else settings.chat_write_batch_ms
+
+        self._pending: List[Any] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._full: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._last_created_at = datetime.min
+
+        self.batches = 0
+        self.messages_written = 0
+        self.receipts_written = 0
+        self.receipts_coalesced = 0
+        self.cursors_advanced = 0
+        self.acks_coalesced = 0
+        self.failed_batches = 0
+        self.failed_items = 0
+        self.max_batch = 0
+
+    def _ensure_flusher(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._flusher is None or self._flusher.done() or self._loop is not loop:
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._full = asyncio.Event()
+            self._flusher = asyncio.create_task(self._run())
+
+    def _submit(self, item) -> asyncio.Future:
+        self._ensure_flusher()
+        self._pending.append(item)
+        self._wakeup.set()
+        if len(self._pending) >= self.batch_size:
+            self._full.set()
+        return item.future
+
+    def _next_created_at(self) -> datetime:
+        """Now, or 1 µs after the previous message if the clock has not moved"""
+        now = datetime.utcnow()
+        if now <= self._last_created_at:
+            now = self._last_created_at + timedelta(microseconds=1)
+        self._last_created_at = now
+        return now
+
+    async def save_message(
+        self, sender_id: str, recipient_id: str, institution_id: str, content: str
+    ) -> StoredMessage:
+        """Store a chat message, returns once it is committed (raises RecipientNotFound)"""
+        future = asyncio.get_running_loop().create_future()
+        return await self._submit(_PendingMessage(
+            sender_id, recipient_id, institution_id, content, self._next_created_at(), future
+        ))
+
+    async def mark_read(self, message_id: str, reader_id: str) -> Optional[ReadReceipt]:
+        """Mark a message addressed to reader_id as read (None if it is not theirs)"""
+        future = asyncio.get_running_loop().create_future()
+        return await self._submit(_PendingReceipt(message_id, reader_id, future))
+
+    async def ack(self, user_id: str, message_id: str) -> bool:
+        """Advance the user's delivery cursor to a message addressed to them (False if not theirs)"""
+        future = asyncio.get_running_loop().create_future()
+        return await self._submit(_PendingAck(user_id, message_id, future))
+
+    async def _run(self) -> None:
+        while True:
+            while not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            # Give other sockets batch_ms to join the batch (unless it fills up)
+            if len(self._pending) < self.batch_size and self.batch_ms:
+                self._full.clear()
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.batch_ms / 1000)
+                except asyncio.TimeoutError:
+                    pass
+
+            batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Any]) -> None:
+        messages = [item for item in batch if isinstance(item, _PendingMessage)]
+        receipts = [item for item in batch if isinstance(item, _PendingReceipt)]
+        acks = [item for item in batch if isinstance(item, _PendingAck)]
+        try:
+            async with self.session_factory() as db:
+                stored = await self._write_messages(db, messages)
+                read = await self._write_receipts(db, receipts)
+                acked = await self._write_acks(db, acks)
+                await db.commit()
+                counts = await self._changed_counts(db, stored, read)
+        except Exception as e:
+            if len(batch) > 1:
+                # Isolate the bad item(s): the others still get written
+                self.failed_batches += 1
+                logger.warning(f"Chat batch of {len(batch)} items failed, retrying one by one: {e}")
+                for item in batch:
+                    await self._flush([item])
+                return
+            self.failed_items += 1
+            logger.error(f"Chat {type(batch[0]).__name__} failed: {e}")
+            if not batch[0].future.done():
+                batch[0].future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.max_batch = max(self.max_batch, len(batch))
+        for item, result in zip(messages, stored):
+            if item.future.done():
+                continue
+            if result is None:
+                item.future.set_exception(RecipientNotFound(item.recipient_id))
+            else:
+                item.future.set_result(result)
+        for item in receipts:
+            if not item.future.done():
+                item.future.set_result(read.get((item.message_id, item.reader_id)))
+        for item in acks:
+            if not item.future.done():
+                item.future.set_result((item.user_id, item.message_id) in acked)
+        if counts:
+            try:
+                await self.on_counts(counts)
+            except Exception as e:
+                logger.warning(f"Message counters push failed: {e}")
+
+    async def _changed_counts(
+        self, db: AsyncSession, stored: List[Optional[StoredMessage]], read: Dict[Tuple[str, str], ReadReceipt]
+    ) -> Dict[str, MessageCounts]:
+        """Committed counters of the senders, recipients and readers of a batch (after the commit)"""
+        if self.on_counts is None:
+            return {}
+        user_ids = {reader_id for _, reader_id in read}
+        for message in stored:
+            if message is not None:
+                user_ids.update((message.sender_id, message.recipient_id))
+        try:
+            return await get_counts(db, user_ids, backfill=False)
+        except Exception as e:
+            # The batch is committed; only the push is lost
+            logger.warning(f"Message counters of the batch not read: {e}")
+            return {}
+
+    async def _write_messages(self, db: AsyncSession, items: List[_PendingMessage]) -> List[Optional[StoredMessage]]:
+        if not items:
+            return []
+        recipients = set(await db.execute(
+            select(User.id, User.institution_id).where(User.id.in_({item.recipient_id for item in items}))
+        ))
+
+        stored: List[Optional[StoredMessage]] = []
+        for item in items:
+            if (item.recipient_id, item.institution_id) not in recipients:
+                stored.append(None)
+                continue
+            stored.append(StoredMessage(
+                id=str(uuid4()),
+                sender_id=item.sender_id,
+                recipient_id=item.recipient_id,
+                institution_id=item.institution_id,
+                content=item.content,
+                created_at=item.created_at,
+            ))
+
+        rows = [
+            {
+                "id": message.id,
+                "institution_id": message.institution_id,
+                "sender_id": message.sender_id,
+                "recipient_id": message.recipient_id,
+                "content": message.content,
+                "read": False,
+                "created_at": message.created_at,
+                "updated_at": message.created_at,
+            }
+            for message in stored if message is not None
+        ]
+        if rows:
+            await db.execute(insert(Message), rows)
+            await record_messages(db, [message for message in stored if message is not None])
+            self.messages_written += len(rows)
+        return stored
+
+    async def _write_receipts(
+        self, db: AsyncSession, items: List[_PendingReceipt]
+    ) -> Dict[Tuple[str, str], ReadReceipt]:
+        pairs = {(item.message_id, item.reader_id) for item in items}
+        if not pairs:
+            return {}
+        self.receipts_coalesced += len(items) - len(pairs)
+
+        found = (await db.execute(
+            select(Message.id, Message.recipient_id, Message.sender_id, Message.read, Message.read_at)
+            .where(tuple_(Message.id, Message.recipient_id).in_(list(pairs)))
+        )).all()
+
+        now = datetime.utcnow()
+        unread = [row for row in found if not row.read]
+        if unread:
+            await db.execute(
+                update(Message)
+                .where(Message.id.in_([row.id for row in unread]))
+                .values(read=True, read_at=now, updated_at=now)
+            )
+            read_from = Counter((row.recipient_id, row.sender_id) for row in unread)
+            await adjust_unread(db, {conversation: -count for conversation, count in read_from.items()})
+            self.receipts_written += len(unread)
+
+        return {
+            (row.id, row.recipient_id): ReadReceipt(
+                message_id=row.id,
+                sender_id=row.sender_id,
+                read_at=row.read_at if row.read and row.read_at else now,
+            )
+            for row in found
+        }
+
+    async def _write_acks(self, db: AsyncSession, items: List[_PendingAck]) -> Set[Tuple[str, str]]:
+        if not items:
+            return set()
+        found = {
+            row.id: row
+            for row in await db.execute(
+                select(Message.id, Message.recipient_id, Message.created_at)
+                .where(Message.id.in_({item.message_id for item in items}))
+            )
+        }
+
+        # Newest acked position per user (acks of older messages change nothing)
+        acked: Set[Tuple[str, str]] = set()
+        newest: Dict[str, Tuple[datetime, str]] = {}
+        for item in items:
+            row = found.get(item.message_id)
+            if row is None or row.recipient_id != item.user_id:
+                continue
+            acked.add((item.user_id, item.message_id))
+            position = (row.created_at, row.id)
+            if item.user_id not in newest or position > newest[item.user_id]:
+                newest[item.user_id] = position
+        self.acks_coalesced += len(acked) - len(newest)
+        if not newest:
+            return acked
+
+        current = {
+            row.user_id: (row.last_created_at, row.last_message_id)
+            for row in await db.execute(
+                select(
+                    MessageDeliveryCursor.user_id,
+                    MessageDeliveryCursor.last_created_at,
+                    MessageDeliveryCursor.last_message_id,
+                ).where(MessageDeliveryCursor.user_id.in_(list(newest)))
+            )
+        }
+        now = datetime.utcnow()
+        rows = [
+            {"user_id": user_id, "last_created_at": created_at, "last_message_id": message_id, "updated_at": now}
+            for user_id, (created_at, message_id) in newest.items()
+            if user_id not in current or (created_at, message_id) > current[user_id]
+        ]
+        inserts = [row for row in rows if row["user_id"] not in current]
+        updates = [row for row in rows if row["user_id"] in current]
+        try:
+            # A cursor created meanwhile by another worker only loses this advance
+            async with db.begin_nested():
+                if inserts:
+                    await db.execute(insert(MessageDeliveryCursor), inserts)
+                if updates:
+                    await db.execute(update(MessageDeliveryCursor), updates)
+        except IntegrityError as e:
+            logger.warning(f"Delivery cursor write skipped: {e}")
+            return acked
+        self.cursors_advanced += len(rows)
+        return acked
+
+    async def close(self) -> None:
+        """Write what is pending and stop the flusher"""
+        if self._pending:
+            batch, self._pending = self._pending, []
+            await self._flush(batch)
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._flusher = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batch_size": self.batch_size,
+            "batch_ms": self.batch_ms,
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "max_batch": self.max_batch,
+            "messages_written": self.messages_written,
+            "receipts_written": self.receipts_written,
+            "receipts_coalesced": self.receipts_coalesced,
+            "cursors_advanced": self.cursors_advanced,
+            "acks_coalesced": self.acks_coalesced,
+            "failed_batches": self.failed_batches,
+            "failed_items": self.failed_items,
+        }
+
+
+# Global chat persistence queue instance
+chat_persistence = ChatPersistenceQueue()
@@ -0,0 +1,419 @@
+"""
+Chat presence
+
+Tracks who is online per institution, counting each user's open sockets
+on this worker (several tabs or devices keep one user online until the last
+closes), and when offline users were last seen in an LRU-bounded store
+(CHAT_LAST_SEEN_MAX_ENTRIES), so memory does not grow with every user who
+ever connected. Sockets that stop sending frames (the client's "ping"
+heartbeat) for CHAT_HEARTBEAT_TTL_SECONDS are expired by the
+ConnectionManager.
+
+Joins and leaves are not broadcast one by one: they accumulate per
+institution and flush() turns them into one "presence_delta" frame every
+CHAT_PRESENCE_FLUSH_MS (a user who connects and leaves within the interval
+produces nothing). Each flush advances the institution's version by one,
+and the published online list ("online_users" snapshot, encoded once per
+version and wire format) is the state as of the last flush, so a client
+that got snapshot V can apply deltas V -> V+1 -> ... in order. A client that missed deltas
+(reconnect, dropped frame) resumes by sending back the epoch and version
+it has: the last CHAT_PRESENCE_HISTORY deltas are merged into one
+catch-up delta, older versions (or another epoch: a different worker or a
+restart) get the full snapshot.
+
+With several workers, every worker keeps its own epoch and versions and
+only sends its deltas to its own sockets. What crosses the backplane are
+the raw joins and leaves of each worker's sockets (take_changes()), which
+the other workers merge with apply_remote() into their own state: a user
+online on any worker is online, and leaves only when the last worker
+holding them reports it. A worker that stops reporting for the heartbeat
+TTL (crashed) has its users expired with expire_remote().
+"""
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+import time
+from datetime import datetime
+from typing import Any, Deque, Dict, KeysView, List, Optional, Tuple
+from uuid import uuid4
+
+from app.api.v1.ws.codec import JSON, Codec, Frame
+
+JOINED = "joined"
+LEFT = "left"
+
+
+@dataclass
+class _OnlineUser:
+    institution_id: str
+    devices: int
+    since: str
+
+
+@dataclass
+class _RemoteWorker:
+    # user_id -> ISO time the user came online on that worker
+    users: Dict[str, str]
+    heard_at: float
+
+
+@dataclass
+class _Delta:
+    version: int
+    joined: List[Dict[str, Any]]
+    left: List[Dict[str, Any]]
+
+
+class PresenceService:
+    """Online users per institution, batched presence deltas and last-seen times"""
+
+    def __init__(self, last_seen_max: int = 10000, history_size: int = 64, epoch: Optional[str] = None):
+        self.last_seen_max = last_seen_max
+        self.history_size = history_size
+        # Versions are only comparable within one epoch (worker lifetime)
+        self.epoch = epoch or uuid4().hex
+
+        # Live state: users with a socket on this worker
+        self._online: Dict[str, _OnlineUser] = {}
+        self._rooms: Dict[str, Dict[str, _OnlineUser]] = {}
+        # user_id -> ISO time the user went offline, least recently seen first
+        self._last_seen: "OrderedDict[str, str]" = OrderedDict()
+
+        # Users with a socket on other workers: institution_id -> {worker_id: _RemoteWorker},
+        # and on how many other workers each of them is
+        self._remote: Dict[str, Dict[str, _RemoteWorker]] = {}
+        self._remote_workers: Dict[str, int] = {}
+
+        # Net changes since the last flush: institution_id -> {user_id: JOINED|LEFT}
+        self._pending: Dict[str, Dict[str, str]] = {}
+        # Net changes of this worker's sockets not yet sent to the other workers
+        self._outgoing: Dict[str, Dict[str, str]] = {}
+
+        # Published state (as of the last flush) and its recent deltas
+        self._published: Dict[str, Dict[str, str]] = {}
+        self._versions: Dict[str, int] = {}
+        self._history: Dict[str, Deque[_Delta]] = {}
+        # institution_id -> (version, online_users message, {codec name: frame})
+        self._snapshots: Dict[str, Tuple[int, Dict[str, Any], Dict[str, Frame]]] = {}
+
+        self.snapshot_builds = 0
+        self.deltas_flushed = 0
+        self.changes_cancelled = 0
+        self.resumed = 0
+        self.remote_expired = 0
+
+    def version(self, institution_id: str) -> int:
+        return self._versions.get(institution_id, 0)
+
+    def _record(self, institution_id: str, user_id: str, change: str, changes: Optional[Dict] = None) -> None:
+        if changes is None:
+            changes = self._pending
+        pending = changes.setdefault(institution_id, {})
+        if user_id in pending:
+            # Joined and left (or left and came back) within one interval
+            del pending[user_id]
+            if changes is self._pending:
+                self.changes_cancelled += 1
+        else:
+            pending[user_id] = change
+
+    def user_connected(self, institution_id: str, user_id: str) -> bool:
+        """Count a new socket of the user, True when the user just came online on this worker"""
+        entry = self._online.get(user_id)
+        if entry is not None:
+            entry.devices += 1
+            return False
+        entry = _OnlineUser(institution_id, 1, datetime.utcnow().isoformat())
+        self._online[user_id] = entry
+        self._rooms.setdefault(institution_id, {})[user_id] = entry
+        self._record(institution_id, user_id, JOINED, self._outgoing)
+        if user_id not in self._remote_workers:
+            self._last_seen.pop(user_id, None)
+            self._record(institution_id, user_id, JOINED)
+        return True
+
+    def user_disconnected(self, user_id: str) -> bool:
+        """Drop one socket of the user, True when the user just went offline on this worker"""
+        entry = self._online.get(user_id)
+        if entry is None:
+            return False
+        entry.devices -= 1
+        if entry.devices > 0:
+            return False
+
+        del self._online[user_id]
+        room = self._rooms.get(entry.institution_id)
+        if room is not None:
+            room.pop(user_id, None)
+            if not room:
+                del self._rooms[entry.institution_id]
+        self._record(entry.institution_id, user_id, LEFT, self._outgoing)
+        if user_id not in self._remote_workers:
+            self._remember(user_id, datetime.utcnow().isoformat())
+            self._record(entry.institution_id, user_id, LEFT)
+        return True
+
+    def take_changes(self) -> List[Tuple[str, List[Dict[str, Any]], List[Dict[str, Any]]]]:
+        """(institution_id, joined, left) of this worker's sockets since the last call, for the other workers"""
+        outgoing, self._outgoing = self._outgoing, {}
+        changes = []
+        for institution_id, users in outgoing.items():
+            if not users:
+                continue
+            joined, left = [], []
+            for user_id, change in users.items():
+                if change == JOINED:
+                    joined.append({"user_id": user_id, "last_seen": self._online[user_id].since})
+                else:
+                    left.append({"user_id": user_id, "last_seen": self._last_seen.get(user_id)})
+            changes.append((institution_id, joined, left))
+        return changes
+
+    def local_state(self, institution_id: str) -> List[Dict[str, Any]]:
+        """Users of the institution with a socket on this worker, as joined entries for the other workers"""
+        return [
+            {"user_id": user_id, "last_seen": entry.since}
+            for user_id, entry in self._rooms.get(institution_id, {}).items()
+        ]
+
+    def apply_remote(
+        self,
+        worker_id: str,
+        institution_id: str,
+        joined: List[Dict[str, Any]],
+        left: List[Dict[str, Any]],
+        full_state: bool = False,
+    ) -> None:
+        """
+        Merge the joins and leaves of another worker's sockets
+
+        With full_state, joined is everything the worker holds in the
+        institution and users missing from it left.
+        """
+        workers = self._remote.setdefault(institution_id, {})
+        worker = workers.get(worker_id)
+        if worker is None:
+            worker = workers[worker_id] = _RemoteWorker({}, time.monotonic())
+        worker.heard_at = time.monotonic()
+        if full_state:
+            current = {entry["user_id"] for entry in joined}
+            for user_id in [user_id for user_id in worker.users if user_id not in current]:
+                self._remote_leave(institution_id, worker, user_id, None)
+        for entry in joined:
+            self._remote_join(institution_id, worker, entry["user_id"], entry.get("last_seen"))
+        for entry in left:
+            self._remote_leave(institution_id, worker, entry["user_id"], entry.get("last_seen"))
+        if not worker.users:
+            del workers[worker_id]
+            if not workers:
+                del self._remote[institution_id]
+
+    def _remote_join(self, institution_id: str, worker: _RemoteWorker, user_id: str, since: Optional[str]) -> None:
+        if user_id in worker.users:
+            return
+        worker.users[user_id] = since or datetime.utcnow().isoformat()
+        self._remote_workers[user_id] = self._remote_workers.get(user_id, 0) + 1
+        if self._remote_workers[user_id] == 1 and user_id not in self._online:
+            self._last_seen.pop(user_id, None)
+            self._record(institution_id, user_id, JOINED)
+
+    def _remote_leave(self, institution_id: str, worker: _RemoteWorker, user_id: str, seen_at: Optional[str]) -> None:
+        if worker.users.pop(user_id, None) is None:
+            return
+        self._remote_workers[user_id] -= 1
+        if self._remote_workers[user_id] > 0:
+            return
+        del self._remote_workers[user_id]
+        if user_id not in self._online:
+            self._remember(user_id, seen_at or datetime.utcnow().isoformat())
+            self._record(institution_id, user_id, LEFT)
+
+    def forget_remote(self, institution_id: str, worker_id: Optional[str] = None) -> None:
+        """Drop what another worker (every other worker without worker_id) reported for the institution"""
+        workers = self._remote.get(institution_id, {})
+        for remote_id in [worker_id] if worker_id is not None else list(workers):
+            if remote_id in workers:
+                self.apply_remote(remote_id, institution_id, [], [], full_state=True)
+
+    def expire_remote(self, ttl: float) -> int:
+        """Forget workers not heard from for ttl seconds (crashed), returns how many"""
+        cutoff = time.monotonic() - ttl
+        silent = [
+            (institution_id, worker_id)
+            for institution_id, workers in self._remote.items()
+            for worker_id, worker in workers.items()
+            if worker.heard_at < cutoff
+        ]
+        for institution_id, worker_id in silent:
+            self.forget_remote(institution_id, worker_id)
+        self.remote_expired += len(silent)
+        return len(silent)
+
+    def _since(self, institution_id: str, user_id: str) -> str:
+        """When the user came online (on this worker, else the earliest other worker)"""
+        entry = self._online.get(user_id)
+        if entry is not None:
+            return entry.since
+        return min(
+            worker.users[user_id]
+            for worker in self._remote.get(institution_id, {}).values()
+            if user_id in worker.users
+        )
+
+    def _remember(self, user_id: str, seen_at: str) -> None:
+        self._last_seen[user_id] = seen_at
+        self._last_seen.move_to_end(user_id)
+        while len(self._last_seen) > self.last_seen_max:
+            self._last_seen.popitem(last=False)
+
+    def members(self, institution_id: str) -> KeysView[str]:
+        """User ids of the institution with a socket on this worker (live)"""
+        return self._rooms.get(institution_id, {}).keys()
+
+    def institutions(self) -> KeysView[str]:
+        """Institutions with a socket on this worker"""
+        return self._rooms.keys()
+
+    def is_online(self, user_id: str) -> bool:
+        """Online on any worker"""
+        return user_id in self._online or user_id in self._remote_workers
+
+    def devices(self, user_id: str) -> int:
+        entry = self._online.get(user_id)
+        return entry.devices if entry else 0
+
+    def last_seen(self, user_id: str) -> Optional[str]:
+        """Now for online users, the disconnect time for recently seen ones"""
+        if self.is_online(user_id):
+            return datetime.utcnow().isoformat()
+        return self._last_seen.get(user_id)
+
+    def flush(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """Publish the pending changes, one presence_delta per changed institution"""
+        pending, self._pending = self._pending, {}
+        deltas = []
+        for institution_id, changes in pending.items():
+            if not changes:
+                continue
+            published = self._published.setdefault(institution_id, {})
+            joined, left = [], []
+            for user_id, change in changes.items():
+                if change == JOINED:
+                    since = self._since(institution_id, user_id)
+                    published[user_id] = since
+                    joined.append({"user_id": user_id, "status": "online", "last_seen": since})
+                else:
+                    published.pop(user_id, None)
+                    left.append({"user_id": user_id, "last_seen": self._last_seen.get(user_id)})
+
+            version = self.version(institution_id) + 1
+            self._versions[institution_id] = version
+            self._history.setdefault(institution_id, deque(maxlen=self.history_size)).append(
+                _Delta(version, joined, left)
+            )
+            deltas.append((institution_id, self._delta_message(version - 1, version, joined, left)))
+            self.deltas_flushed += 1
+        return deltas
+
+    def _delta_message(
+        self, from_version: int, version: int, joined: List[Dict[str, Any]], left: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        return {
+            "type": "presence_delta",
+            "epoch": self.epoch,
+            "from_version": from_version,
+            "version": version,
+            "joined": joined,
+            "left": left,
+        }
+
+    def _snapshot(self, institution_id: str) -> Tuple[int, Dict[str, Any], Dict[str, Frame]]:
+        version = self.version(institution_id)
+        cached = self._snapshots.get(institution_id)
+        if cached is not None and cached[0] == version:
+            return cached
+
+        users = [
+            {"user_id": user_id, "status": "online", "last_seen": since}
+            for user_id, since in self._published.get(institution_id, {}).items()
+        ]
+        message = {
+            "type": "online_users",
+            "users": users,
+            "count": len(users),
+            "epoch": self.epoch,
+            "version": version,
+        }
+        cached = (version, message, {})
+        self._snapshots[institution_id] = cached
+        self.snapshot_builds += 1
+        return cached
+
+    def online_users(self, institution_id: str) -> List[Dict[str, Any]]:
+        """Online users of the institution as of the last flush (shared cached list, do not modify)"""
+        return self._snapshot(institution_id)[1]["users"]
+
+    def online_users_frame(self, institution_id: str, codec: Codec = JSON) -> Frame:
+        """Encoded "online_users" frame of the institution"""
+        _, message, frames = self._snapshot(institution_id)
+        frame = frames.get(codec.name)
+        if frame is None:
+            frame = frames[codec.name] = codec.encode(message)
+        return frame
+
+    def resume(self, institution_id: str, epoch: Optional[str], version: Optional[int]) -> Optional[Dict[str, Any]]:
+        """Catch-up presence_delta from version to the current one, None if history does not reach back"""
+        if epoch != self.epoch or version is None:
+            return None
+        current = self.version(institution_id)
+        if version == current:
+            return self._delta_message(version, current, [], [])
+        history = self._history.get(institution_id)
+        if version > current or not history or history[0].version > version + 1:
+            return None
+
+        # user_id -> (first change, last change, last entry)
+        changes: Dict[str, Tuple[str, str, Dict[str, Any]]] = {}
+        for delta in history:
+            if delta.version <= version:
+                continue
+            for change, entries in ((JOINED, delta.joined), (LEFT, delta.left)):
+                for entry in entries:
+                    user_id = entry["user_id"]
+                    first = changes[user_id][0] if user_id in changes else change
+                    changes[user_id] = (first, change, entry)
+
+        joined, left = [], []
+        for first, last, entry in changes.values():
+            if first == JOINED and last == LEFT:
+                # Came and went after the client's version
+                continue
+            (joined if last == JOINED else left).append(entry)
+        self.resumed += 1
+        return self._delta_message(version, current, joined, left)
+
+    def sync_frame(
+        self, institution_id: str, epoch: Optional[str] = None, version: Optional[int] = None, codec: Codec = JSON
+    ) -> Frame:
+        """Encoded catch-up delta when the client can resume, else the full snapshot"""
+        delta = self.resume(institution_id, epoch, version)
+        if delta is not None:
+            return codec.encode(delta)
+        return self.online_users_frame(institution_id, codec)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "epoch": self.epoch,
+            "online_users": len(self._online),
+            "devices": sum(entry.devices for entry in self._online.values()),
+            "institutions": len(self._rooms),
+            "remote_users": len(self._remote_workers),
+            "remote_workers": len({worker_id for workers in self._remote.values() for worker_id in workers}),
+            "remote_expired": self.remote_expired,
+            "pending_changes": sum(len(changes) for changes in self._pending.values()),
+            "last_seen_entries": len(self._last_seen),
+            "last_seen_max": self.last_seen_max,
+            "snapshot_builds": self.snapshot_builds,
+            "deltas_flushed": self.deltas_flushed,
+            "changes_cancelled": self.changes_cancelled,
+            "resumed": self.resumed,
+        }
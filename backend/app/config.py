@@ -18,14 +18,100 @@ class Settings(BaseSettings):
     host: str = "192.168.10.178"
     port: int = 8004
     reload: bool = True
+    # WebSocket permessage-deflate (smaller JSON frames for more CPU per frame)
+    ws_per_message_deflate: bool = True
     
     # Database  
     database_url: str = "sqlite:///./colaboraedu.db"
+    async_database_url: Optional[str] = None  # Derived from database_url when empty
     database_echo: bool = False
     
+    # Read replica (optional, used by GET-heavy endpoints)
+    database_replica_url: Optional[str] = None
+    async_database_replica_url: Optional[str] = None  # Derived from database_replica_url when empty
+    database_replica_pin_after_write: bool = True  # Reads after a write in the same request use the primary
+    
+    # Connection pool (per engine, per worker)
+    database_pool_size: int = 5
+    database_max_overflow: int = 10
+    database_pool_timeout: int = 30  # seconds waiting for a free connection
+    database_pool_pre_ping: bool = True
+    database_pool_recycle: int = 3600
+    
+    # SQLite tuning (applied on every new connection)
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_mmap_size: int = 256 * 1024 * 1024  # 256MB
+    sqlite_busy_timeout_ms: int = 5000
+    
     # Redis
     redis_url: str = "redis://localhost:6379/0"
     
+    # Authenticated-principal cache (get_current_user). A role/status change
+    # or deletion is seen by every worker at once with the "redis" backend or
+    # with broadcast (memory backend, invalidations over Redis pub/sub at
+    # redis_url); otherwise other workers serve the old user for up to
+    # principal_cache_ttl_seconds, so startup refuses "memory" without
+    # broadcast when WEB_CONCURRENCY > 1. The TTL also bounds staleness when
+    # Redis is unreachable.
+    principal_cache_enabled: bool = True
+    principal_cache_backend: str = "memory"  # "memory" or "redis" (uses redis_url)
+    principal_cache_broadcast: bool = False
+    principal_cache_ttl_seconds: int = 60
+    principal_cache_max_size: int = 10000
+    
+    # Assignment submission counts ("aggregate" = grouped COUNT per request,
+    # "table" = incrementally maintained assignment_submission_counters rows)
+    assignment_counts_backend: str = "aggregate"
+    
+    # Class attendance statistics read from attendance_daily_rollups
+    # (kept up to date by the attendance endpoints when enabled)
+    attendance_rollup_enabled: bool = False
+    
+    # Chat WebSocket fan-out across workers ("memory" = single process,
+    # "redis" = pub/sub at redis_url)
+    chat_backplane: str = "memory"
+    
+    # Chat per-socket send queue (frames) and what happens when it is full
+    # ("drop_oldest" = drop presence/typing frames first, "disconnect")
+    chat_send_queue_size: int = 256
+    chat_slow_consumer_policy: str = "drop_oldest"
+    
+    # Chat message write-behind: a batch is written when it reaches this
+    # many items or after this many milliseconds
+    chat_write_batch_size: int = 200
+    chat_write_batch_ms: int = 10
+    
+    # Chat presence: sockets silent (no ping or other frame) for this many
+    # seconds are expired; last-seen times kept for this many offline users
+    chat_heartbeat_ttl_seconds: int = 90
+    chat_last_seen_max_entries: int = 10000
+    
+    # Chat presence deltas: joins/leaves are broadcast once per interval,
+    # the last chat_presence_history deltas can be resumed by clients
+    chat_presence_flush_ms: int = 500
+    chat_presence_history: int = 64
+    
+    # Chat typing indicator: the same state is forwarded at most once per interval
+    chat_typing_interval_ms: int = 2000
+    
+    # Chat sync: messages per sync_batch frame
+    chat_sync_batch_size: int = 100
+    
+    # Chat msgpack subprotocol (binary frames with short keys) for clients
+    # that offer it; JSON stays the default
+    chat_msgpack_enabled: bool = True
+    
+    # Message counters (stats badge): minutes between reconciliations with
+    # the messages table, 0 disables the job
+    message_counters_reconcile_minutes: int = 60
+    
+    # Message search ("fulltext" = SQLite FTS5 / PostgreSQL tsvector index,
+    # "like" = unindexed ILIKE scan) and the PostgreSQL text search
+    # configuration (stemming and stop words)
+    message_search_backend: str = "fulltext"
+    message_search_language: str = "portuguese"
+    
     # JWT
     secret_key: str = "your-super-secret-jwt-key-change-in-production"
     algorithm: str = "HS256"
@@ -52,6 +138,27 @@ class Settings(BaseSettings):
     max_file_size: int = 10 * 1024 * 1024  # 10MB
     upload_path: str = "./uploads"
     
+    # PDF bulletin extraction queue (pdf_processing_jobs table). Workers run
+    # from scripts/pdf_worker.py; pdf_worker_embedded also runs one inside
+    # the API process (development only, OCR competes with requests)
+    pdf_worker_embedded: bool = False
+    pdf_worker_concurrency: int = 2  # jobs at once per worker process
+    pdf_worker_poll_seconds: float = 1.0
+    pdf_jobs_per_user_limit: int = 2  # running jobs per user, 0 = no limit
+    pdf_job_max_attempts: int = 3
+    pdf_job_retry_seconds: int = 30  # first retry delay, doubled per attempt
+    pdf_job_lease_seconds: int = 300  # processing jobs without a heartbeat this long are requeued
+    # Processes for PDF parsing/OCR per worker process, 0 = one per CPU core
+    pdf_process_workers: int = 0
+    # OCR runs only on pages with images and fewer characters of text than
+    # this; pdf_ocr_dpi is the resolution for A4, scaled for other sizes
+    pdf_ocr_page_min_chars: int = 20
+    pdf_ocr_dpi: int = 300
+    # Extraction results by PDF SHA-256 (pdf_extraction_cache table): a
+    # re-uploaded bulletin completes without parsing, OCR or Gemini
+    pdf_cache_enabled: bool = True
+    pdf_cache_max_mb: int = 512  # least recently used entries evicted past this
+    
     # Email (for notifications)
     smtp_server: str = ""
     smtp_port: int = 587
@@ -0,0 +1,254 @@
+"""
+Pagination helpers: OFFSET/LIMIT and keyset (cursor) modes
+
+Keyset mode orders by (created_at, id) and continues from the last row
+seen, so deep pages cost one index range scan instead of skipping OFFSET
+rows. Cursors are opaque base64 tokens; clients just echo
+pagination.next_cursor / prev_cursor back as ?cursor=.
+"""
+import base64
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import func, literal, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.schemas.common import PaginationInfo, PaginationParams
+
+
+@dataclass
+class Cursor:
+    """Decoded keyset position"""
+
+    created_at: datetime
+    id: str
+    direction: str  # "next" or "prev"
+
+
+def encode_cursor(created_at: datetime, row_id: Any, direction: str = "next") -> str:
+    payload = json.dumps({"c": created_at.isoformat(), "i": str(row_id), "d": direction})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        direction = payload.get("d", "next")
+        if direction not in ("next", "prev"):
+            raise ValueError(direction)
+        return Cursor(
+            created_at=datetime.fromisoformat(payload["c"]),
+            id=payload["i"],
+            direction=direction,
+        )
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor"
+        )
+
+
+class KeysetPaginator:
+    """
+    Builds and post-processes one page for a (created_at, id) ordering
+
+    Works on both legacy Query objects and 2.0 select() statements, the
+    caller executes the statement with its own (sync or async) session.
+    With keyset=False (custom sort requested) the query keeps its own
+    ordering, pages by OFFSET only and emits no cursors.
+    """
+
+    def __init__(
+        self,
+        params: PaginationParams,
+        created_column,
+        id_column,
+        descending: bool = True,
+        keyset: bool = True,
+    ):
+        self.params = params
+        self.created_column = created_column
+        self.id_column = id_column
+        self.descending = descending
+        self.keyset = keyset
+        self.cursor = decode_cursor(params.cursor) if params.cursor else None
+        if self.cursor is not None and not keyset:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Cursor pagination is only available with the default sort order"
+            )
+
+    @property
+    def is_keyset(self) -> bool:
+        return self.cursor is not None
+
+    def _ordered(self, query, descending: bool):
+        if descending:
+            return query.order_by(self.created_column.desc(), self.id_column.desc())
+        return query.order_by(self.created_column.asc(), self.id_column.asc())
+
+    def _position(self, row) -> Tuple[datetime, Any]:
+        return getattr(row, self.created_column.key), getattr(row, self.id_column.key)
+
+    def apply(self, query):
+        """Add ordering, keyset predicate and LIMIT page_size + 1"""
+        page_size = self.params.page_size
+        if not self.keyset:
+            return query.offset(self.params.offset).limit(page_size + 1)
+
+        query = query.order_by(None)
+        if self.cursor is None:
+            query = self._ordered(query, self.descending)
+            return query.offset(self.params.offset).limit(page_size + 1)
+
+        key = tuple_(self.created_column, self.id_column)
+        position = tuple_(
+            literal(self.cursor.created_at, self.created_column.type),
+            literal(self.cursor.id, self.id_column.type),
+        )
+        # Walking backwards flips both the comparison and the scan order
+        forward = self.cursor.direction == "next"
+        scan_descending = self.descending == forward
+        query = query.filter(key < position if scan_descending else key > position)
+        return self._ordered(query, scan_descending).limit(page_size + 1)
+
+    def page(self, rows: List[Any]) -> Tuple[List[Any], Optional[str], Optional[str], bool, bool]:
+        """Trim the look-ahead row and compute cursors and has_next/has_previous"""
+        page_size = self.params.page_size
+        has_more = len(rows) > page_size
+        rows = list(rows[:page_size])
+
+        if self.cursor is None:
+            has_next = has_more
+            has_previous = self.params.page > 1
+        elif self.cursor.direction == "next":
+            has_next = has_more
+            has_previous = True
+        else:
+            rows.reverse()
+            has_next = True
+            has_previous = has_more
+
+        next_cursor = prev_cursor = None
+        if not self.keyset:
+            return rows, next_cursor, prev_cursor, has_next, has_previous
+        if rows and has_next:
+            last = rows[-1]
+            next_cursor = encode_cursor(*self._position(last), "next")
+        if rows and has_previous:
+            first = rows[0]
+            prev_cursor = encode_cursor(*self._position(first), "prev")
+        return rows, next_cursor, prev_cursor, has_next, has_previous
+
+    def info(
+        self,
+        rows: List[Any],
+        total: Optional[int],
+        next_cursor: Optional[str],
+        prev_cursor: Optional[str],
+        has_next: bool,
+        has_previous: bool,
+        total_is_estimate: bool = False,
+    ) -> PaginationInfo:
+        if total is None:
+            # Lower bound when no estimate is available
+            seen = self.params.offset if self.cursor is None else 0
+            total = seen + len(rows) + (1 if has_next else 0)
+            total_is_estimate = True
+        return PaginationInfo.create(
+            page=self.params.page if self.cursor is None else 1,
+            page_size=self.params.page_size,
+            total=total,
+            next_cursor=next_cursor,
+            prev_cursor=prev_cursor,
+            has_next=has_next,
+            has_previous=has_previous,
+            total_is_estimate=total_is_estimate,
+        )
+
+
+def _explain_estimate_sql(statement, dialect) -> Optional[str]:
+    """EXPLAIN statement for planner row estimates (PostgreSQL only)"""
+    if dialect.name != "postgresql":
+        return None
+    try:
+        compiled = statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True})
+    except Exception:
+        return None
+    return f"EXPLAIN (FORMAT JSON) {compiled}"
+
+
+def _plan_rows(plan: Any) -> Optional[int]:
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    try:
+        return int(plan[0]["Plan"]["Plan Rows"])
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+
+
+def paginate_query(
+    query,
+    params: PaginationParams,
+    created_column,
+    id_column,
+    descending: bool = True,
+    keyset: bool = True,
+):
+    """
+    Paginate a sync ORM Query
+
+    Returns (items, PaginationInfo). With params.exact_total false the
+    COUNT(*) is skipped and total is a planner estimate (PostgreSQL) or a
+    lower bound.
+    """
+    paginator = KeysetPaginator(params, created_column, id_column, descending, keyset)
+    rows, next_cursor, prev_cursor, has_next, has_previous = paginator.page(
+        paginator.apply(query).all()
+    )
+
+    total = None
+    total_is_estimate = False
+    if params.exact_total:
+        total = query.order_by(None).count()
+    else:
+        sql = _explain_estimate_sql(query.order_by(None).statement, query.session.get_bind().dialect)
+        if sql:
+            total = _plan_rows(query.session.execute(text(sql)).scalar())
+            total_is_estimate = True
+
+    return rows, paginator.info(rows, total, next_cursor, prev_cursor, has_next, has_previous, total_is_estimate)
+
+
+async def paginate_select(
+    db: AsyncSession,
+    statement,
+    params: PaginationParams,
+    created_column,
+    id_column,
+    descending: bool = True,
+    keyset: bool = True,
+):
+    """Async counterpart of paginate_query for select() statements"""
+    paginator = KeysetPaginator(params, created_column, id_column, descending, keyset)
+    result = await db.execute(paginator.apply(statement))
+    rows, next_cursor, prev_cursor, has_next, has_previous = paginator.page(
+        result.unique().scalars().all()
+    )
+
+    total = None
+    total_is_estimate = False
+    base = statement.order_by(None)
+    if params.exact_total:
+        total = await db.scalar(select(func.count()).select_from(base.subquery()))
+    else:
+        sql = _explain_estimate_sql(base, db.get_bind().dialect)
+        if sql:
+            total = _plan_rows((await db.execute(text(sql))).scalar())
+            total_is_estimate = True
+
+    return rows, paginator.info(rows, total, next_cursor, prev_cursor, has_next, has_previous, total_is_estimate)
@@ -0,0 +1,279 @@
+"""
+Authenticated-principal cache for get_current_user
+
+Caches a column snapshot of the authenticated User keyed by
+(user_id, institution_id, token iat), so repeated requests with the same
+token skip the User lookup. In-process TTL/LRU by default, Redis when
+PRINCIPAL_CACHE_BACKEND=redis (shared across workers).
+
+An in-process cache only sees the invalidations of its own worker. With
+several workers either use the Redis backend or set
+PRINCIPAL_CACHE_BROADCAST=true, which publishes invalidations on Redis
+pub/sub so every worker drops the user; start() refuses an in-process
+cache without broadcast when WEB_CONCURRENCY > 1. Whatever the setup, a
+missed invalidation (e.g. Redis down) is served for at most
+PRINCIPAL_CACHE_TTL_SECONDS.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Set
+
+from sqlalchemy import DateTime
+
+from app.config import settings
+from app.models import User
+
+try:
+    import redis.asyncio as aioredis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Columns never copied into the cache (and never sent to Redis)
+EXCLUDED_COLUMNS = {"password_hash", "fcm_token"}
+# Pub/sub channel of broadcast invalidations (payload: user id)
+INVALIDATION_CHANNEL = "principal:invalidate"
+
+
+class PrincipalCache:
+    """
+    TTL/LRU cache of authenticated principals
+
+    Entries are invalidated per user (any token) when users.py changes a
+    user's role or status, or soft deletes it.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: int = 60,
+        max_size: int = 10000,
+        redis_url: Optional[str] = None,
+        broadcast_url: Optional[str] = None,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+
+        # key -> (expires_at, snapshot), most recently used last
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # user_id -> keys cached for that user (one per token)
+        self._user_keys: Dict[str, Set[str]] = {}
+
+        self._redis = None
+        if redis_url and REDIS_AVAILABLE:
+            self._redis = aioredis.from_url(redis_url, decode_responses=True)
+        elif redis_url:
+            logger.warning("redis package not installed, principal cache stays in-process")
+
+        # In-process cache: invalidations published to the other workers
+        self._broadcast = None
+        self._listener: Optional[asyncio.Task] = None
+        if self._redis is None and broadcast_url:
+            if REDIS_AVAILABLE:
+                self._broadcast = aioredis.from_url(broadcast_url, decode_responses=True)
+            else:
+                logger.warning("redis package not installed, principal cache invalidations stay in this worker")
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    async def start(self) -> None:
+        """Listen for broadcast invalidations (application startup)"""
+        if self._broadcast is not None:
+            if self._listener is None:
+                pubsub = self._broadcast.pubsub()
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                self._listener = asyncio.create_task(self._listen(pubsub))
+            return
+        workers = int(os.environ.get("WEB_CONCURRENCY", "1") or 1)
+        if self._redis is None and settings.principal_cache_enabled and workers > 1:
+            raise RuntimeError(
+                f"In-process principal cache with WEB_CONCURRENCY={workers}: role and status changes "
+                f"would only reach one worker. Set PRINCIPAL_CACHE_BACKEND=redis or "
+                f"PRINCIPAL_CACHE_BROADCAST=true (or PRINCIPAL_CACHE_ENABLED=false)"
+            )
+
+    async def _listen(self, pubsub) -> None:
+        try:
+            while True:
+                try:
+                    async for message in pubsub.listen():
+                        if message.get("type") == "message":
+                            self._drop_user(message["data"])
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.errors += 1
+                    logger.warning(f"Principal cache invalidation listener error, retrying: {e}")
+                    await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
+
+    async def close(self) -> None:
+        """Stop listening for broadcast invalidations (application shutdown)"""
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+
+    @staticmethod
+    def make_key(user_id: str, institution_id: str, issued_at: Any) -> str:
+        return f"principal:{user_id}:{institution_id}:{issued_at}"
+
+    @staticmethod
+    def _user_index_key(user_id: str) -> str:
+        return f"principal-keys:{user_id}"
+
+    @staticmethod
+    def snapshot(user: User) -> Dict[str, Any]:
+        """Plain column values of a user, safe to keep across sessions"""
+        return {
+            column.key: getattr(user, column.key)
+            for column in User.__table__.columns
+            if column.key not in EXCLUDED_COLUMNS
+        }
+
+    @staticmethod
+    def _to_json(snapshot: Dict[str, Any]) -> str:
+        return json.dumps({
+            key: value.isoformat() if isinstance(value, datetime) else value
+            for key, value in snapshot.items()
+        })
+
+    @staticmethod
+    def _from_json(raw: str) -> Dict[str, Any]:
+        data = json.loads(raw)
+        for column in User.__table__.columns:
+            if isinstance(column.type, DateTime) and data.get(column.key):
+                data[column.key] = datetime.fromisoformat(data[column.key])
+        return data
+
+    async def get(self, user_id: str, institution_id: str, issued_at: Any) -> Optional[User]:
+        """Return a detached User for the token, or None on miss"""
+        key = self.make_key(user_id, institution_id, issued_at)
+        snapshot = None
+
+        if self._redis is not None:
+            try:
+                raw = await self._redis.get(key)
+                snapshot = self._from_json(raw) if raw else None
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Principal cache read failed: {e}")
+        else:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, cached = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    snapshot = cached
+                else:
+                    self._drop(key)
+
+        if snapshot is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return User(**snapshot)
+
+    async def set(self, user: User, issued_at: Any) -> None:
+        """Cache the user loaded for a token"""
+        user_id = str(user.id)
+        key = self.make_key(user_id, str(user.institution_id), issued_at)
+        snapshot = self.snapshot(user)
+
+        if self._redis is not None:
+            try:
+                index_key = self._user_index_key(user_id)
+                async with self._redis.pipeline(transaction=False) as pipe:
+                    pipe.set(key, self._to_json(snapshot), ex=self.ttl_seconds)
+                    pipe.sadd(index_key, key)
+                    pipe.expire(index_key, self.ttl_seconds)
+                    await pipe.execute()
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Principal cache write failed: {e}")
+            return
+
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, snapshot)
+        self._entries.move_to_end(key)
+        self._user_keys.setdefault(user_id, set()).add(key)
+
+        while len(self._entries) > self.max_size:
+            oldest_key = next(iter(self._entries))
+            self._drop(oldest_key)
+
+    async def invalidate_user(self, user_id: str) -> None:
+        """Drop every cached token of a user"""
+        user_id = str(user_id)
+        self.invalidations += 1
+
+        if self._redis is not None:
+            try:
+                index_key = self._user_index_key(user_id)
+                keys = await self._redis.smembers(index_key)
+                await self._redis.delete(index_key, *keys)
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Principal cache invalidation failed: {e}")
+            return
+
+        self._drop_user(user_id)
+        if self._broadcast is not None:
+            try:
+                await self._broadcast.publish(INVALIDATION_CHANNEL, user_id)
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Principal cache invalidation broadcast failed: {e}")
+
+    def _drop_user(self, user_id: str) -> None:
+        for key in list(self._user_keys.get(user_id, ())):
+            self._drop(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._user_keys.clear()
+
+    def _drop(self, key: str) -> None:
+        self._entries.pop(key, None)
+        user_id = key.split(":", 2)[1]
+        keys = self._user_keys.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._user_keys[user_id]
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters (each hit is one User query saved)"""
+        lookups = self.hits + self.misses
+        return {
+            "backend": "redis" if self._redis is not None else "memory",
+            "broadcast": self._broadcast is not None,
+            "enabled": settings.principal_cache_enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+# Global principal cache instance
+principal_cache = PrincipalCache(
+    ttl_seconds=settings.principal_cache_ttl_seconds,
+    max_size=settings.principal_cache_max_size,
+    redis_url=settings.redis_url if settings.principal_cache_backend == "redis" else None,
+    broadcast_url=settings.redis_url if settings.principal_cache_broadcast else None,
+)
@@ -104,4 +104,30 @@ class SecurityUtils:
             # TODO: Implement parent-child relationship check
             return True
         
-        return False
\ No newline at end of file
+        return False
+
+# Minimum role per resource action, checked against SecurityUtils.ROLE_HIERARCHY.
+# Grades: staff read the grades of their institution; students may only read
+# their own (checked per student by the grades endpoints), guardians none
+# until parent-child links exist
+RESOURCE_PERMISSIONS = {
+    "grades": {
+        "read": "professor",
+        "create": "professor",
+        "update": "professor",
+        "delete": "coordenador",
+        "report": "professor",
+    },
+}
+
+
+def get_user_permissions(user_role: str, resource: str, action: str) -> bool:
+    """
+    Check if a role may perform an action on a resource
+    
+    Unknown resources or actions are denied.
+    """
+    required_role = RESOURCE_PERMISSIONS.get(resource, {}).get(action)
+    if required_role is None:
+        return False
+    return SecurityUtils.check_role_permission(user_role, required_role)
@@ -2,20 +2,190 @@
 Database configuration and session management
 Based on SQLAlchemy 2.0+ and technical specifications
 """
-from sqlalchemy import create_engine
+import time
+from sqlalchemy import Select, create_engine, event, exc
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
-from typing import Generator
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from typing import Any, AsyncGenerator, Dict, Generator, Optional
 
 from app.config import settings
 
+# Async drivers used when the URL does not name one explicitly
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def get_async_database_url(database_url: str) -> str:
+    """
+    Derive the async driver URL from a sync database URL
+
+    sqlite:///./colaboraedu.db -> sqlite+aiosqlite:///./colaboraedu.db
+    postgresql://user@host/db  -> postgresql+asyncpg://user@host/db
+    """
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend in ASYNC_DRIVERS and url.drivername in (backend, f"{backend}+psycopg2", f"{backend}+pysqlite"):
+        url = url.set(drivername=ASYNC_DRIVERS[backend])
+    return url.render_as_string(hide_password=False)
+
+
+class PoolMetrics:
+    """Connection wait counters collected by the timed pools"""
+    
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+    
+    def record_wait(self, seconds: float):
+        self.checkouts += 1
+        self.wait_time_total += seconds
+        self.wait_time_max = max(self.wait_time_max, seconds)
+    
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_time_total_ms": round(self.wait_time_total * 1000, 3),
+            "wait_time_avg_ms": round(self.wait_time_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+            "wait_time_max_ms": round(self.wait_time_max * 1000, 3),
+        }
+
+
+class _TimedPoolMixin:
+    """Measures how long each checkout waits for a pooled connection"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+    
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        finally:
+            self.metrics.record_wait(time.perf_counter() - started)
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def _is_sqlite_memory(database_url: str) -> bool:
+    url = make_url(database_url)
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def get_engine_options(database_url: str, is_async: bool = False) -> Dict[str, Any]:
+    """
+    Pool options from settings
+    
+    In-memory SQLite keeps SQLAlchemy's single-connection pool, everything
+    else (including file SQLite under aiosqlite, which would otherwise get
+    NullPool) uses a bounded, timed queue pool.
+    """
+    options = {
+        "echo": settings.database_echo,
+        "pool_pre_ping": settings.database_pool_pre_ping,
+        "pool_recycle": settings.database_pool_recycle,
+    }
+    if _is_sqlite_memory(database_url):
+        return options
+    
+    options.update(
+        poolclass=TimedAsyncAdaptedQueuePool if is_async else TimedQueuePool,
+        pool_size=settings.database_pool_size,
+        max_overflow=settings.database_max_overflow,
+        pool_timeout=settings.database_pool_timeout,
+    )
+    return options
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Per-connection SQLite tuning
+    
+    WAL lets readers proceed while chat/attendance commits are writing,
+    synchronous=NORMAL is durable under WAL with far fewer fsyncs.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.sqlite_journal_mode}")
+    cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+    cursor.close()
+
+
+def configure_engine(target: Engine) -> Engine:
+    """Attach SQLite pragmas to a (sync) engine"""
+    if target.url.get_backend_name() == "sqlite" and not _is_sqlite_memory(str(target.url)):
+        event.listen(target, "connect", apply_sqlite_pragmas)
+    return target
+
+
+def get_pool_status(target: Engine) -> Dict[str, Any]:
+    """Pool occupancy and wait-time metrics for an engine"""
+    pool = target.pool
+    status = {
+        "url": target.url.render_as_string(hide_password=True),
+        "pool_class": type(pool).__name__,
+    }
+    if isinstance(pool, QueuePool):
+        status.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+            max_overflow=pool._max_overflow,
+            timeout=pool.timeout(),
+        )
+    metrics = getattr(pool, "metrics", None)
+    if metrics is not None:
+        status["metrics"] = metrics.as_dict()
+    return status
+
+
 # SQLAlchemy 2.0+ engine with async support ready
-engine = create_engine(
+engine = configure_engine(create_engine(
     settings.database_url,
-    echo=settings.database_echo,
-    pool_pre_ping=True,
-    pool_recycle=3600,
+    **get_engine_options(settings.database_url),
+))
+
+# Async engine for endpoints that must not block the event loop
+_async_database_url = settings.async_database_url or get_async_database_url(settings.database_url)
+async_engine = create_async_engine(
+    _async_database_url,
+    **get_engine_options(_async_database_url, is_async=True),
 )
+configure_engine(async_engine.sync_engine)
+
+# Optional read replica (GET-heavy endpoints read from it via get_read_db)
+replica_engine: Optional[Engine] = None
+async_replica_engine = None
+if settings.database_replica_url:
+    replica_engine = configure_engine(create_engine(
+        settings.database_replica_url,
+        **get_engine_options(settings.database_replica_url),
+    ))
+    _async_replica_url = settings.async_database_replica_url or get_async_database_url(settings.database_replica_url)
+    async_replica_engine = create_async_engine(
+        _async_replica_url,
+        **get_engine_options(_async_replica_url, is_async=True),
+    )
+    configure_engine(async_replica_engine.sync_engine)
 
 # Session factory
 SessionLocal = sessionmaker(
@@ -24,6 +194,71 @@ SessionLocal = sessionmaker(
     bind=engine
 )
 
+# Async session factory (objects stay readable after commit, no implicit IO)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+
+class RoutingSession(Session):
+    """
+    Session that sends plain SELECTs to the read replica
+    
+    Flushes, DML and raw SQL always use the primary. Once the session has
+    written anything it is pinned to the primary for the rest of the request
+    (when database_replica_pin_after_write is on), so a handler reads its own
+    writes. Without a replica every statement goes to the primary.
+    """
+    
+    primary_bind: Optional[Engine] = None
+    replica_bind: Optional[Engine] = None
+    
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if (
+            self.replica_bind is None
+            or self._flushing
+            or self.info.get("pinned_to_primary")
+            or not isinstance(clause, Select)
+        ):
+            return self.primary_bind
+        return self.replica_bind
+    
+    def pin_to_primary(self):
+        """Route every following statement of this session to the primary"""
+        self.info["pinned_to_primary"] = True
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _pin_after_write(session, flush_context):
+    if settings.database_replica_pin_after_write:
+        session.pin_to_primary()
+
+
+class ReadSession(RoutingSession):
+    primary_bind = engine
+    replica_bind = replica_engine
+
+
+class AsyncReadSyncSession(RoutingSession):
+    primary_bind = async_engine.sync_engine
+    replica_bind = async_replica_engine.sync_engine if async_replica_engine else None
+
+
+# Read-routing session factories
+ReadSessionLocal = sessionmaker(
+    class_=ReadSession,
+    autocommit=False,
+    autoflush=False,
+)
+
+AsyncReadSessionLocal = async_sessionmaker(
+    sync_session_class=AsyncReadSyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
 # Base class for all models
 Base = declarative_base()
 
@@ -37,4 +272,34 @@ def get_db() -> Generator[Session, None, None]:
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Dependency to get an async database session
+    Used in FastAPI endpoints via Depends(get_async_db)
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def get_read_db() -> Generator[Session, None, None]:
+    """
+    Dependency for read-mostly GET endpoints
+    Reads go to the replica when one is configured
+    """
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Async dependency for read-mostly GET endpoints
+    Reads go to the replica when one is configured
+    """
+    async with AsyncReadSessionLocal() as db:
+        yield db
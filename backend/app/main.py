@@ -2,6 +2,8 @@
 Main FastAPI application
 colaboraEDU backend API
 """
+import asyncio
+
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
@@ -28,9 +30,30 @@ async def lifespan(app: FastAPI):
     print("🚀 Starting colaboraEDU API...")
     create_tables()
     print("📊 Database tables created/verified")
+    from app.core.principal_cache import principal_cache
+    await principal_cache.start()
+    reconciliation = None
+    if settings.message_counters_reconcile_minutes > 0:
+        from app.services.message_counters import run_reconciliation
+        reconciliation = asyncio.create_task(run_reconciliation(settings.message_counters_reconcile_minutes))
+    pdf_worker = None
+    if settings.pdf_worker_embedded:
+        from app.services.pdf_jobs import PDFJobWorker
+        pdf_worker = asyncio.create_task(PDFJobWorker().run())
     yield
     # Shutdown
     print("🛑 Shutting down colaboraEDU API...")
+    if reconciliation is not None:
+        reconciliation.cancel()
+    if pdf_worker is not None:
+        # Returns its running jobs to the queue
+        pdf_worker.cancel()
+        await asyncio.gather(pdf_worker, return_exceptions=True)
+    from app.api.v1.ws.chat import manager as chat_manager
+    from app.api.v1.ws.persistence import chat_persistence
+    await chat_persistence.close()
+    await chat_manager.close()
+    await principal_cache.close()
 
 
 # Create FastAPI application
@@ -256,11 +279,38 @@ app.include_router(
     }
 )
 
+# Grades router
+from app.api.v1.endpoints import grades
+
+app.include_router(
+    grades.router,
+    prefix="/api/v1/grades",
+    tags=["grades"],
+    responses={
+        401: {"description": "Unauthorized"},
+        403: {"description": "Forbidden"},
+        404: {"description": "Not found"},
+    }
+)
+
 # Import WebSocket chat endpoint
 from app.api.v1.ws.chat import chat_endpoint
 
 app.websocket("/ws/chat")(chat_endpoint)
 
+# Debug router (runtime counters, admin only)
+from app.api.v1.endpoints import debug
+
+app.include_router(
+    debug.router,
+    prefix="/api/v1/debug",
+    tags=["debug"],
+    responses={
+        401: {"description": "Unauthorized"},
+        403: {"description": "Forbidden - Admin only"},
+    }
+)
+
 # PDF Processing router
 from app.api.v1.endpoints import pdf_processing
 
@@ -316,5 +366,6 @@ if __name__ == "__main__":
         host=settings.host,
         port=settings.port,
         reload=settings.reload,
+        ws_per_message_deflate=settings.ws_per_message_deflate,
         log_level="info" if settings.debug else "warning"
     )
\ No newline at end of file
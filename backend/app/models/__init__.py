@@ -8,11 +8,13 @@ from .user import User
 from .student import Student
 from .grade import Grade
 from .occurrence import Occurrence
-from .message import Message
-from .attendance import Attendance
+from .message import Message, MessageDeliveryCursor, MessageCounter, Conversation
+from .attendance import Attendance, AttendanceDailyRollup
 from .academic_parameters import AcademicParameter, GradeLevel, Subject
 from .class_model import Class
-from .assignment import Assignment, AssignmentSubmission
+from .assignment import Assignment, AssignmentSubmission, AssignmentSubmissionCounter
+from .pdf_job import PDFProcessingJob
+from .pdf_cache import PDFExtractionCache
 
 # Export all models for easy importing
 __all__ = [
@@ -23,11 +25,18 @@ __all__ = [
     "Grade", 
     "Occurrence",
     "Message",
+    "MessageDeliveryCursor",
+    "MessageCounter",
+    "Conversation",
     "Attendance",
+    "AttendanceDailyRollup",
     "AcademicParameter",
     "GradeLevel",
     "Subject",
     "Class",
     "Assignment",
     "AssignmentSubmission",
+    "AssignmentSubmissionCounter",
+    "PDFProcessingJob",
+    "PDFExtractionCache",
 ]
\ No newline at end of file
@@ -161,3 +161,24 @@ class AssignmentSubmission(Base):
         if not self.score or not self.assignment.max_score:
             return 0.0
         return (self.score / self.assignment.max_score) * 100
+
+
+class AssignmentSubmissionCounter(Base):
+    """
+    Contadores de submissões por tarefa
+
+    Mantidos incrementalmente pelo SubmissionCountsService a cada submissão
+    ou correção (ASSIGNMENT_COUNTS_BACKEND=table).
+    """
+    __tablename__ = "assignment_submission_counters"
+
+    assignment_id = Column(Integer, ForeignKey("assignments.id", ondelete="CASCADE"), primary_key=True)
+    total = Column(Integer, default=0, nullable=False)
+    pending = Column(Integer, default=0, nullable=False)
+    submitted = Column(Integer, default=0, nullable=False)  # submitted + late
+    graded = Column(Integer, default=0, nullable=False)
+    late = Column(Integer, default=0, nullable=False)  # is_late flag
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<SubmissionCounter {self.assignment_id} - {self.total}>"
@@ -1,11 +1,11 @@
 """
 Attendance model for tracking student presence
 """
-from sqlalchemy import Column, String, Date, Boolean, ForeignKey, Index, Time, Integer
+from sqlalchemy import Column, String, Date, Boolean, ForeignKey, Index, Time, Integer, func, literal_column
 
 from sqlalchemy.orm import relationship
 
-from .base import BaseModel
+from .base import Base, BaseModel
 
 
 class Attendance(BaseModel):
@@ -56,4 +56,43 @@ Index("idx_attendance_date", Attendance.date)
 Index("idx_attendance_present", Attendance.present)
 # Composite index for daily attendance queries
 Index("idx_attendance_daily", Attendance.institution_id, Attendance.date)
-Index("idx_attendance_student_period", Attendance.student_id, Attendance.date, Attendance.period)
\ No newline at end of file
+Index("idx_attendance_student_period", Attendance.student_id, Attendance.date, Attendance.period)
+# One record per student, date, class and period (target of the bulk
+# upsert). The keys are rendered inline so ON CONFLICT matches the index
+# text. Existing databases get the index from
+# scripts/migrate_attendance_unique_index.py.
+ATTENDANCE_CLASS_KEY = func.coalesce(Attendance.class_id, literal_column("0"))
+ATTENDANCE_PERIOD_KEY = func.coalesce(Attendance.period, literal_column("''"))
+Index(
+    "uq_attendance_student_date_class_period",
+    Attendance.student_id, Attendance.date, ATTENDANCE_CLASS_KEY, ATTENDANCE_PERIOD_KEY,
+    unique=True
+)
+# Composite index for class statistics over a date window
+Index("idx_attendance_class_date", Attendance.class_id, Attendance.date, Attendance.student_id)
+
+
+class AttendanceDailyRollup(Base):
+    """
+    Per-student daily attendance totals for a class
+    
+    Precomputed from attendance (all periods of a day collapse into one
+    narrow row) so class statistics over a school year scan the rollup's
+    primary key instead of every attendance record. Maintained by
+    app.services.attendance_stats when ATTENDANCE_ROLLUP_ENABLED is on.
+    """
+    
+    __tablename__ = "attendance_daily_rollups"
+    
+    class_id = Column(Integer, ForeignKey("classes.id", ondelete="CASCADE"), primary_key=True)
+    date = Column(Date, primary_key=True)
+    student_id = Column(String(36), ForeignKey("students.id"), primary_key=True)
+    institution_id = Column(String(36), ForeignKey("institutions.id"), nullable=False)
+    
+    total = Column(Integer, nullable=False, default=0)
+    present = Column(Integer, nullable=False, default=0)
+    absent = Column(Integer, nullable=False, default=0)
+    justified = Column(Integer, nullable=False, default=0)  # justified absences
+    
+    def __repr__(self):
+        return f"<AttendanceDailyRollup(class_id={self.class_id}, date={self.date}, student_id={self.student_id})>"
\ No newline at end of file
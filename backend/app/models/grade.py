@@ -43,4 +43,6 @@ Index("idx_grades_institution_id", Grade.institution_id)
 Index("idx_grades_student_id", Grade.student_id)
 Index("idx_grades_subject", Grade.subject)
 Index("idx_grades_academic_year", Grade.academic_year)
-Index("idx_grades_semester", Grade.semester)
\ No newline at end of file
+Index("idx_grades_semester", Grade.semester)
+# Composite index for keyset pagination of a student's grades
+Index("idx_grades_student_keyset", Grade.student_id, Grade.created_at, Grade.id)
@@ -1,11 +1,13 @@
 """
 Message model for internal communication system
 """
-from sqlalchemy import Column, String, Text, Boolean, DateTime, ForeignKey, Index
+from datetime import datetime
+
+from sqlalchemy import Column, String, Text, Boolean, DateTime, ForeignKey, Index, Integer
 
 from sqlalchemy.orm import relationship
 
-from .base import BaseModel
+from .base import Base, BaseModel
 
 
 class Message(BaseModel):
@@ -44,4 +46,87 @@ Index("idx_messages_recipient_id", Message.recipient_id)
 Index("idx_messages_created_at", Message.created_at)
 Index("idx_messages_read", Message.read)
 # Composite index for conversation queries
-Index("idx_messages_conversation", Message.sender_id, Message.recipient_id, Message.created_at)
\ No newline at end of file
+Index("idx_messages_conversation", Message.sender_id, Message.recipient_id, Message.created_at)
+# Composite index for keyset pagination of message lists
+Index("idx_messages_keyset", Message.institution_id, Message.created_at, Message.id)
+# Composite index for WebSocket sync (one range scan per user from the delivery cursor)
+Index("idx_messages_recipient_keyset", Message.recipient_id, Message.created_at, Message.id)
+
+
+class MessageDeliveryCursor(Base):
+    """
+    Last chat message a user acknowledged over the WebSocket
+    
+    Position (created_at, id) in the user's incoming messages; a "sync"
+    streams every message after it. Advanced by acks through the chat
+    persistence queue, never moved backwards.
+    """
+    
+    __tablename__ = "message_delivery_cursors"
+    
+    user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    last_message_id = Column(String(36), nullable=False)
+    last_created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f"<MessageDeliveryCursor(user_id={self.user_id}, last_message_id={self.last_message_id})>"
+
+
+class MessageCounter(Base):
+    """
+    Per-user message counters behind the stats badge
+    
+    Updated in the same transaction as the message changes (send, read,
+    delete) by app.services.message_counters; a missing row is filled from
+    the messages on the next read, and the reconciliation job repairs drift.
+    """
+    
+    __tablename__ = "message_counters"
+    
+    user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    sent = Column(Integer, default=0, nullable=False)
+    received = Column(Integer, default=0, nullable=False)
+    unread = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f"<MessageCounter(user_id={self.user_id}, unread={self.unread})>"
+
+
+class Conversation(Base):
+    """
+    One participant's summary of a direct conversation
+    
+    Two rows per pair of users (user_id -> peer_id and back), so a user's
+    conversation list is one range scan on idx_conversations_user_activity
+    instead of a GROUP BY over every message. Maintained incrementally by
+    app.services.conversations when messages are sent (REST and WebSocket),
+    read or deleted; scripts/rebuild_conversations.py rebuilds it.
+    """
+    
+    __tablename__ = "conversations"
+    
+    user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    peer_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    institution_id = Column(String(36), ForeignKey("institutions.id"), nullable=False)
+    
+    # Last message exchanged in either direction
+    last_message_id = Column(String(36), nullable=False)
+    last_sender_id = Column(String(36), nullable=False)
+    last_message_preview = Column(String(200), nullable=False, default="")
+    last_message_at = Column(DateTime, nullable=False)
+    
+    # Messages received by user_id and not read yet
+    unread_count = Column(Integer, default=0, nullable=False)
+    message_count = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    
+    peer = relationship("User", foreign_keys=[peer_id])
+    
+    def __repr__(self):
+        return f"<Conversation(user_id={self.user_id}, peer_id={self.peer_id}, unread={self.unread_count})>"
+
+
+# Keyset index for "my conversations by last activity"
+Index("idx_conversations_user_activity", Conversation.user_id, Conversation.last_message_at, Conversation.peer_id)
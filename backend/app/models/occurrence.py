@@ -46,4 +46,6 @@ Index("idx_occurrences_student_id", Occurrence.student_id)
 Index("idx_occurrences_type", Occurrence.type)
 Index("idx_occurrences_severity", Occurrence.severity)
 Index("idx_occurrences_notified", Occurrence.notified)
-Index("idx_occurrences_recorded_by", Occurrence.recorded_by)
\ No newline at end of file
+Index("idx_occurrences_recorded_by", Occurrence.recorded_by)
+# Composite index for keyset pagination of occurrence lists
+Index("idx_occurrences_keyset", Occurrence.institution_id, Occurrence.created_at, Occurrence.id)
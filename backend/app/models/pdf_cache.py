@@ -0,0 +1,43 @@
+"""
+PDF extraction cache model (content-addressed bulletin results)
+"""
+from datetime import datetime
+
+from sqlalchemy import Column, String, Text, Integer, DateTime, Index, JSON
+
+from .base import BaseModel
+
+
+class PDFExtractionCache(BaseModel):
+    """
+    Extraction results of one PDF, keyed by its SHA-256 and the extractor version
+
+    Holds the parsed text and tables (reused when only the structuring step
+    differs, e.g. Gemini turned on) and the final BulletinData of the mode
+    that produced it. Entries are evicted least recently used first once
+    the stored size passes PDF_CACHE_MAX_MB.
+    """
+
+    __tablename__ = "pdf_extraction_cache"
+
+    cache_key = Column(String(100), nullable=False, unique=True)  # sha256:extractor version
+    content_hash = Column(String(64), nullable=False)
+
+    # Parsing and OCR output
+    text = Column(Text, nullable=False)
+    tables = Column(JSON, nullable=False)
+
+    # Structured result and the mode that produced it ("ai" or "regex")
+    bulletin = Column(JSON)
+    bulletin_mode = Column(String(10))
+
+    size = Column(Integer, nullable=False)  # bytes stored, for the size bound
+    hits = Column(Integer, default=0, nullable=False)
+    last_used_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<PDFExtractionCache(key={self.cache_key}, hits={self.hits})>"
+
+
+# Eviction order
+Index("idx_pdf_cache_last_used", PDFExtractionCache.last_used_at)
@@ -0,0 +1,56 @@
+"""
+PDF processing job model (bulletin extraction queue)
+"""
+from datetime import datetime
+
+from sqlalchemy import Column, String, Text, Integer, DateTime, ForeignKey, Index, JSON
+
+from .base import BaseModel
+
+
+class PDFProcessingJob(BaseModel):
+    """
+    Uploaded bulletin PDF waiting for, or done with, data extraction
+
+    The table is the queue: workers (scripts/pdf_worker.py) claim pending
+    jobs by priority, report progress and heartbeats on the row and retry
+    failures with backoff. The PDF itself stays under UPLOAD_PATH until
+    the job reaches a final state.
+    """
+
+    __tablename__ = "pdf_processing_jobs"
+
+    user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    institution_id = Column(String(36), ForeignKey("institutions.id"), nullable=True)
+
+    # Upload
+    filename = Column(String(255), nullable=False)
+    size = Column(Integer, nullable=False)
+    file_path = Column(Text, nullable=False)
+
+    # Queue state: pending, processing, completed, failed
+    status = Column(String(20), default="pending", nullable=False)
+    priority = Column(Integer, default=0, nullable=False)  # higher runs first
+    run_after = Column(DateTime, default=datetime.utcnow, nullable=False)  # retry backoff
+    attempts = Column(Integer, default=0, nullable=False)
+    max_attempts = Column(Integer, default=3, nullable=False)
+    worker_id = Column(String(100))
+    heartbeat_at = Column(DateTime)
+
+    # Progress reported by PDFExtractor
+    progress = Column(Integer, default=0, nullable=False)
+    stage = Column(String(50))
+
+    # Result
+    extracted_data = Column(JSON)
+    error_message = Column(Text)
+    started_at = Column(DateTime)
+    completed_at = Column(DateTime)
+
+    def __repr__(self):
+        return f"<PDFProcessingJob(id={self.id}, status={self.status}, progress={self.progress})>"
+
+
+# Next job to claim: pending, by priority then age
+Index("idx_pdf_jobs_queue", PDFProcessingJob.status, PDFProcessingJob.priority, PDFProcessingJob.created_at)
+Index("idx_pdf_jobs_user_created", PDFProcessingJob.user_id, PDFProcessingJob.created_at)
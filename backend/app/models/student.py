@@ -48,4 +48,6 @@ Index("idx_students_institution_id", Student.institution_id)
 Index("idx_students_user_id", Student.user_id)
 Index("idx_students_enrollment", Student.enrollment_number)
 Index("idx_students_current_grade", Student.current_grade)
-Index("idx_students_academic_status", Student.academic_status)
\ No newline at end of file
+Index("idx_students_academic_status", Student.academic_status)
+# Composite index for keyset pagination of student lists
+Index("idx_students_keyset", Student.institution_id, Student.created_at, Student.id)
@@ -58,4 +58,6 @@ class User(BaseModel):
 Index("idx_users_institution_id", User.institution_id)
 Index("idx_users_email", User.email)
 Index("idx_users_role", User.role)
-Index("idx_users_status", User.status)
\ No newline at end of file
+Index("idx_users_status", User.status)
+# Composite index for keyset pagination of user lists
+Index("idx_users_keyset", User.institution_id, User.created_at, User.id)
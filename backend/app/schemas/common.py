@@ -40,11 +40,24 @@ class PaginationParams(BaseModel):
         description="Number of items per page (max 100)",
         example=20
     )
+    cursor: Optional[str] = Field(
+        default=None,
+        description="Opaque cursor from pagination.next_cursor/prev_cursor (keyset mode, page is ignored)"
+    )
+    exact_total: bool = Field(
+        default=True,
+        description="Count the exact total; false skips COUNT(*) and returns an estimate"
+    )
     
     @property
     def offset(self) -> int:
         """Calculate offset for database queries"""
         return (self.page - 1) * self.page_size
+    
+    @property
+    def limit(self) -> int:
+        """Alias of page_size for LIMIT clauses"""
+        return self.page_size
 
 
 class PaginationInfo(BaseModel):
@@ -56,13 +69,21 @@ class PaginationInfo(BaseModel):
     total_pages: int = Field(..., description="Total number of pages")
     has_next: bool = Field(..., description="Whether there is a next page")
     has_previous: bool = Field(..., description="Whether there is a previous page")
+    next_cursor: Optional[str] = Field(None, description="Cursor for the next page (keyset mode)")
+    prev_cursor: Optional[str] = Field(None, description="Cursor for the previous page (keyset mode)")
+    total_is_estimate: bool = Field(default=False, description="Whether total is an estimate")
     
     @classmethod
     def create(
         cls,
         page: int,
         page_size: int,
-        total: int
+        total: int,
+        next_cursor: Optional[str] = None,
+        prev_cursor: Optional[str] = None,
+        has_next: Optional[bool] = None,
+        has_previous: Optional[bool] = None,
+        total_is_estimate: bool = False
     ) -> "PaginationInfo":
         """Create pagination info from parameters"""
         total_pages = (total + page_size - 1) // page_size if total > 0 else 0
@@ -72,8 +93,11 @@ class PaginationInfo(BaseModel):
             page_size=page_size,
             total=total,
             total_pages=total_pages,
-            has_next=page < total_pages,
-            has_previous=page > 1
+            has_next=page < total_pages if has_next is None else has_next,
+            has_previous=page > 1 if has_previous is None else has_previous,
+            next_cursor=next_cursor,
+            prev_cursor=prev_cursor,
+            total_is_estimate=total_is_estimate
         )
 
 
@@ -97,6 +121,11 @@ class PaginatedResponse(BaseModel, Generic[T]):
             data=items,
             pagination=PaginationInfo.create(page, page_size, total)
         )
+    
+    @classmethod
+    def from_info(cls, items: List[T], pagination: PaginationInfo) -> "PaginatedResponse[T]":
+        """Create a paginated response from precomputed (e.g. keyset) pagination info"""
+        return cls(data=items, pagination=pagination)
 
 
 class ApiResponse(BaseModel, Generic[T]):
@@ -85,7 +85,7 @@ class MessageResponse(MessageBase, BaseSchema):
     parent_message_id: Optional[UUID] = Field(None, description="Parent message for threading")
     thread_id: Optional[UUID] = Field(None, description="Thread identifier")
     file_attachments: Optional[List[str]] = Field(None, description="Attached files")
-    priority: str = Field(..., description="Message priority")
+    priority: str = Field(default="normal", description="Message priority")
     read: bool = Field(default=False, description="Read status")
     read_at: Optional[datetime] = Field(None, description="When message was read")
     archived: bool = Field(default=False, description="Archive status")
@@ -99,6 +99,13 @@ class MessageResponse(MessageBase, BaseSchema):
     sender: Optional[Dict[str, Any]] = Field(None, description="Sender information")
     recipient: Optional[Dict[str, Any]] = Field(None, description="Recipient information")
     replies_count: Optional[int] = Field(None, description="Number of replies")
+    
+    @validator('sender', 'recipient', pre=True)
+    def summarize_user(cls, v):
+        # Loaded User relationships become {id, name, role}
+        if v is not None and not isinstance(v, dict):
+            return {"id": str(v.id), "name": v.full_name, "role": v.role}
+        return v
 
 
 class MessageListItem(BaseSchema):
@@ -126,6 +133,11 @@ class MessagesList(BaseModel):
 class MessageFilters(FilterParams):
     """Filters for message queries"""
     
+    folder: Optional[str] = Field(
+        None,
+        pattern="^(inbox|sent)$",
+        description="inbox (received) or sent; both when omitted"
+    )
     sender_id: Optional[UUID] = Field(
         None,
         description="Filter by sender ID"
@@ -138,23 +150,10 @@ class MessageFilters(FilterParams):
         None,
         description="Filter by message type"
     )
-    priority: Optional[str] = Field(
-        None,
-        pattern="^(low|normal|high|urgent)$",
-        description="Filter by priority"
-    )
     read: Optional[bool] = Field(
         None,
         description="Filter by read status"
     )
-    starred: Optional[bool] = Field(
-        None,
-        description="Filter by starred status"
-    )
-    archived: Optional[bool] = Field(
-        None,
-        description="Filter by archived status"
-    )
     date_from: Optional[datetime] = Field(
         None,
         description="Filter messages from this date"
@@ -191,6 +190,34 @@ class ConversationResponse(BaseSchema):
     created_at: datetime = Field(..., description="Conversation start timestamp")
 
 
+class ConversationSummary(BaseSchema):
+    """Entry of the current user's conversation list"""
+    
+    peer_id: UUID = Field(..., description="The other participant")
+    peer_name: str = Field(..., description="Other participant full name")
+    peer_role: str = Field(..., description="Other participant role")
+    last_message_id: UUID = Field(..., description="Last message in either direction")
+    last_sender_id: UUID = Field(..., description="Who sent the last message")
+    last_message_preview: str = Field(..., description="Start of the last message")
+    last_message_at: datetime = Field(..., description="Last activity timestamp")
+    unread_count: int = Field(..., description="Messages from the peer not read yet")
+    message_count: int = Field(..., description="Messages in the conversation")
+
+
+class MessageSearchHit(BaseSchema):
+    """Message matching a full-text search, best match first"""
+
+    id: UUID = Field(..., description="Message ID")
+    sender_id: UUID = Field(..., description="Sender user ID")
+    sender_name: str = Field(..., description="Sender full name")
+    recipient_id: UUID = Field(..., description="Recipient user ID")
+    recipient_name: str = Field(..., description="Recipient full name")
+    read: bool = Field(..., description="Whether the recipient read it")
+    created_at: datetime = Field(..., description="Sent at")
+    snippet: str = Field(..., description="Matching excerpt, matches wrapped in <mark></mark>")
+    rank: float = Field(..., description="Relevance (higher is better)")
+
+
 class MessageStats(BaseModel):
     """Message statistics for user/institution"""
     
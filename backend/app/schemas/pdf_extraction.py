@@ -126,12 +126,26 @@ class PDFProcessingStatus(BaseModel):
     filename: str
     status: str  # pending, processing, completed, failed
     progress: int = Field(default=0, ge=0, le=100, description="Progresso em %")
+    stage: Optional[str] = Field(None, description="Etapa atual: text|ocr|tables|ai|regex|validation")
+    priority: int = Field(default=0, description="Prioridade na fila (maior processa antes)")
+    attempts: int = Field(default=0, description="Tentativas de processamento")
     extracted_data: Optional[BulletinData] = None
     error_message: Optional[str] = None
     created_at: datetime
     completed_at: Optional[datetime] = None
 
 
+class PDFCacheStats(BaseModel):
+    """Cache de extração (PDFs reenviados)"""
+    entries: int
+    size_bytes: int
+    max_bytes: int
+    hits: int = Field(..., description="Envios atendidos pelo cache (resultado final ou texto/tabelas)")
+    misses: int = Field(..., description="Extrações completas armazenadas")
+    hit_rate: float = Field(..., ge=0, le=1, description="hits / (hits + misses), entradas atuais")
+    extractor_version: str
+
+
 class PDFValidationRequest(BaseModel):
     """Requisição para validar dados extraídos"""
     extraction_id: str
@@ -0,0 +1,198 @@
+"""
+Serviço de contagem de submissões por tarefa
+
+Todas as telas de tarefas (listagens, detalhe e estatísticas) usam uma única
+consulta agregada agrupada por assignment_id em vez de um COUNT por status e
+por tarefa. Com ASSIGNMENT_COUNTS_BACKEND=table os números vêm da tabela
+assignment_submission_counters, atualizada incrementalmente a cada submissão
+ou correção (linhas ausentes são preenchidas a partir do agregado).
+"""
+import logging
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import Integer, case, func, select, update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import AssignmentSubmission, AssignmentSubmissionCounter
+from app.models.assignment import SubmissionStatus
+
+logger = logging.getLogger(__name__)
+
+COUNTER_FIELDS = ("total", "pending", "submitted", "graded", "late")
+
+
+@dataclass
+class SubmissionCounts:
+    """Contagem de submissões de uma tarefa"""
+
+    total: int = 0
+    pending: int = 0
+    submitted: int = 0  # entregues, inclusive atrasadas
+    graded: int = 0
+    late: int = 0  # is_late
+
+
+@dataclass
+class ScoreSummary:
+    """Média, maior e menor nota de uma tarefa"""
+
+    average: Optional[float] = None
+    highest: Optional[float] = None
+    lowest: Optional[float] = None
+
+
+def _status_count(*statuses: SubmissionStatus):
+    return func.coalesce(func.sum(case((AssignmentSubmission.status.in_(statuses), 1), else_=0)), 0)
+
+
+def submission_counts_query(assignment_ids: Iterable[int]):
+    """SELECT agrupado com total/pending/submitted/graded/late por tarefa"""
+    return select(
+        AssignmentSubmission.assignment_id,
+        func.count(AssignmentSubmission.id).label("total"),
+        _status_count(SubmissionStatus.PENDING).label("pending"),
+        _status_count(SubmissionStatus.SUBMITTED, SubmissionStatus.LATE).label("submitted"),
+        _status_count(SubmissionStatus.GRADED).label("graded"),
+        func.coalesce(func.sum(func.cast(AssignmentSubmission.is_late, Integer)), 0).label("late"),
+    ).where(
+        AssignmentSubmission.assignment_id.in_(list(assignment_ids))
+    ).group_by(AssignmentSubmission.assignment_id)
+
+
+def _contribution(status: Optional[SubmissionStatus], is_late: bool) -> Dict[str, int]:
+    """Quanto uma submissão neste estado soma em cada contador"""
+    if status is None:
+        return dict.fromkeys(COUNTER_FIELDS, 0)
+    return {
+        "total": 1,
+        "pending": int(status == SubmissionStatus.PENDING),
+        "submitted": int(status in (SubmissionStatus.SUBMITTED, SubmissionStatus.LATE)),
+        "graded": int(status == SubmissionStatus.GRADED),
+        "late": int(bool(is_late)),
+    }
+
+
+class SubmissionCountsService:
+    """
+    Contagens de submissões para um conjunto de tarefas
+
+    Uso nos endpoints:
+        counts = SubmissionCountsService(db).get_counts([a.id for a in assignments])
+        counts[assignment.id].graded
+    """
+
+    def __init__(self, db: Session, use_counter_table: Optional[bool] = None):
+        self.db = db
+        if use_counter_table is None:
+            use_counter_table = settings.assignment_counts_backend == "table"
+        self.use_counter_table = use_counter_table
+
+    def get_counts(self, assignment_ids: Iterable[int]) -> Dict[int, SubmissionCounts]:
+        """Contagens por tarefa (tarefas sem submissões recebem zeros)"""
+        ids = list(dict.fromkeys(assignment_ids))
+        if not ids:
+            return {}
+        counts = {assignment_id: SubmissionCounts() for assignment_id in ids}
+
+        missing = ids
+        if self.use_counter_table:
+            rows = self.db.execute(
+                select(AssignmentSubmissionCounter).where(AssignmentSubmissionCounter.assignment_id.in_(ids))
+            ).scalars().all()
+            for row in rows:
+                counts[row.assignment_id] = SubmissionCounts(**{field: getattr(row, field) for field in COUNTER_FIELDS})
+            present = {row.assignment_id for row in rows}
+            missing = [assignment_id for assignment_id in ids if assignment_id not in present]
+
+        if missing:
+            for row in self.db.execute(submission_counts_query(missing)):
+                counts[row.assignment_id] = SubmissionCounts(
+                    **{field: int(getattr(row, field)) for field in COUNTER_FIELDS}
+                )
+            if self.use_counter_table:
+                self._backfill(missing, counts)
+
+        return counts
+
+    def get_count(self, assignment_id: int) -> SubmissionCounts:
+        return self.get_counts([assignment_id])[assignment_id]
+
+    def get_score_summary(self, assignment_id: int) -> ScoreSummary:
+        """Média, maior e menor nota (apenas submissões com nota)"""
+        average, highest, lowest = self.db.execute(
+            select(
+                func.avg(AssignmentSubmission.score),
+                func.max(AssignmentSubmission.score),
+                func.min(AssignmentSubmission.score),
+            ).where(
+                AssignmentSubmission.assignment_id == assignment_id,
+                AssignmentSubmission.score.isnot(None),
+            )
+        ).one()
+        return ScoreSummary(
+            average=float(average) if average is not None else None,
+            highest=float(highest) if highest is not None else None,
+            lowest=float(lowest) if lowest is not None else None,
+        )
+
+    def record_change(
+        self,
+        assignment_id: int,
+        old_status: Optional[SubmissionStatus],
+        old_is_late: bool,
+        new_status: SubmissionStatus,
+        new_is_late: bool,
+    ) -> None:
+        """
+        Aplica a mudança de estado de uma submissão nos contadores
+
+        Chamar antes do commit que grava a submissão (old_status=None para
+        uma submissão nova). Sem linha de contador não faz nada: a próxima
+        leitura preenche a linha a partir do agregado.
+        """
+        if not self.use_counter_table:
+            return
+        before = _contribution(old_status, old_is_late)
+        after = _contribution(new_status, new_is_late)
+        deltas = {field: after[field] - before[field] for field in COUNTER_FIELDS if after[field] != before[field]}
+        if not deltas:
+            return
+        counter = AssignmentSubmissionCounter.__table__.c
+        self.db.execute(
+            update(AssignmentSubmissionCounter)
+            .where(AssignmentSubmissionCounter.assignment_id == assignment_id)
+            .values({field: counter[field] + delta for field, delta in deltas.items()})
+        )
+
+    def rebuild(self, assignment_ids: Iterable[int]) -> Dict[int, SubmissionCounts]:
+        """Recalcula os contadores a partir das submissões"""
+        ids = list(dict.fromkeys(assignment_ids))
+        counts = SubmissionCountsService(self.db, use_counter_table=False).get_counts(ids)
+        counter = AssignmentSubmissionCounter.__table__
+        with self.db.get_bind().begin() as connection:
+            connection.execute(counter.delete().where(counter.c.assignment_id.in_(ids)))
+            if ids:
+                connection.execute(
+                    counter.insert(),
+                    [{"assignment_id": assignment_id, **asdict(counts[assignment_id])} for assignment_id in ids],
+                )
+        return counts
+
+    def _backfill(self, ids, counts: Dict[int, SubmissionCounts]) -> None:
+        """
+        Grava as linhas de contador que faltavam
+
+        Usa uma conexão própria para não fazer commit (nem expirar objetos)
+        na sessão da requisição.
+        """
+        try:
+            with self.db.get_bind().begin() as connection:
+                connection.execute(
+                    AssignmentSubmissionCounter.__table__.insert(),
+                    [{"assignment_id": assignment_id, **asdict(counts[assignment_id])} for assignment_id in ids],
+                )
+        except Exception as e:
+            # Outra requisição criou a linha antes; o agregado já respondeu esta
+            logger.warning(f"Falha ao preencher contadores de submissões: {e}")
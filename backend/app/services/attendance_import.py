@@ -0,0 +1,546 @@
+"""
+Bulk attendance ingestion
+
+Validates a batch of roll-call rows with one IN query per batch and writes
+them with a single INSERT ... ON CONFLICT (student_id, date, class_id,
+period) DO UPDATE, so a 40-student roll call is a handful of statements instead of
+two queries per student. Used by POST /attendance/bulk (one class, one
+date) and POST /attendance/import (CSV/JSON streams for whole-institution
+imports, processed in batches as the body arrives).
+
+ON CONFLICT needs the uq_attendance_student_date_class_period index,
+which create_all does not add to an existing attendance table. It is
+never created on startup: scripts/migrate_attendance_unique_index.py
+reports the duplicate records that block it and creates it once they are
+resolved. Until a database has it, writes go through the update-or-insert
+fallback.
+"""
+import codecs
+import csv
+import io
+import json
+import logging
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+from uuid import uuid4
+
+from sqlalchemy import func, select, text, tuple_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Attendance, Student
+from app.models.attendance import ATTENDANCE_CLASS_KEY, ATTENDANCE_PERIOD_KEY
+from app.models.class_model import class_students
+from app.services.attendance_stats import refresh_daily_rollup
+
+logger = logging.getLogger(__name__)
+
+# Rows per upsert statement for streamed imports
+IMPORT_BATCH_SIZE = 1000
+# Longest CSV record or JSON array element accepted from an import stream
+MAX_RECORD_CHARS = 64 * 1024
+UNIQUE_INDEX = "uq_attendance_student_date_class_period"
+# Created at startup by an earlier version (without the class), replaced by UNIQUE_INDEX
+LEGACY_UNIQUE_INDEX = "uq_attendance_student_date_period"
+# Whether each database (by URL) has UNIQUE_INDEX, checked once
+_unique_index: Dict[str, bool] = {}
+
+TRUE_VALUES = {"1", "true", "t", "yes", "y", "sim", "s", "presente", "p"}
+FALSE_VALUES = {"0", "false", "f", "no", "n", "nao", "não", "ausente", "a"}
+
+
+@dataclass
+class AttendanceRow:
+    """One validated-shape roll-call entry"""
+
+    index: int
+    student_id: str
+    date: date
+    present: bool
+    class_id: Optional[int] = None
+    period: Optional[str] = None
+    justified: bool = False
+    justification: Optional[str] = None
+
+
+@dataclass
+class ImportResult:
+    """Per-row outcome of a bulk write"""
+
+    created: int = 0
+    updated: int = 0
+    rows: List[Dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def errors(self) -> List[Dict[str, Any]]:
+        return [row for row in self.rows if row["status"] == "error"]
+
+    def error(self, index: int, student_id: Any, message: str):
+        self.rows.append({"row": index, "student_id": student_id, "status": "error", "error": message})
+
+    def merge(self, other: "ImportResult"):
+        self.created += other.created
+        self.updated += other.updated
+        self.rows.extend(other.rows)
+
+
+def _parse_bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValueError(f"valor booleano inválido: {value!r}")
+
+
+def parse_row(index: int, data: Dict[str, Any], defaults: Optional[Dict[str, Any]] = None) -> AttendanceRow:
+    """Build an AttendanceRow from a JSON object or CSV record (raises ValueError)"""
+    values = dict(defaults or {})
+    values.update({key: value for key, value in data.items() if value not in (None, "") or key == "present"})
+
+    student_id = str(values.get("student_id") or "").strip()
+    if not student_id:
+        raise ValueError("student_id é obrigatório")
+    if "present" not in values:
+        raise ValueError("present é obrigatório")
+
+    row_date = values.get("date")
+    if not row_date:
+        raise ValueError("date é obrigatório")
+    if isinstance(row_date, str):
+        row_date = date.fromisoformat(row_date.strip())
+
+    class_id = values.get("class_id")
+    return AttendanceRow(
+        index=index,
+        student_id=student_id,
+        date=row_date,
+        present=_parse_bool(values["present"]),
+        class_id=int(class_id) if class_id not in (None, "") else None,
+        period=values.get("period") or None,
+        justified=_parse_bool(values.get("justified", False)),
+        justification=values.get("justification") or None,
+    )
+
+
+def _index_exists(conn, dialect_name: str, name: str = UNIQUE_INDEX) -> bool:
+    if dialect_name == "sqlite":
+        query = "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = :name"
+    elif dialect_name == "postgresql":
+        query = "SELECT 1 FROM pg_indexes WHERE indexname = :name"
+    else:
+        return False
+    return conn.execute(text(query), {"name": name}).scalar() is not None
+
+
+def unique_index_exists(conn) -> bool:
+    return _index_exists(conn, conn.dialect.name)
+
+
+def duplicate_keys(conn, limit: Optional[int] = None) -> List[Tuple[Any, ...]]:
+    """(student_id, date, class_id, period, records) of the keys recorded more than once"""
+    query = (
+        select(
+            Attendance.student_id, Attendance.date, Attendance.class_id, Attendance.period,
+            func.count().label("records"),
+        )
+        .group_by(Attendance.student_id, Attendance.date, ATTENDANCE_CLASS_KEY, ATTENDANCE_PERIOD_KEY)
+        .having(func.count() > 1)
+        .order_by(Attendance.date, Attendance.student_id)
+    )
+    if limit is not None:
+        query = query.limit(limit)
+    return [tuple(row) for row in conn.execute(query)]
+
+
+def delete_duplicates(conn) -> int:
+    """Delete all but the most recently updated record of each duplicated key, returns how many"""
+    return conn.execute(text(
+        "DELETE FROM attendance WHERE id IN ("
+        " SELECT id FROM ("
+        "  SELECT id, row_number() OVER ("
+        "   PARTITION BY student_id, date, coalesce(class_id, 0), coalesce(period, '')"
+        "   ORDER BY updated_at DESC, id DESC"
+        "  ) AS position FROM attendance"
+        " ) ranked WHERE position > 1"
+        ")"
+    )).rowcount
+
+
+def create_unique_index(conn) -> None:
+    """
+    Create UNIQUE_INDEX (fails while duplicate_keys() finds any) and drop
+    the legacy index without the class
+    """
+    if not _index_exists(conn, conn.dialect.name):
+        next(index for index in Attendance.__table__.indexes if index.name == UNIQUE_INDEX).create(conn)
+    if _index_exists(conn, conn.dialect.name, LEGACY_UNIQUE_INDEX):
+        conn.execute(text(f"DROP INDEX {LEGACY_UNIQUE_INDEX}"))
+    _unique_index.clear()
+
+
+async def _has_unique_index(db: AsyncSession) -> bool:
+    bind = db.get_bind()
+    url = str(bind.url)
+    if url not in _unique_index:
+        connection = await db.connection()
+        _unique_index[url] = await connection.run_sync(lambda conn: _index_exists(conn, bind.dialect.name))
+        if not _unique_index[url] and bind.dialect.name in ("sqlite", "postgresql"):
+            logger.warning(
+                f"Attendance: {UNIQUE_INDEX} missing, bulk writes use the slower fallback "
+                f"(run scripts/migrate_attendance_unique_index.py)"
+            )
+    return _unique_index[url]
+
+
+def _upsert_statement(dialect_name: str, values: List[Dict[str, Any]]):
+    """INSERT ... ON CONFLICT (student_id, date, class, period) DO UPDATE"""
+    if dialect_name == "postgresql":
+        statement = postgresql_insert(Attendance).values(values)
+    elif dialect_name == "sqlite":
+        statement = sqlite_insert(Attendance).values(values)
+    else:
+        return None
+    excluded = statement.excluded
+    return statement.on_conflict_do_update(
+        index_elements=[Attendance.student_id, Attendance.date, ATTENDANCE_CLASS_KEY, ATTENDANCE_PERIOD_KEY],
+        set_={
+            "present": excluded.present,
+            "justified": excluded.justified,
+            "justification": excluded.justification,
+            "recorded_by": excluded.recorded_by,
+            "updated_at": excluded.updated_at,
+        },
+    )
+
+
+def _row_key(student_id: str, day: date, class_id: Optional[int], period: Optional[str]) -> Tuple[str, date, int, str]:
+    """Key of the unique index: (student_id, date, class or 0, period or "")"""
+    return student_id, day, class_id or 0, period or ""
+
+
+async def _existing_keys(db: AsyncSession, rows: List[AttendanceRow]) -> set:
+    """(student_id, date, class, period) keys that already have a record"""
+    keys = await db.execute(
+        select(
+            Attendance.student_id, Attendance.date, Attendance.class_id, Attendance.period
+        ).where(
+            tuple_(Attendance.student_id, Attendance.date).in_([(row.student_id, row.date) for row in rows])
+        )
+    )
+    return {_row_key(*key) for key in keys}
+
+
+async def upsert_attendance(
+    db: AsyncSession,
+    rows: Iterable[AttendanceRow],
+    institution_id: str,
+    recorded_by: str,
+) -> ImportResult:
+    """
+    Validate and write one batch of rows
+
+    Students must belong to the institution and, when the row names a
+    class, be enrolled in it (one query each for the whole batch). Later
+    rows win over earlier duplicates of the same (student, date, class,
+    period); the same student, date and period in another class is a
+    separate record.
+    Does not commit.
+    """
+    result = ImportResult()
+    rows = list(rows)
+    if not rows:
+        return result
+
+    student_ids = {row.student_id for row in rows}
+    known_students = set((await db.execute(
+        select(Student.id).where(Student.id.in_(student_ids), Student.institution_id == institution_id)
+    )).scalars())
+
+    class_pairs = {(row.class_id, row.student_id) for row in rows if row.class_id is not None}
+    enrolled = set()
+    if class_pairs:
+        enrolled = {tuple(pair) for pair in await db.execute(
+            select(class_students.c.class_id, class_students.c.student_id).where(
+                tuple_(class_students.c.class_id, class_students.c.student_id).in_(list(class_pairs))
+            )
+        )}
+
+    accepted: Dict[Tuple[str, date, int, str], AttendanceRow] = {}
+    for row in rows:
+        if row.student_id not in known_students:
+            result.error(row.index, row.student_id, "Aluno não encontrado")
+        elif row.class_id is not None and (row.class_id, row.student_id) not in enrolled:
+            result.error(row.index, row.student_id, "Aluno não encontrado na turma")
+        else:
+            accepted[_row_key(row.student_id, row.date, row.class_id, row.period)] = row
+    if not accepted:
+        return result
+
+    existing = await _existing_keys(db, list(accepted.values()))
+    now = datetime.utcnow()
+    values = [
+        {
+            "id": str(uuid4()),
+            "institution_id": institution_id,
+            "student_id": row.student_id,
+            "class_id": row.class_id,
+            "date": row.date,
+            "period": row.period,
+            "present": row.present,
+            "justified": row.justified,
+            "justification": row.justification,
+            "recorded_by": recorded_by,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for row in accepted.values()
+    ]
+
+    statement = None
+    if await _has_unique_index(db):
+        statement = _upsert_statement(db.get_bind().dialect.name, values)
+    if statement is not None:
+        await db.execute(statement)
+    else:
+        await _merge_fallback(db, values, existing)
+
+    for key, row in accepted.items():
+        status = "updated" if key in existing else "created"
+        if status == "created":
+            result.created += 1
+        else:
+            result.updated += 1
+        result.rows.append({"row": row.index, "student_id": row.student_id, "status": status})
+
+    # Keep the class statistics rollup in step with the new rows
+    dates_by_class: Dict[int, set] = {}
+    for row in accepted.values():
+        if row.class_id is not None:
+            dates_by_class.setdefault(row.class_id, set()).add(row.date)
+    for class_id, dates in dates_by_class.items():
+        await refresh_daily_rollup(db, class_id, dates)
+
+    result.rows.sort(key=lambda entry: entry["row"])
+    return result
+
+
+def _value_key(value: Dict[str, Any]) -> Tuple[str, date, int, str]:
+    return _row_key(value["student_id"], value["date"], value["class_id"], value["period"])
+
+
+async def _merge_fallback(db: AsyncSession, values: List[Dict[str, Any]], existing: set) -> None:
+    """Dialects without ON CONFLICT (or no unique index yet): update known keys, insert the rest"""
+    updates = [value for value in values if _value_key(value) in existing]
+    inserts = [value for value in values if _value_key(value) not in existing]
+    if inserts:
+        await db.execute(Attendance.__table__.insert(), inserts)
+    for value in updates:
+        await db.execute(
+            Attendance.__table__.update().where(
+                Attendance.student_id == value["student_id"],
+                Attendance.date == value["date"],
+                ATTENDANCE_CLASS_KEY == (value["class_id"] or 0),
+                ATTENDANCE_PERIOD_KEY == (value["period"] or ""),
+            ).values({
+                key: value[key]
+                for key in ("present", "justified", "justification", "recorded_by", "updated_at")
+            })
+        )
+
+
+async def _text(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Decode a byte stream chunk by chunk (raises UnicodeDecodeError)"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    async for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Text lines of a byte stream, "\n" included, without buffering the whole body"""
+    buffer = ""
+    async for text in _text(chunks):
+        buffer += text
+        *complete, buffer = buffer.split("\n")
+        for line in complete:
+            yield line + "\n"
+    if buffer:
+        yield buffer
+
+
+async def iter_csv_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    (row number, record) pairs from a CSV stream with a header line
+
+    Lines are joined until the quotes balance, so quoted fields may contain
+    newlines. A record that cannot be parsed is yielded as a ValueError.
+    """
+    header = None
+    index = 0
+    record = ""
+    quotes = 0
+    async for line in _lines(chunks):
+        record += line
+        quotes += line.count('"')
+        if quotes % 2 and len(record) < MAX_RECORD_CHARS:
+            continue
+        text, record, quotes = record, "", 0
+        if not text.strip():
+            continue
+        if header is None:
+            header = [name.strip().lower() for name in next(csv.reader(io.StringIO(text)))]
+            continue
+        index += 1
+        if len(text) >= MAX_RECORD_CHARS:
+            yield index, ValueError("aspas não fechadas")
+            continue
+        try:
+            yield index, dict(zip(header, next(csv.reader(io.StringIO(text)))))
+        except csv.Error as e:
+            yield index, ValueError(f"CSV inválido: {e}")
+    if record.strip() and header is not None:
+        yield index + 1, ValueError("aspas não fechadas")
+
+
+async def _iter_ndjson_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Any]]:
+    index = 0
+    async for line in _lines(chunks):
+        if line.strip():
+            index += 1
+            try:
+                yield index, json.loads(line)
+            except ValueError as e:
+                yield index, ValueError(f"JSON inválido: {e}")
+
+
+async def _iter_json_array(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Any]]:
+    """Decode the elements of a top-level JSON array one by one as the body arrives"""
+    decoder = json.JSONDecoder()
+    texts = _text(chunks)
+    buffer = ""
+    eof = False
+    started = False
+    index = 0
+
+    async def read() -> bool:
+        nonlocal buffer, eof
+        try:
+            buffer += await texts.__anext__()
+        except StopAsyncIteration:
+            eof = True
+        return not eof
+
+    while True:
+        buffer = buffer.lstrip()
+        if started and buffer.startswith(","):
+            buffer = buffer[1:].lstrip()
+        if not buffer:
+            if eof or not await read():
+                if started:
+                    yield index + 1, ValueError("JSON inválido: lista não terminada")
+                return
+            continue
+
+        if not started:
+            if buffer[0] != "[":
+                # {"attendances": [...]} (or anything else) is parsed in one piece
+                while await read():
+                    pass
+                payload = json.loads(buffer)
+                if isinstance(payload, dict):
+                    payload = payload.get("attendances", [])
+                for index, record in enumerate(payload, start=1):
+                    yield index, record
+                return
+            started = True
+            buffer = buffer[1:]
+            continue
+        if buffer[0] == "]":
+            return
+
+        try:
+            record, end = decoder.raw_decode(buffer)
+        except ValueError as e:
+            error = e
+        else:
+            # A number at the end of the buffer may continue in the next chunk
+            if end < len(buffer) or eof:
+                index += 1
+                buffer = buffer[end:]
+                yield index, record
+                continue
+            error = None
+        if len(buffer) < MAX_RECORD_CHARS and await read():
+            continue
+        # The rest of the array cannot be delimited after a malformed element
+        yield index + 1, ValueError(f"JSON inválido: {error or 'lista não terminada'}")
+        return
+
+
+async def iter_json_records(chunks: AsyncIterator[bytes], ndjson: bool) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    (row number, record) pairs from NDJSON or a JSON array, both streamed
+
+    A malformed NDJSON line is yielded as a ValueError and the next lines
+    are still read. In a JSON array the first malformed element ends the
+    stream (yielded as a ValueError). Only a top-level array streams: the
+    {"attendances": [...]} form is read whole.
+    """
+    records = _iter_ndjson_records(chunks) if ndjson else _iter_json_array(chunks)
+    async for index, record in records:
+        yield index, record
+
+
+async def import_attendance_stream(
+    db: AsyncSession,
+    records: AsyncIterator[Tuple[int, Dict[str, Any]]],
+    institution_id: str,
+    recorded_by: str,
+    defaults: Optional[Dict[str, Any]] = None,
+    batch_size: int = IMPORT_BATCH_SIZE,
+) -> ImportResult:
+    """
+    Parse, validate and upsert a record stream in batches, committing each batch
+
+    Malformed records and an undecodable body are reported in the result
+    instead of raising, since earlier batches are already committed.
+    """
+    result = ImportResult()
+    batch: List[AttendanceRow] = []
+
+    async def flush():
+        result.merge(await upsert_attendance(db, batch, institution_id, recorded_by))
+        await db.commit()
+        batch.clear()
+
+    index = 0
+    try:
+        async for index, record in records:
+            if isinstance(record, ValueError):
+                result.error(index, None, str(record))
+                continue
+            try:
+                batch.append(parse_row(index, record, defaults))
+            except (ValueError, TypeError, AttributeError) as e:
+                student_id = record.get("student_id") if isinstance(record, dict) else None
+                result.error(index, student_id, str(e))
+                continue
+            if len(batch) >= batch_size:
+                await flush()
+    except ValueError as e:
+        # Undecodable body: keep the rows read so far and report where it stopped
+        result.error(index + 1, None, f"Arquivo inválido: {e}")
+    if batch:
+        await flush()
+
+    result.rows.sort(key=lambda entry: entry["row"])
+    return result
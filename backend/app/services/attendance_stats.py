@@ -0,0 +1,173 @@
+"""
+Class attendance statistics
+
+Per-student present/absent/justified totals come from one GROUP BY joined to
+the student names, either over attendance itself or over the precomputed
+attendance_daily_rollups table (ATTENDANCE_ROLLUP_ENABLED).
+"""
+from dataclasses import dataclass
+from datetime import date
+from typing import Iterable, List, Optional
+
+from sqlalchemy import and_, case, delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models import Attendance, AttendanceDailyRollup, Student, User
+
+
+@dataclass
+class StudentAttendanceStats:
+    """Attendance totals of one student in a class"""
+
+    student_id: str
+    student_name: str
+    total: int
+    present: int
+    absent: int
+    justified: int
+
+    @property
+    def attendance_rate(self) -> float:
+        return (self.present / self.total * 100) if self.total > 0 else 0.0
+
+
+def _sum_if(condition):
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+
+def _attendance_totals(class_id: int, start_date: Optional[date], end_date: Optional[date]):
+    """Per-student totals straight from attendance"""
+    query = select(
+        Attendance.student_id.label("student_id"),
+        func.count(Attendance.id).label("total"),
+        _sum_if(Attendance.present.is_(True)).label("present"),
+        _sum_if(Attendance.present.isnot(True)).label("absent"),
+        _sum_if(and_(Attendance.present.isnot(True), Attendance.justified.is_(True))).label("justified"),
+    ).where(Attendance.class_id == class_id)
+    if start_date:
+        query = query.where(Attendance.date >= start_date)
+    if end_date:
+        query = query.where(Attendance.date <= end_date)
+    return query.group_by(Attendance.student_id)
+
+
+def _rollup_totals(class_id: int, start_date: Optional[date], end_date: Optional[date]):
+    """Per-student totals from the daily rollup"""
+    query = select(
+        AttendanceDailyRollup.student_id.label("student_id"),
+        func.sum(AttendanceDailyRollup.total).label("total"),
+        func.sum(AttendanceDailyRollup.present).label("present"),
+        func.sum(AttendanceDailyRollup.absent).label("absent"),
+        func.sum(AttendanceDailyRollup.justified).label("justified"),
+    ).where(AttendanceDailyRollup.class_id == class_id)
+    if start_date:
+        query = query.where(AttendanceDailyRollup.date >= start_date)
+    if end_date:
+        query = query.where(AttendanceDailyRollup.date <= end_date)
+    return query.group_by(AttendanceDailyRollup.student_id)
+
+
+async def get_class_student_stats(
+    db: AsyncSession,
+    class_id: int,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    use_rollup: Optional[bool] = None,
+) -> List[StudentAttendanceStats]:
+    """Per-student attendance totals of a class in one round-trip"""
+    if use_rollup is None:
+        use_rollup = settings.attendance_rollup_enabled
+    totals = (
+        _rollup_totals(class_id, start_date, end_date) if use_rollup
+        else _attendance_totals(class_id, start_date, end_date)
+    ).subquery()
+
+    rows = await db.execute(
+        select(
+            totals.c.student_id,
+            User.first_name,
+            User.last_name,
+            totals.c.total,
+            totals.c.present,
+            totals.c.absent,
+            totals.c.justified,
+        )
+        .select_from(totals)
+        .join(Student, Student.id == totals.c.student_id)
+        .join(User, User.id == Student.user_id)
+        .order_by(User.first_name, User.last_name)
+    )
+    return [
+        StudentAttendanceStats(
+            student_id=row.student_id,
+            student_name=f"{row.first_name} {row.last_name}",
+            total=int(row.total),
+            present=int(row.present),
+            absent=int(row.absent),
+            justified=int(row.justified),
+        )
+        for row in rows
+    ]
+
+
+async def refresh_daily_rollup(db: AsyncSession, class_id: int, dates: Iterable[date]) -> None:
+    """
+    Recompute the rollup rows of a class for the given dates
+
+    Runs in the caller's transaction, call it after the attendance changes
+    are flushed and before the commit. No-op unless the rollup is enabled.
+    """
+    if not settings.attendance_rollup_enabled or class_id is None:
+        return
+    dates = sorted(set(dates))
+    if not dates:
+        return
+    await db.flush()
+    await db.execute(
+        delete(AttendanceDailyRollup).where(
+            AttendanceDailyRollup.class_id == class_id,
+            AttendanceDailyRollup.date.in_(dates),
+        )
+    )
+    await db.execute(
+        insert(AttendanceDailyRollup).from_select(
+            ["class_id", "date", "student_id", "institution_id", "total", "present", "absent", "justified"],
+            _daily_totals().where(Attendance.class_id == class_id, Attendance.date.in_(dates)),
+        )
+    )
+
+
+async def rebuild_daily_rollup(db: AsyncSession, class_id: Optional[int] = None) -> int:
+    """Rebuild the rollup from scratch (one class or all), returns rows written"""
+    clear = delete(AttendanceDailyRollup)
+    source = _daily_totals().where(Attendance.class_id.isnot(None))
+    if class_id is not None:
+        clear = clear.where(AttendanceDailyRollup.class_id == class_id)
+        source = source.where(Attendance.class_id == class_id)
+    await db.execute(clear)
+    await db.execute(
+        insert(AttendanceDailyRollup).from_select(
+            ["class_id", "date", "student_id", "institution_id", "total", "present", "absent", "justified"],
+            source,
+        )
+    )
+    await db.commit()
+    count_query = select(func.count()).select_from(AttendanceDailyRollup)
+    if class_id is not None:
+        count_query = count_query.where(AttendanceDailyRollup.class_id == class_id)
+    return await db.scalar(count_query)
+
+
+def _daily_totals():
+    """attendance grouped by (class, date, student) in rollup column order"""
+    return select(
+        Attendance.class_id,
+        Attendance.date,
+        Attendance.student_id,
+        func.max(Attendance.institution_id),
+        func.count(Attendance.id),
+        _sum_if(Attendance.present.is_(True)),
+        _sum_if(Attendance.present.isnot(True)),
+        _sum_if(and_(Attendance.present.isnot(True), Attendance.justified.is_(True))),
+    ).group_by(Attendance.class_id, Attendance.date, Attendance.student_id)
@@ -0,0 +1,226 @@
+"""
+Conversation summaries
+
+Keeps the conversations table (one row per participant of each direct
+conversation: last message, last activity, unread and message counts) in
+step with messages, inside the caller's transaction:
+
+- record_messages(): new messages, aggregated per pair of users and
+  written with one INSERT ... ON CONFLICT DO UPDATE (counters are added,
+  the last message is only replaced by a newer one)
+- adjust_unread(): messages marked read or unread
+- refresh_conversations(): recomputes pairs from messages (deletions,
+  repairs); rebuild_conversations() recomputes everything
+
+The same hooks keep the per-user message counters
+(app.services.message_counters) in step.
+
+Used by the messages REST endpoints and the chat WebSocket write-behind
+queue; GET /messages/conversations pages the table by last activity.
+"""
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, delete, func, insert, literal, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.message import Conversation, Message
+from app.services.message_counters import apply_deltas, message_deltas, refresh_counts
+
+PREVIEW_LENGTH = Conversation.last_message_preview.type.length
+SUMMARY_FIELDS = (
+    "last_message_id",
+    "last_sender_id",
+    "last_message_preview",
+    "last_message_at",
+    "unread_count",
+    "message_count",
+    "updated_at",
+)
+# Rows per INSERT when rebuilding
+REBUILD_CHUNK = 1000
+
+
+def summarize(messages: Iterable[Any], now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """
+    Conversation rows (one per participant and pair) for a set of messages
+
+    Messages need id, sender_id, recipient_id, institution_id, content and
+    created_at; those without a true "read" attribute count as unread for
+    the recipient.
+    """
+    now = now or datetime.utcnow()
+    rows: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for message in messages:
+        position = (message.created_at, message.id)
+        for user_id, peer_id in {(message.sender_id, message.recipient_id), (message.recipient_id, message.sender_id)}:
+            row = rows.get((user_id, peer_id))
+            if row is None:
+                row = rows[(user_id, peer_id)] = {
+                    "user_id": user_id,
+                    "peer_id": peer_id,
+                    "institution_id": message.institution_id,
+                    "unread_count": 0,
+                    "message_count": 0,
+                    "last_message_at": None,
+                    "updated_at": now,
+                }
+            row["message_count"] += 1
+            if user_id == message.recipient_id and not getattr(message, "read", False):
+                row["unread_count"] += 1
+            if row["last_message_at"] is None or position > (row["last_message_at"], row["last_message_id"]):
+                row.update(
+                    last_message_id=message.id,
+                    last_sender_id=message.sender_id,
+                    last_message_preview=(message.content or "")[:PREVIEW_LENGTH],
+                    last_message_at=message.created_at,
+                )
+    return list(rows.values())
+
+
+def _merged(new) -> Dict[str, Any]:
+    """SET clause adding new's counters to a row and keeping its newest last message"""
+    newer = tuple_(new.last_message_at, new.last_message_id) > tuple_(
+        Conversation.last_message_at, Conversation.last_message_id
+    )
+    values = {
+        field: case((newer, getattr(new, field)), else_=getattr(Conversation, field))
+        for field in ("last_message_id", "last_sender_id", "last_message_preview", "last_message_at")
+    }
+    values["unread_count"] = Conversation.unread_count + new.unread_count
+    values["message_count"] = Conversation.message_count + new.message_count
+    values["updated_at"] = new.updated_at
+    return values
+
+
+def _upsert_statement(dialect_name: str, rows: List[Dict[str, Any]]):
+    """INSERT ... ON CONFLICT (user_id, peer_id) DO UPDATE"""
+    if dialect_name == "postgresql":
+        statement = postgresql_insert(Conversation).values(rows)
+    elif dialect_name == "sqlite":
+        statement = sqlite_insert(Conversation).values(rows)
+    else:
+        return None
+    return statement.on_conflict_do_update(
+        index_elements=[Conversation.user_id, Conversation.peer_id],
+        set_=_merged(statement.excluded),
+    )
+
+
+async def record_messages(db: AsyncSession, messages: Iterable[Any]) -> int:
+    """Add new messages to their conversations and counters, returns rows written"""
+    messages = list(messages)
+    rows = summarize(messages)
+    if not rows:
+        return 0
+    await apply_deltas(db, message_deltas(messages))
+    statement = _upsert_statement(db.get_bind().dialect.name, rows)
+    if statement is not None:
+        await db.execute(statement)
+    else:
+        await _merge_fallback(db, rows)
+    return len(rows)
+
+
+async def _merge_fallback(db: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+    """Dialects without ON CONFLICT: update known pairs, insert the rest"""
+    keys = [(row["user_id"], row["peer_id"]) for row in rows]
+    existing = set(await db.execute(
+        select(Conversation.user_id, Conversation.peer_id)
+        .where(tuple_(Conversation.user_id, Conversation.peer_id).in_(keys))
+    ))
+    inserts = [row for row, key in zip(rows, keys) if key not in existing]
+    if inserts:
+        await db.execute(insert(Conversation), inserts)
+    columns = Conversation.__table__.c
+    for row, key in zip(rows, keys):
+        if key not in existing:
+            continue
+        new = SimpleNamespace(**{field: literal(row[field], columns[field].type) for field in SUMMARY_FIELDS})
+        await db.execute(
+            update(Conversation)
+            .where(Conversation.user_id == row["user_id"], Conversation.peer_id == row["peer_id"])
+            .values(_merged(new))
+        )
+
+
+async def adjust_unread(db: AsyncSession, deltas: Dict[Tuple[str, str], int]) -> None:
+    """
+    Change unread counts by (user_id, peer_id) -> delta
+
+    Negative for messages user_id read from peer_id, positive for messages
+    marked unread again; counts never go below zero.
+    """
+    unread: Dict[str, int] = {}
+    for (user_id, _), delta in deltas.items():
+        unread[user_id] = unread.get(user_id, 0) + delta
+    await apply_deltas(db, {user_id: {"unread": delta} for user_id, delta in unread.items()})
+
+    for (user_id, peer_id), delta in deltas.items():
+        if not delta:
+            continue
+        count = Conversation.unread_count + delta
+        await db.execute(
+            update(Conversation)
+            .where(Conversation.user_id == user_id, Conversation.peer_id == peer_id)
+            .values(unread_count=case((count < 0, 0), else_=count))
+        )
+
+
+def live_messages():
+    """SELECT of the columns summarize() needs, messages not deleted"""
+    return select(
+        Message.id,
+        Message.sender_id,
+        Message.recipient_id,
+        Message.institution_id,
+        Message.content,
+        Message.read,
+        Message.created_at,
+    ).where(Message.deleted_at.is_(None))
+
+
+async def refresh_conversations(db: AsyncSession, pairs: Iterable[Tuple[str, str]]) -> None:
+    """
+    Recompute the conversations (and counters) of pairs of users from messages
+
+    Runs in the caller's transaction (call before the commit). For changes
+    that cannot be applied incrementally, such as deleted messages.
+    """
+    pairs = list({tuple(sorted(pair)) for pair in pairs})
+    if not pairs:
+        return
+    await db.flush()
+    directions = pairs + [(peer_id, user_id) for user_id, peer_id in pairs]
+    await db.execute(
+        delete(Conversation).where(tuple_(Conversation.user_id, Conversation.peer_id).in_(directions))
+    )
+    rows = summarize((await db.execute(
+        live_messages().where(tuple_(Message.sender_id, Message.recipient_id).in_(directions))
+    )).all())
+    if rows:
+        await db.execute(insert(Conversation), rows)
+    await refresh_counts(db, {user_id for pair in pairs for user_id in pair})
+
+
+async def rebuild_conversations(db: AsyncSession, institution_id: Optional[str] = None) -> int:
+    """Rebuild the table from messages (one institution or all), returns rows written"""
+    clear = delete(Conversation)
+    source = live_messages()
+    if institution_id is not None:
+        clear = clear.where(Conversation.institution_id == institution_id)
+        source = source.where(Message.institution_id == institution_id)
+    await db.execute(clear)
+
+    rows = summarize((await db.execute(source)).all())
+    for start in range(0, len(rows), REBUILD_CHUNK):
+        await db.execute(insert(Conversation), rows[start:start + REBUILD_CHUNK])
+    await db.commit()
+
+    count_query = select(func.count()).select_from(Conversation)
+    if institution_id is not None:
+        count_query = count_query.where(Conversation.institution_id == institution_id)
+    return await db.scalar(count_query)
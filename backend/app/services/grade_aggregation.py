@@ -0,0 +1,259 @@
+"""
+Grade aggregation (report cards)
+
+Term averages, weighted final averages per subject, the student's general
+average and rank are computed by the database in one statement for a whole
+cohort (one student, a class or an institution), following the
+institution's AcademicParameter:
+
+- passing_grade decides each subject's status
+- decimal_places / allow_grade_rounding shape the reported averages
+  (rounded half up, or truncated when rounding is not allowed)
+- weight_config weights the terms in the final average and, optionally,
+  the subjects in the general average:
+
+      {"terms": {"1": 2, "2": 3}, "subjects": {"Matemática": 2}}
+
+  A flat {"1": 0.4, "2": 0.6} is read as term weights. Missing terms or
+  subjects weigh 1.
+"""
+from dataclasses import dataclass, field
+from decimal import ROUND_DOWN, ROUND_HALF_UP, Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import case, desc, func, literal, select
+from sqlalchemy.orm import Session
+
+from app.models import Grade, Student, User
+from app.models.academic_parameters import AcademicParameter
+from app.models.class_model import class_students
+
+APPROVED = "Aprovado"
+FAILED = "Reprovado"
+
+
+@dataclass
+class GradingRules:
+    """Institution grading parameters used by the aggregation"""
+
+    passing_grade: float = 6.0
+    decimal_places: int = 1
+    allow_rounding: bool = True
+    term_weights: Dict[int, float] = field(default_factory=dict)
+    subject_weights: Dict[str, float] = field(default_factory=dict)
+
+    @classmethod
+    def from_parameter(cls, parameter: Optional[AcademicParameter]) -> "GradingRules":
+        if parameter is None:
+            return cls()
+        config = parameter.weight_config or {}
+        terms = config.get("terms")
+        if terms is None:
+            # Flat mapping of term number -> weight
+            terms = {key: value for key, value in config.items() if str(key).isdigit()}
+        return cls(
+            passing_grade=parameter.passing_grade if parameter.passing_grade is not None else 6.0,
+            decimal_places=parameter.decimal_places if parameter.decimal_places is not None else 1,
+            allow_rounding=parameter.allow_grade_rounding is not False,
+            term_weights={int(term): float(weight) for term, weight in (terms or {}).items()},
+            subject_weights={
+                str(subject): float(weight) for subject, weight in (config.get("subjects") or {}).items()
+            },
+        )
+
+    def round(self, value) -> Optional[float]:
+        """Reported form of an average"""
+        if value is None:
+            return None
+        mode = ROUND_HALF_UP if self.allow_rounding else ROUND_DOWN
+        return float(Decimal(str(value)).quantize(Decimal(1).scaleb(-self.decimal_places), rounding=mode))
+
+    def status(self, average: Optional[float]) -> str:
+        return APPROVED if average is not None and average >= self.passing_grade else FAILED
+
+
+def load_grading_rules(db: Session, institution_id: Optional[str]) -> GradingRules:
+    """Active academic parameters of the institution (defaults when none)"""
+    parameter = None
+    if institution_id:
+        parameter = db.query(AcademicParameter).filter(
+            AcademicParameter.institution_id == institution_id,
+            AcademicParameter.active.is_(True)
+        ).order_by(AcademicParameter.updated_at.desc()).first()
+    return GradingRules.from_parameter(parameter)
+
+
+def _weight(column, weights: Dict[Any, float]):
+    if not weights:
+        return literal(1.0)
+    return case(*((column == key, float(weight)) for key, weight in weights.items()), else_=1.0)
+
+
+@dataclass
+class SubjectResult:
+    subject: str
+    term_averages: Dict[Optional[int], float]
+    term_counts: Dict[Optional[int], int]
+    final_average: Optional[float]
+    status: str
+
+
+@dataclass
+class ReportCard:
+    student_id: str
+    student_name: str
+    enrollment: Optional[str]
+    current_grade: Optional[str]
+    subjects: Dict[str, SubjectResult]
+    general_average: Optional[float]
+    rank: Optional[int]
+    status: str
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "student": {
+                "id": self.student_id,
+                "name": self.student_name,
+                "enrollment": self.enrollment,
+                "grade": self.current_grade,
+            },
+            "subjects": {
+                name: {
+                    "term_averages": {str(term): value for term, value in result.term_averages.items()},
+                    "final_average": result.final_average,
+                    "status": result.status,
+                }
+                for name, result in self.subjects.items()
+            },
+            "general_average": self.general_average,
+            "rank": self.rank,
+            "status": self.status,
+            "total_subjects": len(self.subjects),
+        }
+
+
+def report_card_query(
+    rules: GradingRules,
+    academic_year: Optional[int],
+    institution_id: Optional[str] = None,
+    class_id: Optional[int] = None,
+    student_ids: Optional[Iterable[str]] = None,
+):
+    """
+    One row per (student, subject, term) of the cohort
+
+    Each row carries the term average, the subject's weighted final
+    average, the student's general average and the student's rank in the
+    cohort (standard competition ranking, best average first).
+    """
+    term_filters = []
+    if academic_year is not None:
+        term_filters.append(Grade.academic_year == academic_year)
+    if institution_id is not None:
+        term_filters.append(Grade.institution_id == institution_id)
+    if student_ids is not None:
+        term_filters.append(Grade.student_id.in_(list(student_ids)))
+    if class_id is not None:
+        term_filters.append(
+            Grade.student_id.in_(select(class_students.c.student_id).where(class_students.c.class_id == class_id))
+        )
+
+    terms = (
+        select(
+            Grade.student_id,
+            Grade.subject,
+            Grade.semester,
+            func.avg(Grade.grade).label("term_average"),
+            func.count(Grade.id).label("term_count"),
+        )
+        .where(*term_filters)
+        .group_by(Grade.student_id, Grade.subject, Grade.semester)
+        .subquery("terms")
+    )
+
+    term_weight = _weight(terms.c.semester, rules.term_weights)
+    finals = (
+        select(
+            terms.c.student_id,
+            terms.c.subject,
+            (func.sum(terms.c.term_average * term_weight) / func.sum(term_weight)).label("final_average"),
+        )
+        .group_by(terms.c.student_id, terms.c.subject)
+        .subquery("finals")
+    )
+
+    subject_weight = _weight(finals.c.subject, rules.subject_weights)
+    general_average = func.sum(finals.c.final_average * subject_weight) / func.sum(subject_weight)
+    generals = (
+        select(
+            finals.c.student_id,
+            general_average.label("general_average"),
+            func.rank().over(order_by=desc(general_average)).label("rank"),
+        )
+        .group_by(finals.c.student_id)
+        .subquery("generals")
+    )
+
+    return (
+        select(
+            terms.c.student_id,
+            User.first_name,
+            User.last_name,
+            Student.enrollment_number,
+            Student.current_grade,
+            terms.c.subject,
+            terms.c.semester,
+            terms.c.term_average,
+            terms.c.term_count,
+            finals.c.final_average,
+            generals.c.general_average,
+            generals.c.rank,
+        )
+        .select_from(terms)
+        .join(finals, (finals.c.student_id == terms.c.student_id) & (finals.c.subject == terms.c.subject))
+        .join(generals, generals.c.student_id == terms.c.student_id)
+        .join(Student, Student.id == terms.c.student_id)
+        .join(User, User.id == Student.user_id)
+        .order_by(generals.c.rank, terms.c.student_id, terms.c.subject, terms.c.semester)
+    )
+
+
+def compute_report_cards(
+    db: Session,
+    rules: GradingRules,
+    academic_year: Optional[int],
+    institution_id: Optional[str] = None,
+    class_id: Optional[int] = None,
+    student_ids: Optional[Iterable[str]] = None,
+) -> List[ReportCard]:
+    """Report cards of the cohort, best general average first (one query)"""
+    cards: Dict[str, ReportCard] = {}
+    for row in db.execute(report_card_query(rules, academic_year, institution_id, class_id, student_ids)):
+        card = cards.get(row.student_id)
+        if card is None:
+            general = rules.round(row.general_average)
+            card = cards[row.student_id] = ReportCard(
+                student_id=row.student_id,
+                student_name=f"{row.first_name} {row.last_name}",
+                enrollment=row.enrollment_number,
+                current_grade=row.current_grade,
+                subjects={},
+                general_average=general,
+                rank=row.rank,
+                status=APPROVED,
+            )
+        result = card.subjects.get(row.subject)
+        if result is None:
+            final = rules.round(row.final_average)
+            result = card.subjects[row.subject] = SubjectResult(
+                subject=row.subject,
+                term_averages={},
+                term_counts={},
+                final_average=final,
+                status=rules.status(final),
+            )
+            if result.status != APPROVED:
+                card.status = FAILED
+        result.term_averages[row.semester] = rules.round(row.term_average)
+        result.term_counts[row.semester] = int(row.term_count)
+    return list(cards.values())
@@ -0,0 +1,236 @@
+"""
+Class grade sheet (student x subject x term matrix)
+
+One query returns every cell of the sheet, the class roster included
+(students without grades come back with empty cells), together with the
+per-student and per-subject averages computed by window functions, so
+the endpoint never issues a query per student.
+"""
+import csv
+import io
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import Session
+
+from app.models import Grade, Student, User
+from app.models.class_model import class_students
+
+# Rows fetched per round-trip when streaming the CSV export
+STREAM_BATCH_SIZE = 500
+
+
+@dataclass
+class GradeSheetFilters:
+    subject: Optional[str] = None
+    semester: Optional[int] = None
+    academic_year: Optional[int] = None
+
+
+@dataclass
+class StudentRow:
+    student_id: str
+    student_name: str
+    enrollment: Optional[str]
+    average: Optional[float] = None
+    total_grades: int = 0
+    # (subject, semester) -> (average, count)
+    cells: Dict[Tuple[str, Optional[int]], Tuple[float, int]] = field(default_factory=dict)
+
+
+def _round(value) -> Optional[float]:
+    return round(float(value), 2) if value is not None else None
+
+
+def grade_sheet_query(class_id: int, filters: GradeSheetFilters):
+    """
+    Cells of the sheet ordered by student
+
+    One row per (student, subject, semester) with the cell average and
+    count, plus the student's overall average and the subject's class
+    average (weighted by number of grades) as window aggregates.
+    """
+    grade_join = [Grade.student_id == Student.id]
+    if filters.subject:
+        grade_join.append(Grade.subject == filters.subject)
+    if filters.semester:
+        grade_join.append(Grade.semester == filters.semester)
+    if filters.academic_year:
+        grade_join.append(Grade.academic_year == filters.academic_year)
+
+    cell_sum = func.sum(Grade.grade)
+    cell_count = func.count(Grade.id)
+    student_sum = func.sum(cell_sum).over(partition_by=Student.id)
+    student_count = func.sum(cell_count).over(partition_by=Student.id)
+    subject_sum = func.sum(cell_sum).over(partition_by=Grade.subject)
+    subject_count = func.sum(cell_count).over(partition_by=Grade.subject)
+
+    return (
+        select(
+            Student.id.label("student_id"),
+            User.first_name,
+            User.last_name,
+            Student.enrollment_number,
+            Grade.subject,
+            Grade.semester,
+            (cell_sum / func.nullif(cell_count, 0)).label("cell_average"),
+            cell_count.label("cell_count"),
+            (student_sum / func.nullif(student_count, 0)).label("student_average"),
+            student_count.label("student_count"),
+            (subject_sum / func.nullif(subject_count, 0)).label("subject_average"),
+        )
+        .select_from(class_students)
+        .join(Student, Student.id == class_students.c.student_id)
+        .join(User, User.id == Student.user_id)
+        .outerjoin(Grade, and_(*grade_join))
+        .where(class_students.c.class_id == class_id)
+        .group_by(
+            Student.id, User.first_name, User.last_name, Student.enrollment_number,
+            Grade.subject, Grade.semester
+        )
+        .order_by(User.first_name, User.last_name, Student.id, Grade.subject, Grade.semester)
+    )
+
+
+def build_grade_sheet(db: Session, class_id: int, filters: GradeSheetFilters) -> Dict[str, Any]:
+    """Students, subject/term columns and averages of a class in one query"""
+    students: Dict[str, StudentRow] = {}
+    columns = set()
+    subject_averages: Dict[str, Optional[float]] = {}
+
+    for row in db.execute(grade_sheet_query(class_id, filters)):
+        student = students.get(row.student_id)
+        if student is None:
+            student = students[row.student_id] = StudentRow(
+                student_id=row.student_id,
+                student_name=f"{row.first_name} {row.last_name}",
+                enrollment=row.enrollment_number,
+                average=_round(row.student_average),
+                total_grades=int(row.student_count or 0),
+            )
+        if row.subject is None:
+            continue
+        student.cells[(row.subject, row.semester)] = (_round(row.cell_average), int(row.cell_count))
+        columns.add((row.subject, row.semester))
+        subject_averages[row.subject] = _round(row.subject_average)
+
+    columns = sorted(columns, key=lambda column: (column[0], column[1] or 0))
+    total_grades = sum(student.total_grades for student in students.values())
+    grade_total = sum(
+        average * count
+        for student in students.values()
+        for average, count in student.cells.values()
+    )
+
+    return {
+        "subjects": sorted(subject_averages),
+        "terms": sorted({semester for _, semester in columns if semester is not None}),
+        "students": [
+            {
+                "student_id": student.student_id,
+                "student_name": student.student_name,
+                "enrollment": student.enrollment,
+                "grades": [
+                    {"subject": subject, "semester": semester, "average": average, "count": count}
+                    for (subject, semester), (average, count) in sorted(
+                        student.cells.items(), key=lambda item: (item[0][0], item[0][1] or 0)
+                    )
+                ],
+                "average": student.average if student.average is not None else 0,
+                "total_grades": student.total_grades,
+            }
+            for student in students.values()
+        ],
+        "subject_averages": subject_averages,
+        "class_average": round(grade_total / total_grades, 2) if total_grades else None,
+        "total_students": len(students),
+    }
+
+
+def _column_label(subject: str, semester: Optional[int]) -> str:
+    return f"{subject} ({semester}º sem)" if semester is not None else subject
+
+
+def _sheet_columns(db: Session, class_id: int, filters: GradeSheetFilters) -> List[Tuple[str, Optional[int]]]:
+    """Distinct (subject, semester) pairs graded in the class, header order"""
+    cells = grade_sheet_query(class_id, filters).subquery()
+    rows = db.execute(
+        select(cells.c.subject, cells.c.semester)
+        .where(cells.c.subject.isnot(None))
+        .distinct()
+    )
+    return sorted(
+        ((subject, semester) for subject, semester in rows),
+        key=lambda column: (column[0], column[1] or 0),
+    )
+
+
+def stream_grade_sheet_csv(db: Session, class_id: int, filters: GradeSheetFilters) -> Iterator[str]:
+    """
+    Wide CSV (one line per student, one column per subject/term)
+
+    Reads the cells in batches and emits each student's line as soon as
+    the next student starts, so memory stays flat for large classes. The
+    session is closed when the stream ends.
+    """
+    try:
+        statement = grade_sheet_query(class_id, filters)
+        columns = _sheet_columns(db, class_id, filters)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        def flush() -> str:
+            value = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            return value
+
+        writer.writerow(
+            ["student_id", "student_name", "enrollment"]
+            + [_column_label(subject, semester) for subject, semester in columns]
+            + ["average", "total_grades"]
+        )
+        yield flush()
+
+        current: Optional[StudentRow] = None
+        subject_averages: Dict[str, Optional[float]] = {}
+
+        def student_line(student: StudentRow) -> List[Any]:
+            return (
+                [student.student_id, student.student_name, student.enrollment or ""]
+                + [
+                    student.cells.get(column, ("", 0))[0]
+                    for column in columns
+                ]
+                + [student.average if student.average is not None else "", student.total_grades]
+            )
+
+        result = db.execute(statement.execution_options(yield_per=STREAM_BATCH_SIZE))
+        for row in result:
+            if current is None or current.student_id != row.student_id:
+                if current is not None:
+                    writer.writerow(student_line(current))
+                    yield flush()
+                current = StudentRow(
+                    student_id=row.student_id,
+                    student_name=f"{row.first_name} {row.last_name}",
+                    enrollment=row.enrollment_number,
+                    average=_round(row.student_average),
+                    total_grades=int(row.student_count or 0),
+                )
+            if row.subject is not None:
+                current.cells[(row.subject, row.semester)] = (_round(row.cell_average), int(row.cell_count))
+                subject_averages[row.subject] = _round(row.subject_average)
+        if current is not None:
+            writer.writerow(student_line(current))
+
+        # Footer with the class average of each column's subject
+        writer.writerow(
+            ["", "Média da disciplina", ""]
+            + [subject_averages.get(subject, "") for subject, _ in columns]
+            + ["", ""]
+        )
+        yield flush()
+    finally:
+        db.close()
@@ -0,0 +1,203 @@
+"""
+Per-user message counters
+
+The stats badge (GET /messages/stats/overview, polled by the frontend) and
+the "message_counts" WebSocket frame read one message_counters row instead
+of a COUNT per figure. Rows change in the caller's transaction through the
+conversation hooks (app.services.conversations) on send, read and delete.
+Only existing rows are updated: a missing row is filled from the messages
+on the next read. reconcile_counts() repairs drift (for instance an
+increment that raced the fill of the row); it runs every
+MESSAGE_COUNTERS_RECONCILE_MINUTES and from
+scripts/reconcile_message_counters.py.
+"""
+import asyncio
+import logging
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterable, List, Tuple
+
+from sqlalchemy import case, func, insert, literal, select, union_all, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import AsyncSessionLocal
+from app.models.message import Message, MessageCounter
+
+logger = logging.getLogger(__name__)
+
+COUNTER_FIELDS = ("sent", "received", "unread")
+
+
+@dataclass
+class MessageCounts:
+    """Message counters of one user"""
+
+    sent: int = 0
+    received: int = 0
+    unread: int = 0
+
+
+def counts_query(user_ids: Iterable[str]):
+    """Sent/received/unread per user from messages, one grouped statement"""
+    ids = list(user_ids)
+    sent = select(
+        Message.sender_id.label("user_id"),
+        func.count().label("sent"),
+        literal(0).label("received"),
+        literal(0).label("unread"),
+    ).where(
+        Message.sender_id.in_(ids), Message.deleted_at.is_(None)
+    ).group_by(Message.sender_id)
+    received = select(
+        Message.recipient_id.label("user_id"),
+        literal(0).label("sent"),
+        func.count().label("received"),
+        func.sum(case((Message.read == False, 1), else_=0)).label("unread"),
+    ).where(
+        Message.recipient_id.in_(ids), Message.deleted_at.is_(None)
+    ).group_by(Message.recipient_id)
+    both = union_all(sent, received).subquery()
+    return select(
+        both.c.user_id,
+        func.sum(both.c.sent).label("sent"),
+        func.sum(both.c.received).label("received"),
+        func.sum(both.c.unread).label("unread"),
+    ).group_by(both.c.user_id)
+
+
+async def _from_messages(db: AsyncSession, user_ids: List[str]) -> Dict[str, MessageCounts]:
+    counts = {user_id: MessageCounts() for user_id in user_ids}
+    for row in await db.execute(counts_query(user_ids)):
+        counts[row.user_id] = MessageCounts(int(row.sent or 0), int(row.received or 0), int(row.unread or 0))
+    return counts
+
+
+def message_deltas(messages: Iterable[Any]) -> Dict[str, Dict[str, int]]:
+    """Counter changes for new messages: sent for the sender, received and unread for the recipient"""
+    deltas: Dict[str, Dict[str, int]] = {}
+    for message in messages:
+        sender = deltas.setdefault(message.sender_id, dict.fromkeys(COUNTER_FIELDS, 0))
+        sender["sent"] += 1
+        recipient = deltas.setdefault(message.recipient_id, dict.fromkeys(COUNTER_FIELDS, 0))
+        recipient["received"] += 1
+        if not getattr(message, "read", False):
+            recipient["unread"] += 1
+    return deltas
+
+
+async def apply_deltas(db: AsyncSession, deltas: Dict[str, Dict[str, int]]) -> None:
+    """
+    Add user_id -> {field: delta} to the existing counter rows
+
+    Users with the same changes share one UPDATE (a batch of messages to
+    different recipients is a couple of statements). Counters never go
+    below zero.
+    """
+    by_change: Dict[Tuple[Tuple[str, int], ...], List[str]] = {}
+    for user_id, changes in deltas.items():
+        key = tuple(sorted((field, delta) for field, delta in changes.items() if delta))
+        if key:
+            by_change.setdefault(key, []).append(user_id)
+
+    for changes, user_ids in by_change.items():
+        values = {}
+        for field, delta in changes:
+            value = getattr(MessageCounter, field) + delta
+            values[field] = case((value < 0, 0), else_=value) if delta < 0 else value
+        await db.execute(update(MessageCounter).where(MessageCounter.user_id.in_(user_ids)).values(values))
+
+
+async def get_counts(db: AsyncSession, user_ids: Iterable[str], backfill: bool = True) -> Dict[str, MessageCounts]:
+    """
+    Counters of the users (one read of message_counters)
+
+    With backfill, users without a row get one computed from the messages
+    (written in a savepoint, the caller commits); otherwise they are left
+    out of the result.
+    """
+    ids = list(dict.fromkeys(user_ids))
+    if not ids:
+        return {}
+    counts = {
+        row.user_id: MessageCounts(row.sent, row.received, row.unread)
+        for row in (await db.execute(select(MessageCounter).where(MessageCounter.user_id.in_(ids)))).scalars()
+    }
+    missing = [user_id for user_id in ids if user_id not in counts]
+    if not missing or not backfill:
+        return counts
+
+    computed = await _from_messages(db, missing)
+    try:
+        async with db.begin_nested():
+            await db.execute(
+                insert(MessageCounter),
+                [{"user_id": user_id, **asdict(computed[user_id])} for user_id in missing],
+            )
+    except IntegrityError as e:
+        # Another request created the row first; the aggregate answers this one
+        logger.warning(f"Message counter backfill skipped: {e}")
+    counts.update(computed)
+    return counts
+
+
+async def refresh_counts(db: AsyncSession, user_ids: Iterable[str]) -> None:
+    """Recompute the existing counter rows of the users from messages (caller's transaction)"""
+    ids = list(await get_counts(db, user_ids, backfill=False))
+    if not ids:
+        return
+    await db.flush()
+    actual = await _from_messages(db, ids)
+    await db.execute(update(MessageCounter), [{"user_id": user_id, **asdict(actual[user_id])} for user_id in ids])
+
+
+async def reconcile_counts(db: AsyncSession, batch_size: int = 500) -> Tuple[int, int]:
+    """
+    Compare every counter row with the messages and fix the drifted ones
+
+    Walks the table in user_id order, batch_size rows (one grouped query
+    and one commit) at a time. Returns (checked, repaired). A change that
+    races the repair of its row is fixed on the next run.
+    """
+    checked = repaired = 0
+    after = ""
+    while True:
+        ids = (await db.execute(
+            select(MessageCounter.user_id)
+            .where(MessageCounter.user_id > after)
+            .order_by(MessageCounter.user_id)
+            .limit(batch_size)
+        )).scalars().all()
+        if not ids:
+            return checked, repaired
+        after = ids[-1]
+
+        stored = await get_counts(db, ids, backfill=False)
+        actual = await _from_messages(db, ids)
+        drifted = [
+            {"user_id": user_id, **asdict(actual[user_id])}
+            for user_id in ids
+            if user_id in stored and stored[user_id] != actual[user_id]
+        ]
+        if drifted:
+            await db.execute(update(MessageCounter), drifted)
+        await db.commit()
+        checked += len(ids)
+        repaired += len(drifted)
+
+
+async def run_reconciliation(interval_minutes: int, session_factory=AsyncSessionLocal) -> None:
+    """Reconcile every interval_minutes until cancelled"""
+    while True:
+        await asyncio.sleep(interval_minutes * 60)
+        try:
+            async with session_factory() as db:
+                checked, repaired = await reconcile_counts(db)
+            if repaired:
+                logger.warning(f"Message counters: repaired {repaired} of {checked} rows")
+        except Exception as e:
+            logger.error(f"Message counter reconciliation failed: {e}")
+
+
+def counts_message(counts: MessageCounts) -> Dict[str, Any]:
+    """WebSocket frame with a user's counters"""
+    return {"type": "message_counts", **asdict(counts)}
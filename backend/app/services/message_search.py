@@ -0,0 +1,341 @@
+"""
+Full-text message search
+
+Message content is indexed by the database itself, so inserts and edits
+from every writer (REST endpoints, the chat write-behind queue, imports)
+are picked up in the same transaction:
+
+- SQLite (development): an external-content FTS5 table, messages_fts, over
+  messages.content, kept in step by AFTER INSERT/UPDATE/DELETE triggers.
+  Accents are folded (unicode61 remove_diacritics); FTS5 has no
+  Portuguese stemmer, so terms match whole words. Ranked with bm25().
+  FTS5 rows are keyed by messages_fts_keys.id (INTEGER PRIMARY KEY, one
+  per message id) rather than the implicit messages rowid, which VACUUM
+  may renumber; messages_fts_source joins the keys to the content.
+- PostgreSQL: a GIN expression index on
+  to_tsvector(MESSAGE_SEARCH_LANGUAGE, content) (Portuguese stemming and
+  stop words), queried with websearch_to_tsquery() and ranked with
+  ts_rank_cd(). Maintained by PostgreSQL on every write.
+
+Other dialects, or MESSAGE_SEARCH_BACKEND=like, fall back to ILIKE.
+The index is never built on startup: scripts/migrate_message_search.py
+creates it (CONCURRENTLY on PostgreSQL). Until then SQLite searches with
+LIKE and PostgreSQL without the index. search_condition()
+filters GET /messages by a search term; search_messages() returns ranked
+hits with highlighted snippets for GET /messages/search.
+"""
+import logging
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from sqlalchemy import column, false, func, literal, literal_column, or_, select, table, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+
+from app.config import settings
+from app.models.message import Message
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "messages_fts"
+FTS_KEYS = "messages_fts_keys"
+FTS_SOURCE = "messages_fts_source"
+POSTGRES_INDEX = "idx_messages_content_fts"
+HIGHLIGHT = ("<mark>", "</mark>")
+ELLIPSIS = "…"
+# Words around the matches in a snippet
+SNIPPET_WORDS = 16
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+_LANGUAGE = re.compile(r"^[a-z_]+$")
+
+_fts = table(FTS_TABLE, column("rowid"), column("content"))
+_fts_ref = literal_column(FTS_TABLE)
+_fts_keys = table(FTS_KEYS, column("id"), column("message_id"))
+
+_SQLITE_DDL = (
+    f"""
+    CREATE TABLE IF NOT EXISTS {FTS_KEYS} (
+        id INTEGER PRIMARY KEY,
+        message_id VARCHAR(36) NOT NULL UNIQUE
+    )
+    """,
+    f"""
+    CREATE VIEW IF NOT EXISTS {FTS_SOURCE} AS
+    SELECT {FTS_KEYS}.id AS id, messages.content AS content
+    FROM {FTS_KEYS} JOIN messages ON messages.id = {FTS_KEYS}.message_id
+    """,
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        content, content='{FTS_SOURCE}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO {FTS_KEYS}(message_id) VALUES (new.id);
+        INSERT INTO {FTS_TABLE}(rowid, content)
+        SELECT id, new.content FROM {FTS_KEYS} WHERE message_id = new.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content)
+        SELECT 'delete', id, old.content FROM {FTS_KEYS} WHERE message_id = old.id;
+        DELETE FROM {FTS_KEYS} WHERE message_id = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF content ON messages BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content)
+        SELECT 'delete', id, old.content FROM {FTS_KEYS} WHERE message_id = old.id;
+        INSERT INTO {FTS_TABLE}(rowid, content)
+        SELECT id, new.content FROM {FTS_KEYS} WHERE message_id = new.id;
+    END
+    """,
+)
+
+# Database URL -> messages_fts exists (SQLite), cached once found
+_sqlite_index: Dict[str, bool] = {}
+
+
+@dataclass
+class SearchHit:
+    """A message matching a search, best match first"""
+
+    message: Message
+    rank: float
+    snippet: str
+
+
+def _language() -> str:
+    language = settings.message_search_language
+    if not _LANGUAGE.match(language):
+        raise ValueError(f"Invalid MESSAGE_SEARCH_LANGUAGE: {language!r}")
+    return language
+
+
+def _regconfig():
+    # Literal (not a bound parameter) so queries match the expression index
+    return literal_column(f"'{_language()}'::regconfig")
+
+
+def _vector():
+    return func.to_tsvector(_regconfig(), Message.content)
+
+
+def _tsquery(term: str):
+    return func.websearch_to_tsquery(_regconfig(), term)
+
+
+def fts5_query(term: str) -> Optional[str]:
+    """FTS5 MATCH expression for free text: every word, quoted, must occur"""
+    words = _TOKEN.findall(term)
+    if not words:
+        return None
+    return " ".join(f'"{word}"' for word in words)
+
+
+def _sqlite_table_exists(conn, name: str) -> bool:
+    return bool(conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": name}
+    ).scalar())
+
+
+def _create_postgres_index(target: Engine) -> None:
+    # CONCURRENTLY keeps messages writable during the build; it cannot run
+    # in a transaction, and a failed build leaves an INVALID index to redo
+    with target.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        valid = conn.execute(
+            text("SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name"),
+            {"name": POSTGRES_INDEX}
+        ).scalar()
+        if valid is False:
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {POSTGRES_INDEX}"))
+        conn.execute(text(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {POSTGRES_INDEX} ON messages "
+            f"USING gin (to_tsvector('{_language()}'::regconfig, content))"
+        ))
+
+
+def create_search_index(target: Engine, rebuild: bool = False) -> str:
+    """
+    Create the full-text index for the engine's dialect if missing
+
+    A new SQLite index (or any, with rebuild) is filled from the existing
+    messages; an index from an earlier version, keyed by the messages
+    rowid, is replaced. Returns the backend in use ("fts5", "postgresql"
+    or "like").
+    """
+    dialect_name = target.dialect.name
+    if settings.message_search_backend != "fulltext":
+        return "like"
+    if dialect_name == "postgresql":
+        _create_postgres_index(target)
+        return "postgresql"
+    if dialect_name != "sqlite":
+        return "like"
+
+    try:
+        with target.begin() as conn:
+            exists = _sqlite_table_exists(conn, FTS_TABLE)
+            if exists and not _sqlite_table_exists(conn, FTS_KEYS):
+                for trigger in ("insert", "delete", "update"):
+                    conn.execute(text(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{trigger}"))
+                conn.execute(text(f"DROP TABLE {FTS_TABLE}"))
+                exists = False
+            for statement in _SQLITE_DDL:
+                conn.execute(text(statement))
+            if not exists or rebuild:
+                conn.execute(text(
+                    f"INSERT OR IGNORE INTO {FTS_KEYS}(message_id) SELECT id FROM messages ORDER BY created_at, id"
+                ))
+                conn.execute(text(f"DELETE FROM {FTS_KEYS} WHERE message_id NOT IN (SELECT id FROM messages)"))
+                conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    except Exception as e:
+        # SQLite built without FTS5
+        logger.warning(f"Message search index unavailable, using LIKE: {e}")
+        return "like"
+    _sqlite_index[str(target.url)] = True
+    return "fts5"
+
+
+async def search_backend(db: AsyncSession) -> str:
+    """Backend the session's database searches with: "fts5", "postgresql" or "like\""""
+    if settings.message_search_backend != "fulltext":
+        return "like"
+    bind = db.get_bind()
+    if bind.dialect.name == "postgresql":
+        return "postgresql"
+    if bind.dialect.name != "sqlite":
+        return "like"
+    key = str(bind.url)
+    if not _sqlite_index.get(key):
+        # Checked again until scripts/migrate_message_search.py creates it
+        _sqlite_index[key] = bool(await db.scalar(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_KEYS}
+        ))
+    return "fts5" if _sqlite_index[key] else "like"
+
+
+def _like_pattern(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def search_condition(backend: str, term: str):
+    """WHERE clause restricting a messages query to those matching term"""
+    if backend == "fts5":
+        match = fts5_query(term)
+        if match is None:
+            return false()
+        return Message.id.in_(
+            select(_fts_keys.c.message_id)
+            .join(_fts, _fts.c.rowid == _fts_keys.c.id)
+            .where(_fts_ref.op("MATCH")(match))
+        )
+    if backend == "postgresql":
+        return _vector().op("@@")(_tsquery(term))
+    return Message.content.ilike(_like_pattern(term), escape="\\")
+
+
+def _like_snippet(content: str, term: str) -> str:
+    """Snippet around the first occurrence of term, for the LIKE backend"""
+    keep = SNIPPET_WORDS // 2
+    position = content.lower().find(term.lower())
+    if position < 0:
+        words = content.split(" ")
+        return " ".join(words[:SNIPPET_WORDS]) + (ELLIPSIS if len(words) > SNIPPET_WORDS else "")
+    end = position + len(term)
+    # Split on spaces only, so a match inside a word stays attached to it
+    before = content[:position].split(" ")
+    after = content[end:].split(" ")
+    return "".join((
+        ELLIPSIS if len(before) > keep + 1 else "",
+        " ".join(before[-keep - 1:]),
+        HIGHLIGHT[0], content[position:end], HIGHLIGHT[1],
+        " ".join(after[:keep + 1]),
+        ELLIPSIS if len(after) > keep + 1 else "",
+    ))
+
+
+async def search_messages(
+    db: AsyncSession,
+    user_id: str,
+    institution_id: str,
+    term: str,
+    limit: int,
+    offset: int = 0,
+) -> List[SearchHit]:
+    """
+    The user's messages (sent or received, not deleted) matching term
+
+    Best match first, then newest.
+    """
+    backend = await search_backend(db)
+    scope = (
+        Message.institution_id == institution_id,
+        or_(Message.sender_id == user_id, Message.recipient_id == user_id),
+        Message.deleted_at.is_(None),
+    )
+
+    if backend == "fts5":
+        match = fts5_query(term)
+        if match is None:
+            return []
+        rank = -func.bm25(_fts_ref)
+        snippet = func.snippet(_fts_ref, 0, HIGHLIGHT[0], HIGHLIGHT[1], ELLIPSIS, SNIPPET_WORDS)
+        query = (
+            select(Message, rank.label("rank"), snippet.label("snippet"))
+            .select_from(_fts)
+            .join(_fts_keys, _fts_keys.c.id == _fts.c.rowid)
+            .join(Message, Message.id == _fts_keys.c.message_id)
+            .where(_fts_ref.op("MATCH")(match), *scope)
+        )
+    elif backend == "postgresql":
+        tsquery = _tsquery(term)
+        rank = func.ts_rank_cd(_vector(), tsquery)
+        snippet = func.ts_headline(
+            _regconfig(), Message.content, tsquery,
+            f"StartSel={HIGHLIGHT[0]}, StopSel={HIGHLIGHT[1]}, MaxWords={SNIPPET_WORDS}, MinWords=5, "
+            f"MaxFragments=1, FragmentDelimiter={ELLIPSIS}"
+        )
+        query = select(Message, rank.label("rank"), snippet.label("snippet")).where(
+            _vector().op("@@")(tsquery), *scope
+        )
+    else:
+        rank = literal(0.0)
+        query = select(Message, rank.label("rank"), Message.content.label("snippet")).where(
+            search_condition(backend, term), *scope
+        )
+
+    query = (
+        query.options(joinedload(Message.sender), joinedload(Message.recipient))
+        .order_by(rank.desc(), Message.created_at.desc(), Message.id.desc())
+        .limit(limit)
+        .offset(offset)
+    )
+    rows = (await db.execute(query)).unique().all()
+    return [
+        SearchHit(
+            message=row[0],
+            rank=float(row.rank or 0),
+            snippet=row.snippet if backend != "like" else _like_snippet(row.snippet or "", term),
+        )
+        for row in rows
+    ]
+
+
+async def count_matches(db: AsyncSession, user_id: str, institution_id: str, term: str) -> int:
+    """Number of the user's messages matching term"""
+    backend = await search_backend(db)
+    return await db.scalar(
+        select(func.count()).select_from(Message).where(
+            search_condition(backend, term),
+            Message.institution_id == institution_id,
+            or_(Message.sender_id == user_id, Message.recipient_id == user_id),
+            Message.deleted_at.is_(None),
+        )
+    )
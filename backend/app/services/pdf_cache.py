@@ -0,0 +1,219 @@
+"""
+Content-addressed cache of bulletin extractions
+
+Schools upload the same bulletin PDFs again and again. Extraction results
+are stored in pdf_extraction_cache under the SHA-256 of the PDF and
+EXTRACTOR_VERSION (plus the OCR settings that change the text):
+
+- cached_bulletin(): enqueue_job completes an upload whose final result
+  is cached right away, without queueing it for a worker
+- extract_with_cache(): a worker reuses the final result, or only the
+  parsed text and tables when the structuring mode changed (Gemini key
+  added or removed), skipping pdfplumber and OCR
+- entries past PDF_CACHE_MAX_MB are evicted least recently used first
+
+cache_stats() reports the hit rate (GET /api/v1/pdf/cache/stats).
+"""
+import hashlib
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.pdf_cache import PDFExtractionCache
+from app.schemas.pdf_extraction import BulletinData
+
+logger = logging.getLogger(__name__)
+
+# Bump when pdf_pages or PDFExtractor change what they extract: entries of
+# other versions are never read again and age out of the cache
+EXTRACTOR_VERSION = "3"
+# Eviction frees down to this fraction of the limit, so it runs in batches
+EVICT_TO = 0.9
+EVICT_BATCH = 500
+
+
+def content_hash(pdf_bytes: bytes) -> str:
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+def cache_key(digest: str) -> str:
+    return f"{digest}:{EXTRACTOR_VERSION}:{settings.pdf_ocr_page_min_chars}:{settings.pdf_ocr_dpi}"
+
+
+def extraction_mode() -> str:
+    """How PDFExtractor structures the text: "ai" (Gemini) or "regex" """
+    return "ai" if settings.gemini_api_key else "regex"
+
+
+async def _get_entry(db: AsyncSession, digest: str) -> Optional[PDFExtractionCache]:
+    return await db.scalar(select(PDFExtractionCache).where(PDFExtractionCache.cache_key == cache_key(digest)))
+
+
+async def _count_use(db: AsyncSession, entry_id: str) -> None:
+    await db.execute(
+        update(PDFExtractionCache)
+        .where(PDFExtractionCache.id == entry_id)
+        .values(hits=PDFExtractionCache.hits + 1, last_used_at=datetime.utcnow())
+    )
+    await db.commit()
+
+
+async def cached_bulletin(db: AsyncSession, pdf_bytes: bytes) -> Optional[Dict[str, Any]]:
+    """Final result (BulletinData as JSON) of this PDF in the current mode, if cached"""
+    entry = await _get_entry(db, content_hash(pdf_bytes))
+    if entry is None or entry.bulletin is None or entry.bulletin_mode != extraction_mode():
+        return None
+    bulletin = entry.bulletin
+    await _count_use(db, entry.id)
+    return bulletin
+
+
+async def store(
+    db: AsyncSession,
+    digest: str,
+    text: str,
+    tables: List,
+    bulletin: Dict[str, Any],
+    mode: str,
+) -> None:
+    """Save (or replace the final result of) an extraction, then enforce the size bound"""
+    size = len(text.encode()) + len(json.dumps(tables)) + len(json.dumps(bulletin))
+    entry = await _get_entry(db, digest)
+    if entry is None:
+        db.add(PDFExtractionCache(
+            cache_key=cache_key(digest),
+            content_hash=digest,
+            text=text,
+            tables=tables,
+            bulletin=bulletin,
+            bulletin_mode=mode,
+            size=size,
+        ))
+    else:
+        entry.bulletin, entry.bulletin_mode, entry.size = bulletin, mode, size
+        entry.last_used_at = datetime.utcnow()
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Another worker stored the same PDF first
+        await db.rollback()
+        return
+    await evict(db)
+
+
+async def evict(db: AsyncSession, max_bytes: Optional[int] = None) -> int:
+    """Delete least recently used entries while the cache is over max_bytes, returns how many"""
+    if max_bytes is None:
+        max_bytes = int(settings.pdf_cache_max_mb * 1024 * 1024)
+    total = await db.scalar(select(func.coalesce(func.sum(PDFExtractionCache.size), 0)))
+    if total <= max_bytes:
+        return 0
+
+    target = max_bytes * EVICT_TO
+    evicted = 0
+    while total > target:
+        rows = (await db.execute(
+            select(PDFExtractionCache.id, PDFExtractionCache.size)
+            .order_by(PDFExtractionCache.last_used_at, PDFExtractionCache.id)
+            .limit(EVICT_BATCH)
+        )).all()
+        if not rows:
+            break
+        ids = []
+        for entry_id, size in rows:
+            if total <= target:
+                break
+            ids.append(entry_id)
+            total -= size
+        await db.execute(delete(PDFExtractionCache).where(PDFExtractionCache.id.in_(ids)))
+        await db.commit()
+        evicted += len(ids)
+    logger.info(f"PDF cache: {evicted} entries evicted")
+    return evicted
+
+
+async def cache_stats(db: AsyncSession) -> Dict[str, Any]:
+    """
+    Entries, size and hit rate of the cache
+
+    Hits count uploads served from an entry, fully or only its text and
+    tables. Every entry was one miss, so the hit rate is hits / (hits +
+    entries), over the entries currently cached (evicted ones drop out).
+    """
+    entries, size, hits = (await db.execute(
+        select(
+            func.count(),
+            func.coalesce(func.sum(PDFExtractionCache.size), 0),
+            func.coalesce(func.sum(PDFExtractionCache.hits), 0),
+        )
+    )).one()
+    return {
+        "entries": entries,
+        "size_bytes": size,
+        "max_bytes": int(settings.pdf_cache_max_mb * 1024 * 1024),
+        "hits": hits,
+        "misses": entries,
+        "hit_rate": round(hits / (hits + entries), 4) if hits + entries else 0.0,
+        "extractor_version": EXTRACTOR_VERSION,
+    }
+
+
+async def extract_with_cache(
+    pdf_bytes: bytes,
+    filename: str,
+    gemini_api_key: Optional[str] = None,
+    progress=None,
+    session_factory=AsyncSessionLocal,
+) -> Tuple[BulletinData, str]:
+    """
+    PDFExtractor's result through the cache: (bulletin, "hit" | "partial" | "miss")
+
+    "partial" reused the parsed text and tables and only ran the
+    structuring step. A cache that cannot be read or written is logged
+    and the PDF extracted as usual.
+    """
+    # Imported here so the API process never loads pdfplumber/OCR
+    from app.services.pdf_extractor import PDFExtractor
+
+    extractor = PDFExtractor(gemini_api_key=gemini_api_key, progress=progress)
+    if not settings.pdf_cache_enabled:
+        return await extractor.extract_from_pdf(pdf_bytes, filename), "miss"
+
+    digest = content_hash(pdf_bytes)
+    mode = extraction_mode()
+    parsed = None
+    try:
+        async with session_factory() as db:
+            entry = await _get_entry(db, digest)
+            if entry is not None:
+                cached = entry.bulletin if entry.bulletin_mode == mode else None
+                parsed = (entry.text, entry.tables)
+                await _count_use(db, entry.id)
+                if cached is not None:
+                    logger.info(f"PDF {filename}: extraction cached")
+                    return BulletinData(**cached), "hit"
+    except Exception as e:
+        logger.warning(f"PDF cache unavailable, extracting {filename}: {e}")
+
+    if parsed is None:
+        text, tables = await extractor.parse(pdf_bytes)
+        outcome = "miss"
+    else:
+        logger.info(f"PDF {filename}: text and tables cached, structuring only")
+        text, tables = parsed
+        outcome = "partial"
+    bulletin = await extractor.structure(text, tables)
+
+    try:
+        async with session_factory() as db:
+            await store(db, digest, text, tables, bulletin.model_dump(mode="json"), mode)
+    except Exception as e:
+        logger.warning(f"PDF cache: {filename} not stored: {e}")
+    return bulletin, outcome
@@ -1,13 +1,17 @@
 """
 Serviço de extração de dados de PDFs usando IA
+
+O trabalho pesado (pdfplumber, OCR) roda por faixas de páginas em um
+ProcessPoolExecutor limitado (PDF_PROCESS_WORKERS), fora do event loop.
 """
-import pdfplumber
-import pytesseract
-from PIL import Image
-import io
+import asyncio
 import json
+import multiprocessing
+import os
 import re
-from typing import Dict, Any, Optional, List
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, Optional, List, Callable, Awaitable, Tuple
 import logging
 from datetime import datetime
 
@@ -18,13 +22,54 @@ try:
 except ImportError:
     GEMINI_AVAILABLE = False
 
+from ..config import settings
 from ..schemas.pdf_extraction import (
     BulletinData, StudentInfo, SubjectGrade, 
     AttendanceInfo, InstitutionInfo
 )
+from . import pdf_pages
 
 logger = logging.getLogger(__name__)
 
+# Callback de progresso: (percentual 0-100, etapa)
+ProgressCallback = Callable[[int, str], Awaitable[None]]
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def process_pool_size() -> int:
+    """Processos de extração: PDF_PROCESS_WORKERS, 0 = um por núcleo"""
+    return settings.pdf_process_workers or os.cpu_count() or 1
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Pool compartilhado (criado no primeiro uso)"""
+    global _process_pool
+    if _process_pool is None:
+        # spawn: os filhos não herdam conexões de banco/event loop (e é o único modo no Windows)
+        _process_pool = ProcessPoolExecutor(
+            max_workers=process_pool_size(),
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _process_pool
+
+
+def shutdown_process_pool(wait: bool = True) -> None:
+    """Encerra o pool (o próximo uso cria outro)"""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=wait, cancel_futures=True)
+        _process_pool = None
+
+
+def page_ranges(total_pages: int, pages_per_task: int) -> List[Tuple[int, int]]:
+    """Faixas (primeira, última) de até pages_per_task páginas, base 1"""
+    pages_per_task = max(pages_per_task, 1)
+    return [
+        (first, min(first + pages_per_task - 1, total_pages))
+        for first in range(1, total_pages + 1, pages_per_task)
+    ]
+
 
 class PDFExtractor:
     """
@@ -32,8 +77,9 @@ class PDFExtractor:
     Usa múltiplas técnicas: pdfplumber, OCR, e IA
     """
     
-    def __init__(self, gemini_api_key: Optional[str] = None):
+    def __init__(self, gemini_api_key: Optional[str] = None, progress: Optional[ProgressCallback] = None):
         self.gemini_api_key = gemini_api_key
+        self.progress = progress
         self.model = None
         
         if GEMINI_AVAILABLE and gemini_api_key:
@@ -45,6 +91,54 @@ class PDFExtractor:
                 logger.error(f"Erro ao inicializar Gemini: {e}")
                 self.model = None
     
+    async def _report(self, percent: int, stage: str) -> None:
+        """Informa o progresso (fila de jobs), se houver callback"""
+        if self.progress is not None:
+            await self.progress(min(int(percent), 100), stage)
+    
+    async def _run_pages(
+        self,
+        function: Callable,
+        pdf_bytes: bytes,
+        tasks: List[Tuple[int, tuple]],
+        progress_range: Tuple[int, int],
+        stage: str,
+        *args
+    ) -> List[Any]:
+        """
+        Executa function(pdf_bytes, *argumentos da tarefa, *args) para cada
+        tarefa (número de páginas, argumentos) no pool de processos, em paralelo
+        
+        Retorna os resultados na ordem das tarefas; o progresso avança de
+        progress_range[0] a progress_range[1] conforme as páginas terminam.
+        """
+        loop = asyncio.get_running_loop()
+        pool = get_process_pool()
+        total_pages = sum(pages for pages, _ in tasks)
+        
+        async def run(index: int, pages: int, task_args: tuple):
+            result = await loop.run_in_executor(pool, function, pdf_bytes, *task_args, *args)
+            return index, pages, result
+        
+        start, end = progress_range
+        results: List[Any] = [None] * len(tasks)
+        done_pages = 0
+        try:
+            for finished in asyncio.as_completed([run(i, pages, task_args) for i, (pages, task_args) in enumerate(tasks)]):
+                index, pages, result = await finished
+                results[index] = result
+                done_pages += pages
+                await self._report(start + (end - start) * done_pages // total_pages, stage)
+        except BrokenProcessPool:
+            # Um processo morreu (ex.: falta de memória): recria o pool no próximo uso
+            shutdown_process_pool(wait=False)
+            raise
+        return results
+    
+    def _pages_per_task(self, total_pages: int) -> int:
+        """Divide o documento igualmente entre os processos do pool"""
+        return -(-total_pages // process_pool_size())
+    
     async def extract_from_pdf(self, pdf_bytes: bytes, filename: str) -> BulletinData:
         """
         Método principal de extração
@@ -59,28 +153,8 @@ class PDFExtractor:
         logger.info(f"Iniciando extração de {filename}")
         
         try:
-            # Etapa 1: Extrair texto com pdfplumber
-            text = await self._extract_text(pdf_bytes)
-            logger.debug(f"Texto extraído (primeiros 500 chars): {text[:500]}")
-            
-            # Etapa 2: Se texto vazio ou insuficiente, usar OCR
-            if len(text.strip()) < 100:
-                logger.info("Texto insuficiente, aplicando OCR")
-                text = await self._extract_with_ocr(pdf_bytes)
-            
-            # Etapa 3: Extrair tabelas estruturadas
-            tables = await self._extract_tables(pdf_bytes)
-            logger.info(f"Encontradas {len(tables)} tabelas")
-            
-            # Etapa 4: Usar IA para estruturar dados
-            if self.model:
-                bulletin_data = await self._extract_with_ai(text, tables)
-            else:
-                # Fallback: extração baseada em regex
-                bulletin_data = await self._extract_with_regex(text, tables)
-            
-            # Etapa 5: Validar e calcular métricas
-            bulletin_data = self._validate_and_enrich(bulletin_data)
+            text, tables = await self.parse(pdf_bytes)
+            bulletin_data = await self.structure(text, tables)
             
             logger.info(f"Extração concluída: {bulletin_data.student.full_name}")
             return bulletin_data
@@ -89,57 +163,86 @@ class PDFExtractor:
             logger.error(f"Erro na extração: {str(e)}", exc_info=True)
             raise
     
-    async def _extract_text(self, pdf_bytes: bytes) -> str:
-        """Extrai texto do PDF usando pdfplumber"""
-        text_parts = []
+    async def parse(self, pdf_bytes: bytes) -> Tuple[str, List[List[List[str]]]]:
+        """
+        Etapas 1 e 2: texto e tabelas do PDF (pdfplumber e OCR)
         
-        with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-            for page_num, page in enumerate(pdf.pages, 1):
-                try:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text_parts.append(f"--- Página {page_num} ---\n{page_text}")
-                except Exception as e:
-                    logger.warning(f"Erro ao extrair texto da página {page_num}: {e}")
+        O resultado depende só do PDF, não do modo de estruturação, e é o
+        que o cache de extração guarda como resultado intermediário.
+        """
+        # Etapa 1: Extrair texto e tabelas com pdfplumber (uma passada por página)
+        await self._report(5, "text")
+        total_pages = await asyncio.get_running_loop().run_in_executor(
+            get_process_pool(), pdf_pages.page_count, pdf_bytes
+        )
+        pages = await self._parse_pages(pdf_bytes, total_pages)
+        tables = [table for _, _, page_tables, _ in pages for table in page_tables]
+        logger.info(f"Encontradas {len(tables)} tabelas")
         
-        return "\n\n".join(text_parts)
-    
-    async def _extract_tables(self, pdf_bytes: bytes) -> List[List[List[str]]]:
-        """Extrai tabelas estruturadas do PDF"""
-        all_tables = []
+        # Etapa 2: OCR só nas páginas digitalizadas (imagem sem texto)
+        scanned = [page for _, _, _, page in pages if page is not None]
+        ocr_text: Dict[int, str] = {}
+        if scanned:
+            logger.info(f"{len(scanned)} de {total_pages} páginas sem texto, aplicando OCR")
+            await self._report(40, "ocr")
+            ocr_text = await self._extract_with_ocr(pdf_bytes, scanned)
         
-        with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-            for page in pdf.pages:
-                try:
-                    tables = page.extract_tables()
-                    if tables:
-                        all_tables.extend(tables)
-                except Exception as e:
-                    logger.warning(f"Erro ao extrair tabelas: {e}")
+        text = "\n\n".join(
+            f"--- Página {page_num} (OCR) ---\n{ocr_text[page_num]}" if page_num in ocr_text
+            else f"--- Página {page_num} ---\n{page_text}"
+            for page_num, page_text, _, _ in pages
+            if page_text or page_num in ocr_text
+        )
+        logger.debug(f"Texto extraído (primeiros 500 chars): {text[:500]}")
+        return text, tables
+    
+    async def structure(self, text: str, tables: List) -> BulletinData:
+        """Etapas 3 e 4: dados do boletim a partir do texto e das tabelas"""
+        # Etapa 3: Usar IA para estruturar dados
+        await self._report(75, "ai" if self.model else "regex")
+        if self.model:
+            bulletin_data = await self._extract_with_ai(text, tables)
+        else:
+            # Fallback: extração baseada em regex
+            bulletin_data = await self._extract_with_regex(text, tables)
         
-        return all_tables
+        # Etapa 4: Validar e calcular métricas
+        await self._report(95, "validation")
+        bulletin_data = self._validate_and_enrich(bulletin_data)
+        return bulletin_data
     
-    async def _extract_with_ocr(self, pdf_bytes: bytes) -> str:
-        """Usa OCR quando texto não está disponível"""
+    async def _parse_pages(
+        self, pdf_bytes: bytes, total_pages: int
+    ) -> List[Tuple[int, str, List, Optional[pdf_pages.ScannedPage]]]:
+        """
+        (página, texto, tabelas, página digitalizada ou None) de cada
+        página, texto e tabelas de uma vez (páginas em paralelo)
+        """
+        ranges = page_ranges(total_pages, self._pages_per_task(total_pages))
+        chunks = await self._run_pages(
+            pdf_pages.parse_pages, pdf_bytes,
+            [(last - first + 1, (first, last)) for first, last in ranges],
+            (5, 40), "text", settings.pdf_ocr_page_min_chars
+        )
+        return [page for chunk in chunks for page in chunk]
+    
+    async def _extract_with_ocr(self, pdf_bytes: bytes, scanned: List[pdf_pages.ScannedPage]) -> Dict[int, str]:
+        """
+        Texto por OCR das páginas digitalizadas, divididas igualmente entre
+        os processos (cada um grava o PDF uma vez e usa os tamanhos já lidos)
+        """
+        size = self._pages_per_task(len(scanned))
+        chunks = [scanned[i:i + size] for i in range(0, len(scanned), size)]
         try:
-            # Converter PDF para imagem e aplicar OCR
-            from pdf2image import convert_from_bytes
-            
-            images = convert_from_bytes(pdf_bytes, dpi=300)
-            text_parts = []
-            
-            for i, image in enumerate(images, 1):
-                try:
-                    text = pytesseract.image_to_string(image, lang='por')
-                    text_parts.append(f"--- Página {i} (OCR) ---\n{text}")
-                except Exception as e:
-                    logger.warning(f"Erro no OCR da página {i}: {e}")
-            
-            return "\n\n".join(text_parts)
+            results = await self._run_pages(
+                pdf_pages.ocr_pages, pdf_bytes, [(len(chunk), (chunk,)) for chunk in chunks],
+                (40, 75), "ocr", settings.pdf_ocr_dpi
+            )
+            return {page_num: text for result in results for page_num, text in result}
             
         except Exception as e:
             logger.error(f"Erro no processamento OCR: {e}")
-            return ""
+            return {}
     
     async def _extract_with_ai(self, text: str, tables: List) -> BulletinData:
         """Usa Gemini AI para estruturar dados"""
@@ -404,7 +507,8 @@ Retorne APENAS o JSON, sem explicações adicionais.
 async def extract_bulletin_data(
     pdf_bytes: bytes, 
     filename: str,
-    gemini_api_key: Optional[str] = None
+    gemini_api_key: Optional[str] = None,
+    progress: Optional[ProgressCallback] = None
 ) -> BulletinData:
     """
     Função de conveniência para extrair dados de boletim
@@ -413,9 +517,10 @@ async def extract_bulletin_data(
         pdf_bytes: Bytes do arquivo PDF
         filename: Nome do arquivo
         gemini_api_key: Chave da API Gemini (opcional)
+        progress: Callback async (percentual, etapa) chamado durante a extração
         
     Returns:
         BulletinData com dados extraídos
     """
-    extractor = PDFExtractor(gemini_api_key=gemini_api_key)
+    extractor = PDFExtractor(gemini_api_key=gemini_api_key, progress=progress)
     return await extractor.extract_from_pdf(pdf_bytes, filename)
@@ -0,0 +1,353 @@
+"""
+Durable PDF extraction queue
+
+Bulletin uploads become pdf_processing_jobs rows (the PDF is written under
+UPLOAD_PATH/pdf_jobs) and are processed by PDFJobWorker, normally in
+separate processes started with scripts/pdf_worker.py, so OCR never runs
+on the API workers and jobs survive restarts:
+
+- claim_job(): next pending job by priority then age, skipping users that
+  already have PDF_JOBS_PER_USER_LIMIT jobs running; the conditional
+  UPDATE makes concurrent workers claim each job once
+- JobProgress: PDFExtractor's progress callback, writes progress, stage
+  and heartbeat on the row
+- failures are retried PDF_JOB_MAX_ATTEMPTS times with exponential
+  backoff; jobs whose worker stops heartbeating for
+  PDF_JOB_LEASE_SECONDS are requeued (or failed) by any worker
+- a PDF already in the extraction cache (pdf_cache) is completed on
+  upload, without a job for the workers
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional, Set
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.pdf_job import PDFProcessingJob
+from app.services.pdf_cache import cached_bulletin, extract_with_cache
+
+logger = logging.getLogger(__name__)
+
+JOB_DIR = "pdf_jobs"
+FINAL_STATUSES = ("completed", "failed")
+# Candidate re-reads when another worker claims the same job first
+CLAIM_ATTEMPTS = 3
+
+
+def _job_path(job_id: str) -> str:
+    return os.path.join(settings.upload_path, JOB_DIR, f"{job_id}.pdf")
+
+
+def _remove_file(path: Optional[str]) -> None:
+    if path:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+async def enqueue_job(
+    db: AsyncSession,
+    user_id: str,
+    institution_id: Optional[str],
+    filename: str,
+    pdf_bytes: bytes,
+    priority: int = 0,
+) -> PDFProcessingJob:
+    """Store the PDF and queue its extraction, or complete it from the cache (commits)"""
+    bulletin = await cached_bulletin(db, pdf_bytes) if settings.pdf_cache_enabled else None
+    if bulletin is not None:
+        now = datetime.utcnow()
+        job = PDFProcessingJob(
+            user_id=user_id,
+            institution_id=institution_id,
+            filename=filename,
+            size=len(pdf_bytes),
+            file_path="",
+            status="completed",
+            priority=priority,
+            max_attempts=settings.pdf_job_max_attempts,
+            progress=100,
+            extracted_data=bulletin,
+            started_at=now,
+            completed_at=now,
+        )
+        db.add(job)
+        await db.commit()
+        return job
+
+    job_id = str(uuid.uuid4())
+    path = _job_path(job_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(pdf_bytes)
+
+    job = PDFProcessingJob(
+        id=job_id,
+        user_id=user_id,
+        institution_id=institution_id,
+        filename=filename,
+        size=len(pdf_bytes),
+        file_path=path,
+        priority=priority,
+        max_attempts=settings.pdf_job_max_attempts,
+    )
+    db.add(job)
+    try:
+        await db.commit()
+    except Exception:
+        _remove_file(path)
+        raise
+    return job
+
+
+async def delete_job(db: AsyncSession, job: PDFProcessingJob) -> None:
+    """Remove a job and its PDF (a worker running it finds the row gone)"""
+    path = job.file_path
+    await db.delete(job)
+    await db.commit()
+    _remove_file(path)
+
+
+async def claim_job(db: AsyncSession, worker_id: str) -> Optional[PDFProcessingJob]:
+    """Mark the next runnable job as processing by worker_id and return it"""
+    now = datetime.utcnow()
+    query = (
+        select(PDFProcessingJob.id)
+        .where(PDFProcessingJob.status == "pending", PDFProcessingJob.run_after <= now)
+        .order_by(PDFProcessingJob.priority.desc(), PDFProcessingJob.created_at, PDFProcessingJob.id)
+        .limit(1)
+    )
+    if settings.pdf_jobs_per_user_limit > 0:
+        busy_users = (
+            select(PDFProcessingJob.user_id)
+            .where(PDFProcessingJob.status == "processing")
+            .group_by(PDFProcessingJob.user_id)
+            .having(func.count() >= settings.pdf_jobs_per_user_limit)
+        )
+        query = query.where(PDFProcessingJob.user_id.not_in(busy_users))
+
+    for _ in range(CLAIM_ATTEMPTS):
+        job_id = await db.scalar(query)
+        if job_id is None:
+            return None
+        result = await db.execute(
+            update(PDFProcessingJob)
+            .where(PDFProcessingJob.id == job_id, PDFProcessingJob.status == "pending")
+            .values(
+                status="processing",
+                worker_id=worker_id,
+                attempts=PDFProcessingJob.attempts + 1,
+                progress=0,
+                stage="queued",
+                started_at=now,
+                heartbeat_at=now,
+            )
+        )
+        await db.commit()
+        if result.rowcount == 1:
+            return await db.get(PDFProcessingJob, job_id, populate_existing=True)
+    return None
+
+
+def retry_or_fail(job: PDFProcessingJob, error: str, now: Optional[datetime] = None) -> None:
+    """Put a job that did not finish back in the queue with backoff, or fail it"""
+    now = now or datetime.utcnow()
+    job.error_message = error
+    job.worker_id = None
+    if job.attempts >= job.max_attempts:
+        job.status = "failed"
+        job.completed_at = now
+        _remove_file(job.file_path)
+        return
+    job.status = "pending"
+    job.progress = 0
+    job.stage = None
+    job.run_after = now + timedelta(seconds=settings.pdf_job_retry_seconds * 2 ** max(job.attempts - 1, 0))
+
+
+async def requeue_stale(db: AsyncSession) -> int:
+    """Retry (or fail) processing jobs whose worker stopped heartbeating, returns how many"""
+    now = datetime.utcnow()
+    stale = (await db.execute(
+        select(PDFProcessingJob).where(
+            PDFProcessingJob.status == "processing",
+            PDFProcessingJob.heartbeat_at < now - timedelta(seconds=settings.pdf_job_lease_seconds),
+        )
+    )).scalars().all()
+    for job in stale:
+        logger.warning(f"PDF job {job.id}: worker {job.worker_id} stopped responding")
+        retry_or_fail(job, "Processamento interrompido (worker parou de responder)", now)
+    await db.commit()
+    return len(stale)
+
+
+class JobProgress:
+    """
+    PDFExtractor progress callback writing to the job row
+
+    Skips writes smaller than min_step within a stage; every write also
+    renews the job's heartbeat. A failed write is logged, not raised.
+    """
+
+    def __init__(self, job_id: str, session_factory=AsyncSessionLocal, min_step: int = 5):
+        self.job_id = job_id
+        self.session_factory = session_factory
+        self.min_step = min_step
+        self.percent = -1
+        self.stage = None
+
+    async def __call__(self, percent: int, stage: str) -> None:
+        if stage == self.stage and percent - self.percent < self.min_step:
+            return
+        self.percent, self.stage = percent, stage
+        try:
+            async with self.session_factory() as db:
+                await db.execute(
+                    update(PDFProcessingJob)
+                    .where(PDFProcessingJob.id == self.job_id, PDFProcessingJob.status == "processing")
+                    .values(progress=percent, stage=stage, heartbeat_at=datetime.utcnow())
+                )
+                await db.commit()
+        except Exception as e:
+            logger.warning(f"PDF job {self.job_id}: progress not saved: {e}")
+
+
+class PDFJobWorker:
+    """
+    Runs up to concurrency jobs from the queue at once
+
+    Polls for jobs every PDF_WORKER_POLL_SECONDS, renews the heartbeat of
+    its running jobs and requeues stale ones every lease/3 seconds. When
+    cancelled it stops its jobs and returns them to the queue without
+    counting the attempt.
+    """
+
+    def __init__(
+        self,
+        concurrency: Optional[int] = None,
+        worker_id: Optional[str] = None,
+        session_factory=AsyncSessionLocal,
+    ):
+        self.concurrency = concurrency or settings.pdf_worker_concurrency
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.session_factory = session_factory
+        self.running: Set[asyncio.Task] = set()
+        self.processed = 0
+        self.failed = 0
+        self.cache_hits = 0  # jobs served fully or partly from the extraction cache
+
+    async def run(self) -> None:
+        maintenance_interval = max(settings.pdf_job_lease_seconds / 3, 1)
+        last_maintenance = 0.0
+        logger.info(f"PDF worker {self.worker_id} started ({self.concurrency} concurrent jobs)")
+        try:
+            while True:
+                try:
+                    if time.monotonic() - last_maintenance >= maintenance_interval:
+                        await self._maintain()
+                        last_maintenance = time.monotonic()
+                    while len(self.running) < self.concurrency:
+                        async with self.session_factory() as db:
+                            job = await claim_job(db, self.worker_id)
+                        if job is None:
+                            break
+                        task = asyncio.create_task(self._execute(job))
+                        self.running.add(task)
+                        task.add_done_callback(self.running.discard)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"PDF worker {self.worker_id}: queue error: {e}")
+                await asyncio.sleep(settings.pdf_worker_poll_seconds)
+        finally:
+            await self._shutdown()
+
+    async def _maintain(self) -> None:
+        async with self.session_factory() as db:
+            await db.execute(
+                update(PDFProcessingJob)
+                .where(PDFProcessingJob.worker_id == self.worker_id, PDFProcessingJob.status == "processing")
+                .values(heartbeat_at=datetime.utcnow())
+            )
+            await db.commit()
+            await requeue_stale(db)
+
+    async def _shutdown(self) -> None:
+        tasks = list(self.running)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            async with self.session_factory() as db:
+                await db.execute(
+                    update(PDFProcessingJob)
+                    .where(PDFProcessingJob.worker_id == self.worker_id, PDFProcessingJob.status == "processing")
+                    .values(
+                        status="pending",
+                        worker_id=None,
+                        attempts=PDFProcessingJob.attempts - 1,
+                        progress=0,
+                        stage=None,
+                    )
+                )
+                await db.commit()
+        except Exception as e:
+            logger.error(f"PDF worker {self.worker_id}: jobs not released, they will be requeued as stale: {e}")
+        logger.info(
+            f"PDF worker {self.worker_id} stopped ({self.processed} completed, "
+            f"{self.cache_hits} from cache, {self.failed} failed attempts)"
+        )
+
+    async def _execute(self, job: PDFProcessingJob) -> None:
+        started = time.perf_counter()
+        try:
+            with open(job.file_path, "rb") as f:
+                pdf_bytes = f.read()
+            bulletin, cache_outcome = await extract_with_cache(
+                pdf_bytes=pdf_bytes,
+                filename=job.filename,
+                gemini_api_key=settings.gemini_api_key,
+                progress=JobProgress(job.id, self.session_factory),
+                session_factory=self.session_factory,
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"PDF job {job.id} (attempt {job.attempts}/{job.max_attempts}) failed: {e}", exc_info=True)
+            async with self.session_factory() as db:
+                current = await db.get(PDFProcessingJob, job.id)
+                if current is not None and current.worker_id == self.worker_id:
+                    retry_or_fail(current, str(e))
+                    await db.commit()
+            return
+
+        async with self.session_factory() as db:
+            result = await db.execute(
+                update(PDFProcessingJob)
+                .where(PDFProcessingJob.id == job.id, PDFProcessingJob.worker_id == self.worker_id)
+                .values(
+                    status="completed",
+                    progress=100,
+                    stage=None,
+                    extracted_data=bulletin.model_dump(mode="json"),
+                    error_message=None,
+                    completed_at=datetime.utcnow(),
+                )
+            )
+            await db.commit()
+        if result.rowcount:
+            _remove_file(job.file_path)
+        self.processed += 1
+        if cache_outcome != "miss":
+            self.cache_hits += 1
+        logger.info(f"PDF job {job.id} completed in {time.perf_counter() - started:.1f} s (cache {cache_outcome})")
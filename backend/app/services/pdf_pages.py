@@ -0,0 +1,101 @@
+"""
+Page-level PDF work run in PDFExtractor's process pool
+
+Plain functions over pdf_bytes and a share of its pages (1-based), so a
+document can be split across processes. Kept apart from
+pdf_extractor so spawned workers import only the PDF/OCR libraries, not
+the AI client or the app schemas. Errors on one page are logged and the
+page skipped, as the extractor always did.
+"""
+import io
+import logging
+import os
+import tempfile
+from typing import List, Optional, Tuple
+
+import pdfplumber
+import pytesseract
+
+logger = logging.getLogger(__name__)
+
+# (page number, width, height) of a page to OCR, sizes in points
+ScannedPage = Tuple[int, float, float]
+
+# Long side of an A4 page in points: OCR dpi is given for this size
+A4_LONG_SIDE = 842
+MIN_OCR_DPI = 150
+MAX_OCR_DPI = 400
+
+
+def page_count(pdf_bytes: bytes) -> int:
+    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+        return len(pdf.pages)
+
+
+def parse_pages(
+    pdf_bytes: bytes, first_page: int, last_page: int, ocr_min_chars: int = 20
+) -> List[Tuple[int, str, List[List[List[str]]], Optional[ScannedPage]]]:
+    """
+    (page number, text, tables, scanned page or None) of each page, in a single pass
+
+    Text and tables come from the same page object, so pdfminer's layout
+    analysis runs once per page; the page's caches are flushed once it is
+    done, keeping memory flat on long documents. A page needs OCR when it
+    has images but fewer than ocr_min_chars characters of text (a scan);
+    its size comes along so ocr_pages() does not open the PDF again.
+    """
+    results = []
+    with pdfplumber.open(io.BytesIO(pdf_bytes), pages=range(first_page, last_page + 1)) as pdf:
+        for page in pdf.pages:
+            page_text, tables = "", []
+            try:
+                page_text = page.extract_text() or ""
+            except Exception as e:
+                logger.warning(f"Erro ao extrair texto da página {page.page_number}: {e}")
+            try:
+                tables = page.extract_tables() or []
+            except Exception as e:
+                logger.warning(f"Erro ao extrair tabelas: {e}")
+            scanned = None
+            if len(page_text.strip()) < ocr_min_chars and page.images:
+                scanned = (page.page_number, float(page.width), float(page.height))
+            page.flush_cache()
+            results.append((page.page_number, page_text, tables, scanned))
+    return results
+
+
+def ocr_dpi(width: float, height: float, a4_dpi: int = 300) -> int:
+    """
+    Resolution giving the page as many pixels as an A4 page at a4_dpi
+
+    Large pages (A3, scanned spreads) get a lower dpi, small ones a higher
+    one, within MIN_OCR_DPI..MAX_OCR_DPI.
+    """
+    long_side = max(width, height) or A4_LONG_SIDE
+    return int(min(max(a4_dpi * A4_LONG_SIDE / long_side, MIN_OCR_DPI), MAX_OCR_DPI))
+
+
+def ocr_pages(pdf_bytes: bytes, pages: List[ScannedPage], a4_dpi: int = 300) -> List[Tuple[int, str]]:
+    """
+    (page number, OCR text) of the scanned pages found by parse_pages()
+
+    The PDF is written to one temp file for all of them (pdftoppm reads a
+    file) and the pages rendered one at a time, each at ocr_dpi() for its
+    size, so only one bitmap is in memory at once.
+    """
+    from pdf2image import convert_from_path
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="pdf-ocr-") as workdir:
+        path = os.path.join(workdir, "document.pdf")
+        with open(path, "wb") as f:
+            f.write(pdf_bytes)
+        for page_num, width, height in pages:
+            try:
+                dpi = ocr_dpi(width, height, a4_dpi)
+                image = convert_from_path(path, dpi=dpi, first_page=page_num, last_page=page_num)[0]
+                results.append((page_num, pytesseract.image_to_string(image, lang='por')))
+                image.close()
+            except Exception as e:
+                logger.warning(f"Erro no OCR da página {page_num}: {e}")
+    return results
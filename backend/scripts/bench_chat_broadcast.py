@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Chat institution broadcast benchmark
+
+Connects --sockets simulated WebSocket clients to one institution room,
+--slow of them taking --slow-ms per frame, and sends --broadcasts
+presence events two ways:
+- sequential: await send_json for every member in turn (the old
+  broadcast_to_institution)
+- queued: ConnectionManager with per-socket send queues (encode once,
+  enqueue, one writer task per socket)
+
+Reports how long the broadcasting coroutine is blocked, when the fast
+clients have every frame, and what the slow ones dropped or coalesced.
+
+    python scripts/bench_chat_broadcast.py --sockets 5000 --slow 50
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app.api.v1.ws.backplane import InMemoryBackplane, InMemoryHub
+from app.api.v1.ws.chat import ConnectionManager
+from app.api.v1.ws.connection import ClientConnection
+
+INSTITUTION_ID = "bench-institution"
+
+
+class SimulatedSocket:
+    """Accepts frames after a fixed delay"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.frames = 0
+
+    async def accept(self):
+        pass
+
+    async def _deliver(self):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        else:
+            await asyncio.sleep(0)
+        self.frames += 1
+
+    async def send_json(self, message):
+        await self._deliver()
+
+    async def send_text(self, text):
+        await self._deliver()
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def make_sockets(total: int, slow: int, slow_ms: float):
+    return [SimulatedSocket(slow_ms / 1000 if i < slow else 0) for i in range(total)]
+
+
+def presence_event(i: int) -> dict:
+    return {
+        "type": "presence_delta",
+        "epoch": "bench",
+        "from_version": i,
+        "version": i + 1,
+        "joined": [{"user_id": f"joiner-{i}", "status": "online", "last_seen": "2025-01-01T00:00:00"}],
+        "left": [],
+    }
+
+
+async def wait_for(sockets, frames: int, timeout: float = 120):
+    deadline = time.perf_counter() + timeout
+    while any(socket.frames < frames for socket in sockets):
+        if time.perf_counter() > deadline:
+            break
+        await asyncio.sleep(0.001)
+
+
+async def drained(connections, timeout: float = 120):
+    """Wait until the send queues are empty (frames delivered or dropped)"""
+    deadline = time.perf_counter() + timeout
+    while any(connection.depth for connection in connections) and time.perf_counter() < deadline:
+        await asyncio.sleep(0.001)
+    # Let the last in-flight send of each writer finish
+    await asyncio.sleep(0.001)
+
+
+async def run_sequential(sockets, broadcasts: int):
+    fast = [socket for socket in sockets if not socket.delay]
+    started = time.perf_counter()
+    for i in range(broadcasts):
+        message = presence_event(i)
+        for socket in sockets:
+            await socket.send_json(message)
+    blocked = time.perf_counter() - started
+    await wait_for(fast, broadcasts)
+    return blocked, time.perf_counter() - started
+
+
+async def run_queued(sockets, broadcasts: int, queue_size: int, policy: str):
+    manager = ConnectionManager(InMemoryBackplane(InMemoryHub()), queue_size, policy)
+    # Register the sockets directly (connect() expects a real handshake)
+    for i, socket in enumerate(sockets):
+        connection = ClientConnection(
+            socket, f"user-{i}", INSTITUTION_ID, queue_size, policy, manager._on_connection_failure
+        )
+        connection.start()
+        manager.active_connections[connection.user_id] = {connection}
+        manager.presence.user_connected(INSTITUTION_ID, connection.user_id)
+
+    fast = [
+        connection
+        for devices in manager.active_connections.values()
+        for connection in devices
+        if not connection.websocket.delay
+    ]
+    started = time.perf_counter()
+    for i in range(broadcasts):
+        await manager.broadcast_to_institution(INSTITUTION_ID, presence_event(i))
+    blocked = time.perf_counter() - started
+    await drained(fast)
+    delivered = time.perf_counter() - started
+    stats = manager.stats()
+
+    for devices in manager.active_connections.values():
+        for connection in devices:
+            await connection.close()
+    return blocked, delivered, stats
+
+
+async def main_async(args) -> int:
+    print(
+        f"{args.sockets} sockets ({args.slow} slow at {args.slow_ms:.0f} ms/frame), "
+        f"{args.broadcasts} broadcasts\n"
+    )
+
+    blocked, delivered = await run_sequential(
+        make_sockets(args.sockets, args.slow, args.slow_ms), args.broadcasts
+    )
+    print(f"sequential  blocked {blocked * 1000:9.1f} ms   fast clients done {delivered * 1000:9.1f} ms")
+
+    blocked_q, delivered_q, stats = await run_queued(
+        make_sockets(args.sockets, args.slow, args.slow_ms), args.broadcasts, args.queue_size, args.policy
+    )
+    print(f"queued      blocked {blocked_q * 1000:9.1f} ms   fast clients done {delivered_q * 1000:9.1f} ms")
+
+    queues = stats["queues"]
+    print(
+        f"\nqueues: {queues['sent']} frames sent, {queues['queued_frames']} pending (slow clients), "
+        f"max depth {queues['max_depth']}, "
+        f"dropped {queues['dropped']}, coalesced {queues['coalesced']}, "
+        f"slow consumers closed {stats['slow_consumers_closed']}"
+    )
+    ok = delivered_q <= delivered
+    print(f"\n{'✅' if ok else '❌'} speedup for fast clients: {delivered / delivered_q:.1f}x")
+    return 0 if ok else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sockets", type=int, default=5000, help="Simulated clients in the room")
+    parser.add_argument("--slow", type=int, default=50, help="How many of them are slow")
+    parser.add_argument("--slow-ms", type=float, default=20.0, help="Per-frame delay of a slow client")
+    parser.add_argument("--broadcasts", type=int, default=20, help="Presence events to broadcast")
+    parser.add_argument("--queue-size", type=int, default=256, help="Per-socket send queue size")
+    parser.add_argument("--policy", default="drop_oldest", choices=["drop_oldest", "disconnect"])
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+WebSocket chat presence load benchmark
+"First bell" scenario for presence: many sockets of one institution
+connect within a few seconds, then one typing burst and one reconnect.
+
+Extends test_websocket.py (same endpoint, same quick connection check).
+Tokens are issued locally for existing users of the institution with the
+most users, so the server must share this backend's database and
+SECRET_KEY. With fewer users than --sockets, users get several sockets
+(devices). --msgpack offers the binary MessagePack subprotocol instead of
+JSON text frames.
+
+    python scripts/bench_chat_presence.py --sockets 3000 --ramp 5
+    python scripts/bench_chat_presence.py --sockets 3000 --msgpack
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from collections import Counter
+from typing import List, Optional, Set
+
+import websockets
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app.api.v1.ws.codec import JSON, MSGPACK, Codec
+from app.core.auth import AuthUtils
+from app.database import SessionLocal
+from app.models.user import User
+from test_websocket import quick_connection_test
+
+
+class LoadClient:
+    """One socket that applies online_users / presence_delta frames to its view"""
+
+    def __init__(self, url: str, user: User, codec: Codec = JSON):
+        self.user_id = user.id
+        self.token = AuthUtils.create_access_token(
+            AuthUtils.create_token_data(user.id, user.institution_id, user.role, user.email)
+        )
+        self.url = url
+        self.codec = codec
+        self.websocket = None
+        self.frames: Counter = Counter()
+        self.bytes = 0
+        self.online: Set[str] = set()
+        self.epoch: Optional[str] = None
+        self.version: Optional[int] = None
+        self.gaps = 0
+        self.typing_from: Counter = Counter()
+        self._reader: Optional[asyncio.Task] = None
+
+    async def connect(self, resume: bool = False):
+        uri = f"{self.url}?token={self.token}"
+        if resume and self.epoch is not None:
+            uri += f"&presence_epoch={self.epoch}&presence_version={self.version}"
+        subprotocols = [self.codec.subprotocol] if self.codec.subprotocol else None
+        self.websocket = await websockets.connect(uri, max_size=None, subprotocols=subprotocols)
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        try:
+            async for data in self.websocket:
+                self.bytes += len(data)
+                message = self.codec.decode(data)
+                self.frames[message["type"]] += 1
+                await self._handle(message)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def _handle(self, message: dict):
+        if message["type"] == "online_users":
+            self.online = {user["user_id"] for user in message["users"]}
+            self.epoch, self.version = message["epoch"], message["version"]
+        elif message["type"] == "presence_delta":
+            if message["epoch"] == self.epoch:
+                if message["from_version"] != self.version:
+                    # Missed a delta: ask for the changes since our version
+                    self.gaps += 1
+                    await self.send({"type": "get_online_users", "epoch": self.epoch, "version": self.version})
+                    return
+                self.version = message["version"]
+            self.online.update(user["user_id"] for user in message["joined"])
+            self.online.difference_update(user["user_id"] for user in message["left"])
+        elif message["type"] == "typing":
+            self.typing_from[message["user_id"]] += 1
+
+    async def send(self, message: dict):
+        await self.websocket.send(self.codec.encode(message))
+
+    async def close(self):
+        await self.websocket.close()
+        if self._reader is not None:
+            await self._reader
+
+
+def load_users(limit: int) -> List[User]:
+    """Users of the institution with the most users"""
+    with SessionLocal() as db:
+        institutions = Counter(institution_id for (institution_id,) in db.query(User.institution_id))
+        if not institutions:
+            return []
+        institution_id = institutions.most_common(1)[0][0]
+        users = db.query(User).filter(User.institution_id == institution_id).limit(limit).all()
+        db.expunge_all()
+        return users
+
+
+async def wait_until(condition, timeout: float) -> Optional[float]:
+    started = time.perf_counter()
+    while not condition():
+        if time.perf_counter() - started > timeout:
+            return None
+        await asyncio.sleep(0.05)
+    return time.perf_counter() - started
+
+
+async def run_load_test(args) -> bool:
+    users = load_users(args.sockets)
+    if len(users) < 2:
+        print("❌ Need at least two users in one institution (run the seed scripts)")
+        return False
+
+    codec = JSON
+    if args.msgpack:
+        if MSGPACK is None:
+            print("❌ msgpack is not installed (pip install msgpack)")
+            return False
+        codec = MSGPACK
+
+    clients = [LoadClient(args.url, users[i % len(users)], codec) for i in range(args.sockets)]
+    expected = {client.user_id for client in clients}
+    print(f"👥 {len(clients)} sockets for {len(expected)} users ({codec.name}), ramp {args.ramp:.1f}s\n")
+
+    # First bell: spread the connects over the ramp
+    started = time.perf_counter()
+    delay = args.ramp / len(clients)
+    connects = []
+    for client in clients:
+        connects.append(asyncio.create_task(client.connect()))
+        await asyncio.sleep(delay)
+    results = await asyncio.gather(*connects, return_exceptions=True)
+    failed = [result for result in results if isinstance(result, Exception)]
+    if failed:
+        print(f"❌ {len(failed)} connects failed, first: {failed[0]}")
+        return False
+    print(f"🔌 connected in {time.perf_counter() - started:.2f}s")
+    if codec.subprotocol and clients[0].websocket.subprotocol != codec.subprotocol:
+        print(f"❌ server did not accept the {codec.subprotocol} subprotocol")
+        return False
+
+    converged = await wait_until(lambda: all(client.online >= expected for client in clients), args.timeout)
+    if converged is None:
+        stale = sum(1 for client in clients if not client.online >= expected)
+        print(f"❌ {stale} sockets still miss users after {args.timeout:.0f}s")
+    else:
+        print(f"✅ every socket sees all {len(expected)} users {converged:.2f}s after the ramp")
+
+    frames = sum((client.frames for client in clients), Counter())
+    presence_frames = frames["online_users"] + frames["presence_delta"]
+    # One user_joined per connect to everyone already connected
+    per_event = len(expected) * (len(expected) - 1) // 2
+    print(
+        f"📨 presence frames: {presence_frames} "
+        f"({frames['online_users']} snapshots, {frames['presence_delta']} deltas, "
+        f"{sum(client.bytes for client in clients) / 1024:.0f} KiB), "
+        f"per-event broadcast would be ~{per_event + len(clients)}"
+    )
+    print(f"🔁 version gaps resumed: {sum(client.gaps for client in clients)}")
+
+    # Typing burst: one keystroke event every 10 ms
+    sender, recipient = clients[0], next(c for c in clients if c.user_id != clients[0].user_id)
+    for _ in range(args.typing):
+        await sender.send({"type": "typing", "recipient_id": recipient.user_id, "is_typing": True})
+        await asyncio.sleep(0.01)
+    await sender.send({"type": "typing", "recipient_id": recipient.user_id, "is_typing": False})
+    await asyncio.sleep(0.5)
+    print(f"⌨️  {args.typing + 1} typing events sent, recipient got {recipient.typing_from[sender.user_id]}")
+
+    # Reconnect with the presence version: expect a delta, not the full list
+    before = recipient.frames["online_users"]
+    await recipient.close()
+    await recipient.connect(resume=True)
+    await asyncio.sleep(0.5)
+    resumed = recipient.frames["online_users"] == before
+    print(f"{'✅' if resumed else '❌'} reconnect resumed presence with a delta")
+
+    await asyncio.gather(*(client.close() for client in clients))
+    return converged is not None and resumed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="ws://localhost:8004/ws/chat", help="Chat WebSocket URL")
+    parser.add_argument("--sockets", type=int, default=500, help="Sockets to open")
+    parser.add_argument("--ramp", type=float, default=5.0, help="Seconds over which they connect")
+    parser.add_argument("--typing", type=int, default=100, help="Typing events in the burst")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds to wait for convergence")
+    parser.add_argument("--msgpack", action="store_true", help="Use the MessagePack subprotocol")
+    args = parser.parse_args()
+
+    print("\n" + "="*60)
+    print("🚀 WebSocket Chat Load Test - colaboraEDU")
+    print("="*60)
+
+    asyncio.run(quick_connection_test())
+    ok = asyncio.run(run_load_test(args))
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
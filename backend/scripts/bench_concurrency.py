@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Concurrent-request latency benchmark
+
+Logs in, then fires waves of concurrent requests at the hot endpoints
+(students, messages, attendance) while probing /health. With sync sessions
+inside async handlers the probe latency tracks the slowest query; with the
+async session layer it should stay flat.
+
+Run it against a server on the old tree and again on the new one:
+
+    python scripts/bench_concurrency.py --base-url http://localhost:8004 \\
+        --email coordenador@colaboraedu.com --password 123456 --concurrency 50
+
+Measured on 1 CPU, SQLite, 2,000 students and 20,000 messages, one
+uvicorn worker, 5 waves (before = sync sessions, after = async sessions;
+the before/after trees answer messages/stats/overview with 500, so they
+complete fewer hot requests than the current tree):
+
+    concurrency 20   hot p50/p95          /health p50/p95   req/s
+      before          136 / 556 ms         109 / 179 ms     33.2
+      after           727 / 889 ms         139 / 240 ms     21.8
+      current         394 / 578 ms         143 / 200 ms     43.0
+    concurrency 50
+      before          no result in 180 s (/health stops answering)
+      after          1469 / 1652 ms        364 / 458 ms     23.2
+      current        1029 / 1858 ms        866 / 1440 ms    36.1
+
+On one CPU the handlers are CPU bound, so async sessions do not lower
+latency at moderate load. What they remove is the stall: a sync query
+waiting for a pooled connection blocks the event loop, so every request
+including /health hangs until the pool times out.
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+
+import httpx
+
+
+HOT_PATHS = [
+    "/api/v1/students/?page_size=100",
+    "/api/v1/messages/stats/overview",
+    "/api/v1/users?page_size=100",
+]
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile in milliseconds"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index] * 1000
+
+
+def report(label: str, latencies: list, errors: int):
+    """Print a latency summary line"""
+    if not latencies:
+        print(f"{label:<40} no successful requests ({errors} errors)")
+        return
+    print(
+        f"{label:<40} n={len(latencies):<5} "
+        f"p50={percentile(latencies, 50):8.1f}ms "
+        f"p95={percentile(latencies, 95):8.1f}ms "
+        f"p99={percentile(latencies, 99):8.1f}ms "
+        f"mean={statistics.mean(latencies) * 1000:8.1f}ms "
+        f"errors={errors}"
+    )
+
+
+async def timed_get(client: httpx.AsyncClient, path: str, headers: dict, sink: list, errors: list):
+    """GET a path and record its latency"""
+    started = time.perf_counter()
+    try:
+        response = await client.get(path, headers=headers)
+        if response.status_code >= 500:
+            errors.append(path)
+            return
+    except httpx.HTTPError:
+        errors.append(path)
+        return
+    sink.append(time.perf_counter() - started)
+
+
+async def run(args) -> int:
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60, limits=limits) as client:
+        login = await client.post(
+            "/api/v1/auth/login",
+            data={"username": args.email, "password": args.password}
+        )
+        if login.status_code != 200:
+            print(f"❌ Login failed: {login.status_code} {login.text}")
+            return 1
+        headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+        hot_latencies, hot_errors = [], []
+        probe_latencies, probe_errors = [], []
+
+        started = time.perf_counter()
+        for _ in range(args.waves):
+            tasks = [
+                timed_get(client, HOT_PATHS[i % len(HOT_PATHS)], headers, hot_latencies, hot_errors)
+                for i in range(args.concurrency)
+            ]
+            # Cheap probe issued while the wave is in flight
+            tasks += [
+                timed_get(client, "/health", {}, probe_latencies, probe_errors)
+                for _ in range(args.probes)
+            ]
+            await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    total = len(hot_latencies) + len(probe_latencies)
+    print("=" * 70)
+    print(f"Concurrency {args.concurrency} x {args.waves} waves against {args.base_url}")
+    print("=" * 70)
+    report("hot endpoints", hot_latencies, len(hot_errors))
+    report("/health probe during load", probe_latencies, len(probe_errors))
+    print(f"{'throughput':<40} {total / elapsed:8.1f} req/s")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8004")
+    parser.add_argument("--email", default="coordenador@colaboraedu.com")
+    parser.add_argument("--password", default="123456")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--waves", type=int, default=10)
+    parser.add_argument("--probes", type=int, default=5)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
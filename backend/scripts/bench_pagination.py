@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+OFFSET vs keyset pagination benchmark
+
+Fills a temp SQLite database with --rows messages for one institution and
+times fetching a deep page three ways:
+- OFFSET/LIMIT plus COUNT(*) (the old list endpoints)
+- OFFSET/LIMIT without the count (exact_total=false)
+- keyset continuation from a cursor (?cursor=...)
+
+    python scripts/bench_pagination.py --rows 1000000 --page 40000
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+from app.core.pagination import KeysetPaginator, encode_cursor
+from app.models import Message
+from app.schemas.common import PaginationParams
+
+
+INSTITUTION_ID = "00000000-0000-0000-0000-000000000001"
+
+
+def populate(engine, rows: int, batch_size: int = 50000):
+    """Create the messages table and its indexes, then bulk insert rows"""
+    Message.__table__.create(engine)
+    started_at = datetime(2024, 1, 1)
+    sender_id = str(uuid.uuid4())
+    recipient_id = str(uuid.uuid4())
+    with engine.begin() as connection:
+        for start in range(0, rows, batch_size):
+            connection.execute(Message.__table__.insert(), [
+                {
+                    "id": str(uuid.uuid4()),
+                    "institution_id": INSTITUTION_ID,
+                    "sender_id": sender_id,
+                    "recipient_id": recipient_id,
+                    "content": f"message {i}",
+                    "read": False,
+                    "created_at": started_at + timedelta(seconds=i),
+                    "updated_at": started_at + timedelta(seconds=i),
+                }
+                for i in range(start, min(start + batch_size, rows))
+            ])
+            print(f"  inserted {min(start + batch_size, rows):,} rows", end="\r")
+    print()
+
+
+def timed(fn, repeat: int) -> float:
+    """Median wall time in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--page", type=int, default=40_000, help="Deep page number to fetch")
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="pagination-bench-")
+    engine = create_engine(f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+
+    print("=" * 70)
+    print(f"Populating {args.rows:,} messages in {workdir}")
+    populate(engine, args.rows)
+
+    base = select(Message).where(Message.institution_id == INSTITUTION_ID)
+    offset_params = PaginationParams(page=args.page, page_size=args.page_size)
+
+    with Session(engine) as db:
+        def offset_page():
+            paginator = KeysetPaginator(offset_params, Message.created_at, Message.id)
+            return paginator.page(db.execute(paginator.apply(base)).scalars().all())
+
+        def offset_with_count():
+            offset_page()
+            db.scalar(select(func.count()).select_from(base.subquery()))
+
+        # Cursor pointing at the row just before the deep page
+        rows, *_ = offset_page()
+        anchor = db.execute(
+            base.order_by(Message.created_at.desc(), Message.id.desc())
+            .offset(offset_params.offset - 1).limit(1)
+        ).scalar()
+        cursor = encode_cursor(anchor.created_at, anchor.id, "next")
+        keyset_params = PaginationParams(page_size=args.page_size, cursor=cursor)
+
+        def keyset_page():
+            paginator = KeysetPaginator(keyset_params, Message.created_at, Message.id)
+            return paginator.page(db.execute(paginator.apply(base)).scalars().all())
+
+        keyset_rows, *_ = keyset_page()
+        same_rows = [row.id for row in rows] == [row.id for row in keyset_rows]
+
+        results = [
+            ("OFFSET + COUNT(*)", timed(offset_with_count, args.repeat)),
+            ("OFFSET, no count", timed(offset_page, args.repeat)),
+            ("keyset cursor", timed(keyset_page, args.repeat)),
+        ]
+
+    engine.dispose()
+
+    print("=" * 70)
+    print(f"Page {args.page:,} x {args.page_size} (offset {offset_params.offset:,}), median of {args.repeat}")
+    print("=" * 70)
+    for label, elapsed in results:
+        print(f"{label:<25} {elapsed:10.2f} ms")
+    print(f"{'✅' if same_rows else '❌'} keyset page matches the OFFSET page")
+    sys.exit(0 if same_rows else 1)
+
+
+if __name__ == "__main__":
+    main()
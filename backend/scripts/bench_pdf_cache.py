@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+PDF extraction cache benchmark
+
+Against a temp SQLite database, with a PDF worker running in-process:
+- upload one generated bulletin and wait for the worker (cache miss)
+- upload the same bytes again (completed by enqueue_job from the cache)
+- replay --uploads uploads drawn from --distinct bulletins, the popular
+  ones re-sent most (as schools re-send the same files), with the cache
+  limited to --max-mb, and report the hit rate, the entries kept and the
+  time per upload served by the cache and by the worker
+
+    python scripts/bench_pdf_cache.py
+    python scripts/bench_pdf_cache.py --uploads 200 --distinct 40 --max-mb 1
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.config import settings
+from app.database import get_async_database_url
+from app.models import PDFExtractionCache, PDFProcessingJob
+from app.services.pdf_cache import cache_stats
+from app.services.pdf_extractor import shutdown_process_pool
+from app.services.pdf_jobs import PDFJobWorker, enqueue_job
+from bench_pdf_extraction import sample_bulletin_pdf
+
+USER_ID = str(uuid.uuid4())
+
+
+async def upload(session_factory, pdf_bytes: bytes, name: str):
+    """Seconds from upload until the job is completed, and whether the upload completed it"""
+    started = time.perf_counter()
+    async with session_factory() as db:
+        job = await enqueue_job(db, USER_ID, None, name, pdf_bytes)
+        job_id, on_upload = job.id, job.status == "completed"
+    while not on_upload:
+        async with session_factory() as db:
+            status = await db.scalar(select(PDFProcessingJob.status).where(PDFProcessingJob.id == job_id))
+        if status in ("completed", "failed"):
+            break
+        await asyncio.sleep(0.01)
+    return time.perf_counter() - started, on_upload
+
+
+async def run(args) -> int:
+    workdir = tempfile.mkdtemp(prefix="pdf-cache-bench-")
+    url = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    settings.upload_path = workdir
+    settings.pdf_worker_poll_seconds = 0.01
+    settings.pdf_cache_max_mb = args.max_mb
+    engine = create_engine(url)
+    for model in (PDFProcessingJob, PDFExtractionCache):
+        model.__table__.create(engine, checkfirst=True)
+    engine.dispose()
+
+    async_engine = create_async_engine(get_async_database_url(url))
+    session_factory = async_sessionmaker(async_engine, expire_on_commit=False)
+    worker = PDFJobWorker(concurrency=1, session_factory=session_factory)
+    worker_task = asyncio.create_task(worker.run())
+
+    print("=" * 70)
+    print(f"{args.pages}-page bulletins, cache limit {args.max_mb} MB, {url}")
+    print("=" * 70)
+    first = sample_bulletin_pdf(args.pages)
+    miss, _ = await upload(session_factory, first, "first.pdf")
+    hit, from_cache = await upload(session_factory, first, "again.pdf")
+    print(f"{'first upload (miss)':<28} {miss * 1000:10.1f} ms")
+    print(f"{'same PDF again (hit)':<28} {hit * 1000:10.1f} ms  ({miss / hit:.0f}x faster)")
+    ok = from_cache
+
+    # Distinct documents: generated with different page counts so their bytes differ
+    documents = [sample_bulletin_pdf(args.pages + i) for i in range(1, args.distinct + 1)]
+    rng = random.Random(42)
+    weights = [1 / (rank + 1) for rank in range(args.distinct)]
+    times = {True: [], False: []}
+    for i in range(args.uploads):
+        elapsed, on_upload = await upload(session_factory, rng.choices(documents, weights)[0], f"{i}.pdf")
+        times[on_upload].append(elapsed)
+        print(f"  {i + 1}/{args.uploads} uploads", end="\r")
+    print()
+
+    worker_task.cancel()
+    await asyncio.gather(worker_task, return_exceptions=True)
+    async with session_factory() as db:
+        stats = await cache_stats(db)
+        completed = await db.scalar(
+            select(func.count()).select_from(PDFProcessingJob).where(PDFProcessingJob.status == "completed")
+        )
+    await async_engine.dispose()
+    shutdown_process_pool()
+
+    served = len(times[True])
+    print("=" * 70)
+    print(f"{args.uploads} uploads of {args.distinct} distinct bulletins")
+    print(f"  completed on upload (cache)  {served:>6}  median {statistics.median(times[True] or [0]) * 1000:8.1f} ms")
+    print(f"  extracted by the worker      {len(times[False]):>6}  median {statistics.median(times[False] or [0]) * 1000:8.1f} ms")
+    print(f"  hit rate (this run)          {served / args.uploads:6.1%}")
+    print(
+        f"  cache: {stats['entries']} entries, {stats['size_bytes'] / 1024:.0f} of "
+        f"{stats['max_bytes'] / 1024:.0f} KB, hit rate of current entries {stats['hit_rate']:.1%}"
+    )
+    ok = ok and completed == args.uploads + 2 and stats["size_bytes"] <= stats["max_bytes"]
+    print(f"{'✅' if ok else '❌'} duplicate uploads served from the cache, size within the limit")
+    return 0 if ok else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=4, help="Pages per generated bulletin")
+    parser.add_argument("--uploads", type=int, default=100)
+    parser.add_argument("--distinct", type=int, default=20, help="Different bulletins among the uploads")
+    parser.add_argument("--max-mb", type=float, default=0.3, help="Cache size limit (small, to exercise eviction)")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
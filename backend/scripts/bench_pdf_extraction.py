@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+PDF extraction benchmark
+
+Parsing (one document, fresh process each): wall time and peak RSS of
+- "two passes": pdfplumber opened twice, text then tables, page caches
+  kept (the extractor before single-pass parsing)
+- "single pass": pdf_pages.parse_pages, text and tables per page object,
+  caches flushed page by page
+
+OCR (largest document): pages detected as scanned and sent to OCR, vs
+the whole-document fallback before (every page, and only when the whole
+document had under 100 characters of text); with --ocr also wall time
+and peak RSS of whole-document OCR at 300 dpi vs per-page OCR.
+
+Throughput: the pdfplumber stages (plus OCR with --ocr) of PDFExtractor
+over all documents, in pages per second, pages per second per core and
+the longest event loop stall (how long an API worker would be frozen):
+- "event loop": the stages called inline, as before the process pool
+- "pool N": PDFExtractor with PDF_PROCESS_WORKERS=N, all documents at once
+
+Without PDF arguments it generates --docs bulletins of --pages pages,
+every --scanned-every-th page an image only (a scan).
+
+    python scripts/bench_pdf_extraction.py --pages 100 --docs 4 --workers 1,2,4
+    python scripts/bench_pdf_extraction.py --pages 40 --scanned-every 5 --ocr
+    python scripts/bench_pdf_extraction.py boletins/*.pdf --ocr
+"""
+
+import argparse
+import asyncio
+import io
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import pdfplumber
+import pytesseract
+from PIL import Image, ImageDraw, ImageFont
+
+from app.config import settings
+from app.services import pdf_pages
+from app.services.pdf_extractor import PDFExtractor, get_process_pool, shutdown_process_pool
+
+SUBJECTS = (
+    "Português", "Matemática", "História", "Geografia", "Ciências",
+    "Inglês", "Artes", "Educação Física", "Física", "Química",
+)
+HEADER = ("Disciplina", "1º Bim", "2º Bim", "3º Bim", "4º Bim", "Média")
+
+
+def _pdf_text(value: str) -> bytes:
+    escaped = value.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return b"(" + escaped.encode("cp1252") + b")"
+
+
+def _bulletin_page(number: int) -> bytes:
+    """Content stream: student header, ruled grade table, attendance"""
+    ops = [b"BT /F1 14 Tf 50 800 Td " + _pdf_text(f"Boletim Escolar - Página {number}") + b" Tj ET"]
+    for i, line in enumerate((
+        f"Aluno: Estudante Exemplo {number}",
+        f"Matrícula: {100000 + number}",
+        "Turma: 9º Ano A",
+        "Ano Letivo: 2024",
+    )):
+        ops.append(b"BT /F1 11 Tf 50 %d Td " % (770 - 16 * i) + _pdf_text(line) + b" Tj ET")
+
+    widths = (150, 70, 70, 70, 70, 70)
+    top, row_height = 690, 20
+    rows = [HEADER] + [
+        (subject, *(f"{(number + i + j) % 5 + 5.5:.1f}".replace(".", ",") for j in range(5)))
+        for i, subject in enumerate(SUBJECTS)
+    ]
+    left, right = 50, 50 + sum(widths)
+    bottom = top - row_height * len(rows)
+    for r in range(len(rows) + 1):
+        y = top - row_height * r
+        ops.append(b"%d %d m %d %d l S" % (left, y, right, y))
+    x = left
+    for width in widths + (0,):
+        ops.append(b"%d %d m %d %d l S" % (x, top, x, bottom))
+        x += width
+    for r, row in enumerate(rows):
+        x = left
+        for width, cell in zip(widths, row):
+            ops.append(b"BT /F1 10 Tf %d %d Td " % (x + 4, top - row_height * r - 14) + _pdf_text(cell) + b" Tj ET")
+            x += width
+
+    for i, line in enumerate(("Total de aulas: 200", f"Presenças: {180 + number % 20}")):
+        ops.append(b"BT /F1 11 Tf 50 %d Td " % (bottom - 30 - 16 * i) + _pdf_text(line) + b" Tj ET")
+    return b"\n".join(ops)
+
+
+def _scanned_page(number: int) -> bytes:
+    """JPEG of an A4 bulletin page at 150 dpi, as a scanner would produce"""
+    image = Image.new("L", (1240, 1754), 255)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=28)
+    lines = [f"Boletim Escolar - Página {number}", f"Aluno: Estudante Exemplo {number}", "Turma: 9º Ano A", ""]
+    lines += [f"{subject:<18} {(number + i) % 5 + 5.5:.1f}" for i, subject in enumerate(SUBJECTS)]
+    for i, line in enumerate(lines):
+        draw.text((100, 100 + 48 * i), line, fill=0, font=font)
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=60)
+    return out.getvalue()
+
+
+def sample_bulletin_pdf(pages: int, scanned_every: int = 0) -> bytes:
+    """Minimal PDF (Helvetica, ruled tables, JPEG scans) without extra dependencies"""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled below
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    kids = []
+    for number in range(1, pages + 1):
+        resources = b"/Font << /F1 3 0 R >>"
+        if scanned_every and number % scanned_every == 0:
+            jpeg = _scanned_page(number)
+            objects.append(
+                b"<< /Type /XObject /Subtype /Image /Width 1240 /Height 1754 /ColorSpace /DeviceGray "
+                b"/BitsPerComponent 8 /Filter /DCTDecode /Length %d >>\nstream\n" % len(jpeg) + jpeg + b"\nendstream"
+            )
+            resources = b"/XObject << /Im1 %d 0 R >>" % len(objects)
+            content = b"q 595 0 0 842 0 0 cm /Im1 Do Q"
+        else:
+            content = _bulletin_page(number)
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << " + resources + b" >> /Contents %d 0 R >>" % len(objects)
+        )
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [" + b" ".join(kids) + b"] /Count %d >>" % pages
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+class StallMonitor:
+    """Longest gap between ticks of a 5 ms timer on the event loop"""
+
+    def __init__(self):
+        self.longest = 0.0
+        self._task = None
+
+    async def _tick(self):
+        last = time.perf_counter()
+        while True:
+            await asyncio.sleep(0.005)
+            now = time.perf_counter()
+            self.longest = max(self.longest, now - last - 0.005)
+            last = now
+
+    def __enter__(self):
+        self._task = asyncio.create_task(self._tick())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+
+
+def two_passes(pdf_bytes: bytes) -> None:
+    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+        for page in pdf.pages:
+            page.extract_text()
+    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+        for page in pdf.pages:
+            page.extract_tables()
+
+
+def single_pass(pdf_bytes: bytes) -> None:
+    pdf_pages.parse_pages(pdf_bytes, 1, pdf_pages.page_count(pdf_bytes))
+
+
+def scanned_pages(pdf_bytes: bytes) -> list:
+    parsed = pdf_pages.parse_pages(pdf_bytes, 1, pdf_pages.page_count(pdf_bytes), settings.pdf_ocr_page_min_chars)
+    return [page for _, _, _, page in parsed if page is not None]
+
+
+def whole_document_ocr(pdf_bytes: bytes) -> None:
+    from pdf2image import convert_from_bytes
+
+    for image in convert_from_bytes(pdf_bytes, dpi=300):
+        pytesseract.image_to_string(image, lang="por")
+
+
+def per_page_ocr(pdf_bytes: bytes) -> None:
+    pdf_pages.ocr_pages(pdf_bytes, scanned_pages(pdf_bytes), settings.pdf_ocr_dpi)
+
+
+def _run_in_child(name: str, pdf_bytes: bytes):
+    """Runs in a fresh process: (seconds, peak RSS in MB)"""
+    started = time.perf_counter()
+    if name != "idle":
+        globals()[name](pdf_bytes)
+    elapsed = time.perf_counter() - started
+    return elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_in_fresh_process(name: str, pdf_bytes: bytes):
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(_run_in_child, name, pdf_bytes).result()
+
+
+def compare(variants, pdf_bytes: bytes, pages: int) -> None:
+    """Runs each (label, function name) in a fresh process, first one is the baseline"""
+    print(f"{'':<14} {'wall':>10} {'pages/s':>10} {'peak RSS':>12}")
+    results = []
+    for label, name in variants:
+        elapsed, peak_mb = run_in_fresh_process(name, pdf_bytes)
+        results.append((elapsed, peak_mb))
+        print(f"{label:<14} {elapsed:8.2f} s {pages / elapsed:10.1f} {peak_mb:9.0f} MB")
+    (before, before_mb), (after, after_mb) = results
+    print(f"{'':<14} {before / after:8.2f}x faster, {before_mb - after_mb:.0f} MB less at peak")
+
+
+def compare_parsing(pdf_bytes: bytes) -> None:
+    pages = pdf_pages.page_count(pdf_bytes)
+    _, idle_mb = run_in_fresh_process("idle", pdf_bytes)
+    print(f"Parsing one {pages}-page document (interpreter alone: {idle_mb:.0f} MB)")
+    compare((("two passes", "two_passes"), ("single pass", "single_pass")), pdf_bytes, pages)
+
+
+def compare_ocr(pdf_bytes: bytes, ocr: bool) -> None:
+    pages = pdf_pages.page_count(pdf_bytes)
+    scanned = scanned_pages(pdf_bytes)
+    text = "".join(page_text for _, page_text, _, _ in pdf_pages.parse_pages(pdf_bytes, 1, pages))
+    whole = pages if len(text.strip()) < 100 else 0
+    print(f"OCR of one {pages}-page document with {len(scanned)} scanned pages")
+    print(f"  whole document (before): {whole} pages OCR'd" + (", scanned pages lost" if scanned and not whole else ""))
+    numbers = [page_num for page_num, _, _ in scanned]
+    print(f"  per page: {len(scanned)} pages OCR'd {numbers[:10]}{' ...' if len(numbers) > 10 else ''}")
+    if ocr and scanned:
+        compare((("whole document", "whole_document_ocr"), ("per page", "per_page_ocr")), pdf_bytes, pages)
+
+
+async def inline(documents, ocr: bool) -> None:
+    for pdf_bytes in documents:
+        total = pdf_pages.page_count(pdf_bytes)
+        parsed = pdf_pages.parse_pages(pdf_bytes, 1, total, settings.pdf_ocr_page_min_chars)
+        scanned = [page for _, _, _, page in parsed if page is not None]
+        if ocr and scanned:
+            pdf_pages.ocr_pages(pdf_bytes, scanned, settings.pdf_ocr_dpi)
+        await asyncio.sleep(0)
+
+
+async def pooled(documents, ocr: bool) -> None:
+    async def one(pdf_bytes):
+        extractor = PDFExtractor()
+        total = await asyncio.get_running_loop().run_in_executor(get_process_pool(), pdf_pages.page_count, pdf_bytes)
+        pages = await extractor._parse_pages(pdf_bytes, total)
+        scanned = [page for _, _, _, page in pages if page is not None]
+        if ocr and scanned:
+            await extractor._extract_with_ocr(pdf_bytes, scanned)
+    await asyncio.gather(*(one(pdf_bytes) for pdf_bytes in documents))
+
+
+async def measure(label: str, runner, documents, ocr: bool, cores: int, pages: int):
+    await asyncio.sleep(0.05)
+    with StallMonitor() as stall:
+        started = time.perf_counter()
+        await runner(documents, ocr)
+        elapsed = time.perf_counter() - started
+        await asyncio.sleep(0.01)
+    rate = pages / elapsed
+    print(f"{label:<14} {elapsed:8.2f} s {rate:10.1f} pages/s {rate / cores:10.1f} /core {stall.longest * 1000:10.1f} ms")
+    return rate
+
+
+async def run(args) -> int:
+    if args.pdfs:
+        documents = []
+        for path in args.pdfs:
+            with open(path, "rb") as f:
+                documents.append(f.read())
+    else:
+        documents = [sample_bulletin_pdf(args.pages, args.scanned_every) for _ in range(args.docs)]
+    pages = sum(pdf_pages.page_count(pdf_bytes) for pdf_bytes in documents)
+    workers = [int(n) for n in args.workers.split(",")]
+
+    print("=" * 70)
+    compare_parsing(max(documents, key=len))
+    print("=" * 70)
+    compare_ocr(max(documents, key=len), args.ocr)
+    print("=" * 70)
+    print(f"{len(documents)} documents, {pages} pages, {os.cpu_count()} CPU cores, OCR {'on' if args.ocr else 'off'}")
+    print("=" * 70)
+    print(f"{'':<14} {'wall':>10} {'throughput':>17} {'per core':>15} {'loop stall':>13}")
+    baseline = await measure("event loop", inline, documents, args.ocr, 1, pages)
+
+    for count in workers:
+        settings.pdf_process_workers = count
+        shutdown_process_pool()
+        # Warm-up: start the spawned processes outside the measurement
+        await pooled(documents[:1], False)
+        rate = await measure(
+            f"pool {count}", pooled, documents, args.ocr, min(count, os.cpu_count() or 1), pages
+        )
+        print(f"{'':<14} {rate / baseline:8.2f}x the event loop throughput")
+    shutdown_process_pool()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="*", help="PDF files (default: generated bulletins)")
+    parser.add_argument("--pages", type=int, default=20, help="Pages per generated bulletin")
+    parser.add_argument("--docs", type=int, default=4, help="Generated bulletins, processed at once")
+    parser.add_argument("--workers", default="1,2,4", help="Process pool sizes to compare")
+    parser.add_argument("--scanned-every", type=int, default=0, help="Every Nth generated page is a scan")
+    parser.add_argument("--ocr", action="store_true", help="Include OCR (needs tesseract and poppler)")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Create the attendance unique index on an existing database
+
+The bulk attendance upsert needs uq_attendance_student_date_class_period
+(one record per student, date, class and period). create_all only adds it
+to new tables, and the API never changes data on startup, so existing
+databases get it here:
+
+- without options, reports whether the index exists and the keys recorded
+  more than once (which block it); changes nothing
+- --apply creates the index when there are no duplicates
+- --apply --delete-duplicates first deletes all but the most recently
+  updated record of each duplicated key (review the report first, then
+  rebuild the class statistics with scripts/rebuild_attendance_rollup.py)
+
+Until the index exists, bulk writes use a slower update-or-insert path.
+
+    python scripts/migrate_attendance_unique_index.py
+    python scripts/migrate_attendance_unique_index.py --apply
+"""
+
+import argparse
+import os
+import sys
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app.database import engine
+from app.services.attendance_import import (
+    UNIQUE_INDEX, create_unique_index, delete_duplicates, duplicate_keys, unique_index_exists
+)
+
+
+def migrate(conn, args) -> int:
+    if unique_index_exists(conn):
+        create_unique_index(conn)
+        print(f"✅ {UNIQUE_INDEX} already exists")
+        return 0
+
+    duplicates = duplicate_keys(conn)
+    extra = sum(records - 1 for *_, records in duplicates)
+    print(f"{UNIQUE_INDEX} missing; {len(duplicates)} keys recorded more than once ({extra} extra records)")
+    for student_id, day, class_id, period, records in duplicates[:args.show]:
+        print(f"  student {student_id}  {day}  class {class_id}  period {period!r}: {records} records")
+    if len(duplicates) > args.show:
+        print(f"  ... {len(duplicates) - args.show} more")
+
+    if not args.apply:
+        print("Nothing changed (run with --apply to create the index)")
+        return 0 if not duplicates else 1
+    if duplicates and not args.delete_duplicates:
+        print("❌ Resolve the duplicates, or rerun with --apply --delete-duplicates")
+        return 1
+    if duplicates:
+        print(f"🗑️  {delete_duplicates(conn)} duplicate records deleted")
+    create_unique_index(conn)
+    print(f"✅ {UNIQUE_INDEX} created")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apply", action="store_true", help="Create the index (only if there are no duplicates)")
+    parser.add_argument(
+        "--delete-duplicates", action="store_true",
+        help="With --apply: keep only the most recently updated record of each duplicated key"
+    )
+    parser.add_argument("--show", type=int, default=20, help="Duplicated keys to list")
+    args = parser.parse_args()
+
+    if engine.dialect.name not in ("sqlite", "postgresql"):
+        print(f"❌ {engine.dialect.name}: bulk writes always use the update-or-insert path")
+        sys.exit(1)
+
+    with engine.begin() as conn:
+        status = migrate(conn, args)
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Create the message search index
+
+The API does not build the index on startup (a GIN build on a large
+messages table blocks writes); run this once per database, and again
+after upgrading from a version whose SQLite index was keyed by the
+messages rowid (it is replaced):
+
+- SQLite: creates messages_fts, its key table and triggers, and fills it
+  from the existing messages; --rebuild re-indexes everything (repair)
+- PostgreSQL: CREATE INDEX CONCURRENTLY on to_tsvector(content), so
+  messages stay writable while it builds; an INVALID index left by an
+  interrupted build is dropped and built again
+
+Until then GET /messages/search works without the index (LIKE on SQLite,
+an unindexed scan on PostgreSQL). The database keeps the index current on
+every write afterwards.
+
+    python scripts/migrate_message_search.py
+    python scripts/migrate_message_search.py --rebuild
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app.database import engine
+from app.models import Message
+from app.services.message_search import create_search_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rebuild", action="store_true", help="Re-index every message (SQLite)")
+    args = parser.parse_args()
+
+    Message.__table__.create(engine, checkfirst=True)
+    started = time.perf_counter()
+    backend = create_search_index(engine, rebuild=args.rebuild)
+    print(f"{'✅' if backend != 'like' else '❌'} {backend} message search index ready in {(time.perf_counter() - started) * 1000:.1f} ms")
+    sys.exit(0 if backend != "like" else 1)
+
+
+if __name__ == "__main__":
+    main()
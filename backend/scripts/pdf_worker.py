@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+PDF extraction worker
+
+Processes the bulletin uploads queued in pdf_processing_jobs (POST
+/api/v1/pdf/upload) outside the API processes. Run one or more per host;
+each runs up to --concurrency jobs at once, their parsing and OCR spread
+over PDF_PROCESS_WORKERS processes. SIGINT/SIGTERM return the running
+jobs to the queue before exiting.
+
+    python scripts/pdf_worker.py
+    python scripts/pdf_worker.py --concurrency 4
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import sys
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app.database import async_engine, engine
+from app.models import PDFExtractionCache, PDFProcessingJob
+from app.services.pdf_extractor import shutdown_process_pool
+from app.services.pdf_jobs import PDFJobWorker
+
+
+async def run(concurrency: int) -> int:
+    PDFProcessingJob.__table__.create(engine, checkfirst=True)
+    PDFExtractionCache.__table__.create(engine, checkfirst=True)
+    worker = PDFJobWorker(concurrency)
+    task = asyncio.create_task(worker.run())
+
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, task.cancel)
+
+    print(f"✅ PDF worker {worker.worker_id} running {worker.concurrency} concurrent jobs")
+    await asyncio.gather(task, return_exceptions=True)
+    shutdown_process_pool()
+    print(
+        f"🛑 PDF worker stopped: {worker.processed} jobs completed "
+        f"({worker.cache_hits} from cache), {worker.failed} failed attempts"
+    )
+    await async_engine.dispose()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=None, help="Jobs at once (default PDF_WORKER_CONCURRENCY)")
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    sys.exit(asyncio.run(run(args.concurrency)))
+
+
+if __name__ == "__main__":
+    main()
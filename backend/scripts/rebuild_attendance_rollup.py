@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Rebuild attendance_daily_rollups from attendance
+
+Run once before setting ATTENDANCE_ROLLUP_ENABLED=True (the attendance
+endpoints keep it current afterwards), or any time to repair it. Prints
+the class statistics timing from attendance and from the rollup.
+
+    python scripts/rebuild_attendance_rollup.py
+    python scripts/rebuild_attendance_rollup.py --class-id 3
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import select
+
+from app.database import AsyncSessionLocal, async_engine, engine
+from app.models import AttendanceDailyRollup, Class
+from app.services.attendance_stats import get_class_student_stats, rebuild_daily_rollup
+
+
+async def timed_stats(db, class_id: int, use_rollup: bool):
+    started = time.perf_counter()
+    stats = await get_class_student_stats(db, class_id, use_rollup=use_rollup)
+    return stats, (time.perf_counter() - started) * 1000
+
+
+async def run(class_id) -> int:
+    AttendanceDailyRollup.__table__.create(engine, checkfirst=True)
+
+    async with AsyncSessionLocal() as db:
+        started = time.perf_counter()
+        rows = await rebuild_daily_rollup(db, class_id)
+        print(f"✅ {rows} rollup rows written in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+        class_ids = [class_id] if class_id is not None else (await db.execute(select(Class.id))).scalars().all()
+        ok = True
+        for cid in class_ids:
+            live, live_ms = await timed_stats(db, cid, use_rollup=False)
+            rolled, rollup_ms = await timed_stats(db, cid, use_rollup=True)
+            same = live == rolled
+            ok &= same
+            print(
+                f"{'✅' if same else '❌'} class {cid}: {len(live)} students, "
+                f"attendance {live_ms:.1f} ms, rollup {rollup_ms:.1f} ms"
+            )
+
+    await async_engine.dispose()
+    return 0 if ok else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--class-id", type=int, help="Rebuild a single class")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args.class_id)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Rebuild the conversations summary table from messages
+
+Run once after deploying the table (new messages, reads and deletions
+keep it current afterwards), or any time to repair it. Compares, for the
+users with the most conversations, the first page of GET
+/messages/conversations from the table with the same list computed from
+messages.
+
+    python scripts/rebuild_conversations.py
+    python scripts/rebuild_conversations.py --institution-id <uuid> --users 5
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import func, or_, select
+
+from app.database import AsyncSessionLocal, async_engine, engine
+from app.models import Conversation, Message
+from app.services.conversations import live_messages, rebuild_conversations, summarize
+
+PAGE_SIZE = 20
+
+
+async def from_summary(db, user_id: str):
+    started = time.perf_counter()
+    rows = (await db.execute(
+        select(Conversation)
+        .where(Conversation.user_id == user_id)
+        .order_by(Conversation.last_message_at.desc(), Conversation.peer_id.desc())
+        .limit(PAGE_SIZE)
+    )).scalars().all()
+    page = [(row.peer_id, row.last_message_id, row.unread_count, row.message_count) for row in rows]
+    return page, (time.perf_counter() - started) * 1000
+
+
+async def from_messages(db, user_id: str):
+    started = time.perf_counter()
+    messages = (await db.execute(
+        live_messages().where(or_(Message.sender_id == user_id, Message.recipient_id == user_id))
+    )).all()
+    rows = [row for row in summarize(messages) if row["user_id"] == user_id]
+    rows.sort(key=lambda row: (row["last_message_at"], row["peer_id"]), reverse=True)
+    page = [
+        (row["peer_id"], row["last_message_id"], row["unread_count"], row["message_count"])
+        for row in rows[:PAGE_SIZE]
+    ]
+    return page, (time.perf_counter() - started) * 1000
+
+
+async def run(institution_id, users: int) -> int:
+    Conversation.__table__.create(engine, checkfirst=True)
+
+    async with AsyncSessionLocal() as db:
+        started = time.perf_counter()
+        rows = await rebuild_conversations(db, institution_id)
+        print(f"✅ {rows} conversation rows written in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+        busiest = select(Conversation.user_id).group_by(Conversation.user_id)
+        if institution_id is not None:
+            busiest = busiest.where(Conversation.institution_id == institution_id)
+        user_ids = (await db.execute(
+            busiest.order_by(func.count().desc()).limit(users)
+        )).scalars().all()
+
+        ok = True
+        for user_id in user_ids:
+            summary, summary_ms = await from_summary(db, user_id)
+            live, live_ms = await from_messages(db, user_id)
+            same = summary == live
+            ok &= same
+            print(
+                f"{'✅' if same else '❌'} user {user_id}: {len(summary)} conversations on the first page, "
+                f"messages {live_ms:.1f} ms, summary {summary_ms:.1f} ms"
+            )
+
+    await async_engine.dispose()
+    return 0 if ok else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--institution-id", help="Rebuild a single institution")
+    parser.add_argument("--users", type=int, default=3, help="Users to compare after the rebuild")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args.institution_id, args.users)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Reconcile message_counters with the messages table
+
+The API does the same every MESSAGE_COUNTERS_RECONCILE_MINUTES; run this
+from cron instead when that is disabled, or after manual data fixes.
+Prints how many counter rows were checked and repaired.
+
+    python scripts/reconcile_message_counters.py
+    python scripts/reconcile_message_counters.py --batch-size 1000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app.database import AsyncSessionLocal, async_engine, engine
+from app.models import MessageCounter
+from app.services.message_counters import reconcile_counts
+
+
+async def run(batch_size: int) -> int:
+    MessageCounter.__table__.create(engine, checkfirst=True)
+
+    async with AsyncSessionLocal() as db:
+        started = time.perf_counter()
+        checked, repaired = await reconcile_counts(db, batch_size)
+        elapsed = (time.perf_counter() - started) * 1000
+
+    print(f"{'✅' if not repaired else '🔧'} {checked} counter rows checked, {repaired} repaired in {elapsed:.1f} ms")
+    await async_engine.dispose()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500, help="Counter rows per query and commit")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args.batch_size)))
+
+
+if __name__ == "__main__":
+    main()
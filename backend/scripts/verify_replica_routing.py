@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Read-replica routing check
+
+Uses two local SQLite files as primary and replica (or any two URLs passed
+on the command line) and checks that RoutingSession:
+- sends SELECTs to the replica
+- sends writes to the primary
+- pins reads to the primary after a write in the same session
+- works the same through the async session
+
+    python scripts/verify_replica_routing.py
+    python scripts/verify_replica_routing.py --primary postgresql://... --replica postgresql://...
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+# Add the parent directory to the path so we can import from app
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import Column, String, create_engine, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+from app.database import RoutingSession, get_async_database_url
+
+
+ProbeBase = declarative_base()
+
+
+class Probe(ProbeBase):
+    """Marker row telling which database answered"""
+
+    __tablename__ = "replica_routing_probe"
+
+    id = Column(String(36), primary_key=True)
+    origin = Column(String(20), nullable=False)
+
+
+def check(label: str, condition: bool) -> bool:
+    print(f"{'✅' if condition else '❌'} {label}")
+    return condition
+
+
+def prepare(url: str, origin: str):
+    """Create the probe table and tag the database with its role"""
+    engine = create_engine(url)
+    ProbeBase.metadata.drop_all(engine)
+    ProbeBase.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(Probe.__table__.insert().values(id="marker", origin=origin))
+    return engine
+
+
+def verify_sync(primary, replica) -> bool:
+    class Routed(RoutingSession):
+        primary_bind = primary
+        replica_bind = replica
+
+    ok = True
+    with sessionmaker(class_=Routed)() as db:
+        origin = db.execute(select(Probe.origin).where(Probe.id == "marker")).scalar()
+        ok &= check("SELECT is served by the replica", origin == "replica")
+
+        db.add(Probe(id="written", origin="primary"))
+        db.commit()
+
+        origin = db.execute(select(Probe.origin).where(Probe.id == "marker")).scalar()
+        ok &= check("SELECT after a write is pinned to the primary", origin == "primary")
+        written = db.execute(select(Probe).where(Probe.id == "written")).scalar()
+        ok &= check("the session reads its own write", written is not None)
+
+    with primary.connect() as connection:
+        count = connection.execute(select(Probe).where(Probe.id == "written")).first()
+        ok &= check("the write landed on the primary", count is not None)
+    with replica.connect() as connection:
+        count = connection.execute(select(Probe).where(Probe.id == "written")).first()
+        ok &= check("the replica was not written to", count is None)
+    return ok
+
+
+async def verify_async(primary_url: str, replica_url: str) -> bool:
+    primary = create_async_engine(get_async_database_url(primary_url))
+    replica = create_async_engine(get_async_database_url(replica_url))
+
+    class Routed(RoutingSession):
+        primary_bind = primary.sync_engine
+        replica_bind = replica.sync_engine
+
+    ok = True
+    async with async_sessionmaker(sync_session_class=Routed)() as db:
+        origin = (await db.execute(select(Probe.origin).where(Probe.id == "marker"))).scalar()
+        ok &= check("async SELECT is served by the replica", origin == "replica")
+
+        db.add(Probe(id="written-async", origin="primary"))
+        await db.commit()
+
+        origin = (await db.execute(select(Probe.origin).where(Probe.id == "marker"))).scalar()
+        ok &= check("async SELECT after a write is pinned to the primary", origin == "primary")
+
+    await primary.dispose()
+    await replica.dispose()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--primary", help="Primary database URL (default: temp SQLite file)")
+    parser.add_argument("--replica", help="Replica database URL (default: temp SQLite file)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="replica-routing-")
+    primary_url = args.primary or f"sqlite:///{os.path.join(workdir, 'primary.db')}"
+    replica_url = args.replica or f"sqlite:///{os.path.join(workdir, 'replica.db')}"
+
+    print("=" * 70)
+    print(f"Primary: {primary_url}")
+    print(f"Replica: {replica_url}")
+    print("=" * 70)
+
+    primary = prepare(primary_url, "primary")
+    replica = prepare(replica_url, "replica")
+
+    ok = verify_sync(primary, replica)
+    ok &= asyncio.run(verify_async(primary_url, replica_url))
+
+    ProbeBase.metadata.drop_all(primary)
+    ProbeBase.metadata.drop_all(replica)
+
+    print("=" * 70)
+    print("✅ Routing verified" if ok else "❌ Routing check failed")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -18,6 +18,7 @@ HOST="192.168.10.178"
 PORT="8004"
 PROJECT_DIR="/home/suporte/coloboraGoogleStudio/colaboraEDUstudio1/backend"
 LOG_FILE="/tmp/colaboraedu_server.log"
+WS_PER_MESSAGE_DEFLATE="${WS_PER_MESSAGE_DEFLATE:-true}"
 
 # Check if already running
 if pgrep -f "uvicorn.*${PORT}" > /dev/null; then
@@ -53,6 +54,7 @@ nohup uvicorn app.main:app \
     --host ${HOST} \
     --port ${PORT} \
     --reload \
+    --ws-per-message-deflate ${WS_PER_MESSAGE_DEFLATE} \
     > ${LOG_FILE} 2>&1 &
 
 SERVER_PID=$!